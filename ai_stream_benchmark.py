@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Streaming benchmark for Allô IA (POST /api/ai/chat, stream=true)
+Runs against a backend wired to the local LLM mock (backend/llm_mock.py), so upstream
+latency is scripted and no tokens are spent. For each concurrency level it reports:
+- TTFB (time to the first relayed token) p50/p99
+- relay throughput: tokens/s per stream and aggregate
+- memory per open stream (backend RSS delta / peak open streams, from GET /api/metrics)
+- admission outcomes (200 vs 503 from the fair-share queue) and streams that ended in an error event
+- event-loop stall time on the backend
+
+Every request carries a unique prompt so the response cache never short-circuits it.
+
+Setup:
+  cd backend && MOCK_TOKENS=200 MOCK_TOKEN_DELAY_MS=20 uvicorn llm_mock:app --port 8020
+  cd backend && EMERGENT_API_KEY=mock AI_BASE_URL=http://localhost:8020/v1 AI_PREMIUM_ONLY=0 \\
+      AI_MAX_CONCURRENCY=1000 AI_QUEUE_MAX=2000 uvicorn server:app --port 8001
+  (ulimit -n 4096 on both sides for the 1,000-client level)
+
+Usage: BACKEND_URL=http://localhost:8001/api python ai_stream_benchmark.py [levels, e.g. 1,10,100,1000]
+"""
+
+import os
+import sys
+import time
+import uuid
+import json
+import asyncio
+import httpx
+
+BACKEND_URL = os.environ.get("BACKEND_URL", "http://localhost:8001/api")
+CONCURRENCY_LEVELS = [int(x) for x in sys.argv[1].split(",")] if len(sys.argv) > 1 else [1, 10, 100, 1000]
+STREAM_TIMEOUT_S = 120.0
+SAMPLE_INTERVAL_S = 0.25
+
+
+def pct(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def metrics(client: httpx.AsyncClient):
+    r = await client.get(f"{BACKEND_URL}/metrics", timeout=10)
+    return r.json()
+
+
+async def one_stream(client: httpx.AsyncClient, start: asyncio.Event):
+    """Returns dict(status, ttfb_ms, tokens, duration_s, error)."""
+    body = {
+        "messages": [{"role": "user", "content": f"Explique les démarches pour un extrait de naissance ({uuid.uuid4().hex})"}],
+        "stream": True,
+        "max_tokens": 400,
+    }
+    await start.wait()
+    out = {"status": None, "ttfb_ms": None, "tokens": 0, "duration_s": None, "error": False}
+    t0 = time.perf_counter()
+    try:
+        async with client.stream("POST", f"{BACKEND_URL}/ai/chat", json=body, timeout=STREAM_TIMEOUT_S) as r:
+            out["status"] = r.status_code
+            if r.status_code != 200:
+                await r.aread()
+                return out
+            async for line in r.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                data = line[6:]
+                if data == "[DONE]":
+                    break
+                event = json.loads(data)
+                if "error" in event:
+                    out["error"] = True
+                    break
+                if out["ttfb_ms"] is None:
+                    out["ttfb_ms"] = (time.perf_counter() - t0) * 1000.0
+                out["tokens"] += 1
+    except httpx.HTTPError:
+        out["error"] = True
+    out["duration_s"] = time.perf_counter() - t0
+    return out
+
+
+async def sample_memory(client: httpx.AsyncClient, stop: asyncio.Event, peak: dict):
+    while not stop.is_set():
+        try:
+            m = await metrics(client)
+            if m.get("ai_streams_open", 0) >= peak["open"]:
+                peak["open"] = m.get("ai_streams_open", 0)
+                peak["rss"] = max(peak["rss"], m.get("process_rss_bytes", 0))
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(SAMPLE_INTERVAL_S)
+
+
+async def run_level(concurrency: int):
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(limits=limits) as client, httpx.AsyncClient() as probe:
+        before = await metrics(probe)
+        peak = {"open": 0, "rss": before.get("process_rss_bytes", 0)}
+        start, stop = asyncio.Event(), asyncio.Event()
+        sampler = asyncio.create_task(sample_memory(probe, stop, peak))
+        tasks = [asyncio.create_task(one_stream(client, start)) for _ in range(concurrency)]
+        t0 = time.perf_counter()
+        start.set()
+        results = await asyncio.gather(*tasks)
+        wall = time.perf_counter() - t0
+        stop.set()
+        await sampler
+        after = await metrics(probe)
+
+    ok = [r for r in results if r["status"] == 200 and not r["error"]]
+    rejected = sum(1 for r in results if r["status"] == 503)
+    errored = sum(1 for r in results if r["error"] or (r["status"] not in (200, 503)))
+    ttfb = [r["ttfb_ms"] for r in ok if r["ttfb_ms"] is not None]
+    per_stream = [r["tokens"] / r["duration_s"] for r in ok if r["duration_s"]]
+    total_tokens = sum(r["tokens"] for r in results)
+    rss_delta = peak["rss"] - before.get("process_rss_bytes", 0)
+    per_stream_kb = rss_delta / peak["open"] / 1024 if peak["open"] else float("nan")
+    stall_ms = after.get("event_loop_stall_ms_total", 0) - before.get("event_loop_stall_ms_total", 0)
+    print(f"c={concurrency:<5} ok={len(ok)}/{len(results)} 503={rejected} err={errored}  "
+          f"ttfb p50={pct(ttfb, 0.5):7.1f}ms p99={pct(ttfb, 0.99):7.1f}ms  "
+          f"tok/s/stream p50={pct(per_stream, 0.5):6.1f}  aggregate={total_tokens / wall:8.1f} tok/s  "
+          f"mem/stream={per_stream_kb:6.1f}KB (peak open {peak['open']:.0f})  "
+          f"loop stall={stall_ms:7.1f}ms (max lag {after.get('event_loop_lag_ms_max', 0):.1f}ms)")
+
+
+async def main():
+    print("🤖 ALLÔ IA STREAMING BENCHMARK")
+    print(f"Target: {BACKEND_URL}  levels: {CONCURRENCY_LEVELS}")
+    print("=" * 70)
+    for c in CONCURRENCY_LEVELS:
+        await run_level(c)
+    async with httpx.AsyncClient() as probe:
+        final = await metrics(probe)
+    print({k: v for k, v in final.items() if k.startswith("ai_")})
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
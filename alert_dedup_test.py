@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Alert de-duplication test suite for Allô Services CI
+Checks that near-identical reports of one incident fold into a single alert:
+1) A reworded duplicate of a fresh alert is merged (reporter_count 2, no new document)
+2) A burst of concurrent identical reports leaves exactly one alert counting every reporter
+3) The same text in another city, or of another type, stays a separate alert
+4) GET /api/alerts lists each cluster once
+
+Usage: BACKEND_URL=http://localhost:8001/api python alert_dedup_test.py
+"""
+
+import os
+import sys
+import uuid
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+BACKEND_URL = os.environ.get("BACKEND_URL", "http://localhost:8001/api")
+BURST_SIZE = 10
+
+
+class AlertDedupTester:
+    def __init__(self):
+        self.base_url = BACKEND_URL
+        self.session = requests.Session()
+        self.test_results = []
+        # dedup is scoped by (type, city): a city of its own per run, so earlier runs never match
+        self.tag = f"zone{uuid.uuid4().hex[:8]}"
+        self.city = f"Abidjan-{self.tag}"
+
+    def log_test(self, test_name: str, success: bool, details: str = ""):
+        """Log test result"""
+        status = "✅ PASS" if success else "❌ FAIL"
+        print(f"{status} {test_name}")
+        if details:
+            print(f"   Details: {details}")
+        self.test_results.append({'test': test_name, 'success': success, 'details': details})
+
+    def post_alert(self, title: str, description: str, city: Optional[str] = None, type_: str = "flood") -> Dict[str, Any]:
+        response = requests.post(f"{self.base_url}/alerts", timeout=30, json={
+            "title": title, "description": description, "type": type_, "city": city or self.city,
+        })
+        response.raise_for_status()
+        return response.json()
+
+    def listed(self) -> List[Dict[str, Any]]:
+        response = self.session.get(f"{self.base_url}/alerts", params={"limit": 200}, timeout=30)
+        return [a for a in response.json() if self.tag in (a.get('title') or '')]
+
+    def test_reworded_duplicate_merges(self):
+        try:
+            first = self.post_alert(
+                f"Inondation au carrefour {self.tag} de Yopougon",
+                f"Le carrefour {self.tag} de Yopougon est complètement inondé depuis ce matin, évitez le secteur",
+            )
+            second = self.post_alert(
+                f"Inondation carrefour {self.tag} Yopougon",
+                f"Le carrefour {self.tag} de Yopougon est complètement inondé depuis ce matin, évitez la zone",
+            )
+            ok = second.get('merged') is True and second.get('id') == first.get('id') and second.get('reporter_count') == 2
+            self.log_test("Reworded duplicate merged", ok, f"first={first.get('id')} second={second.get('id')} count={second.get('reporter_count')}")
+        except Exception as e:
+            self.log_test("Reworded duplicate merged", False, f"Exception: {str(e)}")
+
+    def test_concurrent_burst_is_one_alert(self):
+        try:
+            title = f"Accident grave sur le pont {self.tag} à Cocody"
+            description = f"Collision entre deux camions sur le pont {self.tag}, circulation bloquée dans les deux sens"
+            with ThreadPoolExecutor(max_workers=BURST_SIZE) as pool:
+                results = list(pool.map(lambda _: self.post_alert(title, description, type_="accident"), range(BURST_SIZE)))
+            ids = {r.get('id') for r in results}
+            counts = [r.get('reporter_count') or 0 for r in results]
+            self.log_test("Concurrent burst folds into one alert", len(ids) == 1 and max(counts) == BURST_SIZE,
+                          f"{len(ids)} alert id(s), highest reporter_count {max(counts)} of {BURST_SIZE}")
+        except Exception as e:
+            self.log_test("Concurrent burst folds into one alert", False, f"Exception: {str(e)}")
+
+    def test_other_scope_stays_separate(self):
+        try:
+            title = f"Coupure d'eau quartier {self.tag}"
+            description = f"Plus d'eau courante dans le quartier {self.tag} depuis hier soir"
+            base = self.post_alert(title, description, type_="other")
+            other_city = self.post_alert(title, description, city=f"Bouaké-{self.tag}", type_="other")
+            other_type = self.post_alert(title, description, type_="fire")
+            ids = {base.get('id'), other_city.get('id'), other_type.get('id')}
+            self.log_test("Other city or type stays separate", len(ids) == 3 and not other_city.get('merged') and not other_type.get('merged'),
+                          f"{len(ids)} distinct alert(s)")
+        except Exception as e:
+            self.log_test("Other city or type stays separate", False, f"Exception: {str(e)}")
+
+    def test_feed_lists_clusters_once(self):
+        try:
+            alerts = self.listed()
+            # one flood cluster, one accident cluster and the three other/fire alerts
+            self.log_test("Feed lists each cluster once", len(alerts) == 5, f"{len(alerts)} alert(s) tagged {self.tag}")
+        except Exception as e:
+            self.log_test("Feed lists each cluster once", False, f"Exception: {str(e)}")
+
+    def run_all_tests(self):
+        print("🚨 ALERT DE-DUPLICATION TESTS")
+        print(f"Base URL: {self.base_url}")
+        print("=" * 60)
+        self.test_reworded_duplicate_merges()
+        self.test_concurrent_burst_is_one_alert()
+        self.test_other_scope_stays_separate()
+        self.test_feed_lists_clusters_once()
+
+        passed = sum(1 for result in self.test_results if result['success'])
+        total = len(self.test_results)
+        print("\n" + "=" * 60)
+        print(f"Passed: {passed}/{total}")
+        for result in self.test_results:
+            if not result['success']:
+                print(f"  - {result['test']}: {result['details']}")
+        return passed == total
+
+
+if __name__ == "__main__":
+    tester = AlertDedupTester()
+    success = tester.run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Auth & session test suite for Allô Services CI
+Checks the account and session rules end to end:
+1) POST /api/auth/register issues a token pair for a new phone, 409 for a known one; a retry
+   with the same Idempotency-Key gets the same account back
+2) POST /api/auth/refresh rotates the pair; a reused refresh token revokes the session
+3) GET /api/users/lookup needs a session (or the admin key) and only finds your own phone
+4) GET /api/subscriptions/check rejects a token for another user_id
+5) POST /api/auth/otp + /api/auth/login sign a known phone back in; a code works once
+
+The login checks need the code, so the backend must run in SMS stub mode with OTP_DEBUG=true.
+
+Usage: BACKEND_URL=http://localhost:8001/api [ADMIN_API_KEY=...] python auth_session_test.py
+"""
+
+import os
+import sys
+import random
+import requests
+from typing import Dict, Any, Optional
+
+BACKEND_URL = os.environ.get("BACKEND_URL", "http://localhost:8001/api")
+ADMIN_API_KEY = os.environ.get("ADMIN_API_KEY")
+
+
+def random_phone() -> str:
+    return "+225 07 " + " ".join(f"{random.randint(0, 99):02d}" for _ in range(4))
+
+
+class AuthSessionTester:
+    def __init__(self):
+        self.base_url = BACKEND_URL
+        self.session = requests.Session()
+        self.test_results = []
+        self.phone = random_phone()
+        self.registration_key = f"test-{random.getrandbits(64):016x}"
+        self.user: Optional[Dict[str, Any]] = None
+        self.other: Optional[Dict[str, Any]] = None
+
+    def log_test(self, test_name: str, success: bool, details: str = ""):
+        """Log test result"""
+        status = "✅ PASS" if success else "❌ FAIL"
+        print(f"{status} {test_name}")
+        if details:
+            print(f"   Details: {details}")
+        self.test_results.append({'test': test_name, 'success': success, 'details': details})
+
+    def make_request(self, method: str, endpoint: str, token: Optional[str] = None, **kwargs) -> requests.Response:
+        """Make HTTP request, with a bearer token when given"""
+        headers = kwargs.pop('headers', {})
+        if token:
+            headers['Authorization'] = f"Bearer {token}"
+        return self.session.request(method, f"{self.base_url}{endpoint}", headers=headers, timeout=30, **kwargs)
+
+    def register(self, phone: str, key: Optional[str] = None) -> requests.Response:
+        headers = {'Idempotency-Key': key} if key else {}
+        return self.make_request('POST', '/auth/register', headers=headers, json={
+            "first_name": "Awa", "last_name": "Traoré", "phone": phone, "preferred_lang": "fr", "city": "Abidjan",
+        })
+
+    def test_register_new_phone(self):
+        """A new phone gets an account and a token pair"""
+        try:
+            response = self.register(self.phone, self.registration_key)
+            data = response.json() if response.status_code == 200 else {}
+            if data.get('id') and data.get('access_token') and data.get('refresh_token'):
+                self.user = data
+                self.log_test("Register new phone", True, f"User {data['id']} with a token pair")
+            else:
+                self.log_test("Register new phone", False, f"Status {response.status_code}: {response.text}")
+        except Exception as e:
+            self.log_test("Register new phone", False, f"Exception: {str(e)}")
+
+    def test_register_known_phone(self):
+        """Registering a known phone again is a 409 and returns no tokens"""
+        try:
+            # same number, typed differently: still the same E.164 phone
+            response = self.register(self.phone.replace(' ', ''))
+            ok = response.status_code == 409 and 'access_token' not in response.text
+            self.log_test("Register known phone → 409", ok, f"Status {response.status_code}: {response.text[:200]}")
+        except Exception as e:
+            self.log_test("Register known phone → 409", False, f"Exception: {str(e)}")
+
+    def test_register_retry_same_key(self):
+        """A retried registration (same Idempotency-Key) returns the same account with a fresh pair"""
+        if not self.user:
+            self.log_test("Retried registration → same user", False, "No registered user")
+            return
+        try:
+            response = self.register(self.phone, self.registration_key)
+            data = response.json() if response.status_code == 200 else {}
+            self.log_test("Retried registration → same user", data.get('id') == self.user['id'] and bool(data.get('access_token')),
+                          f"Status {response.status_code}: {response.text[:200]}")
+            other = self.register(self.phone, self.registration_key + "x")
+            self.log_test("Registration with another key → 409", other.status_code == 409, f"Status {other.status_code}")
+        except Exception as e:
+            self.log_test("Retried registration → same user", False, f"Exception: {str(e)}")
+
+    def test_refresh_rotation(self):
+        """A refresh token works once; presenting it again revokes the whole session"""
+        if not self.user:
+            self.log_test("Refresh rotation", False, "No registered user")
+            return
+        try:
+            first = self.user['refresh_token']
+            response = self.make_request('POST', '/auth/refresh', json={"refresh_token": first})
+            if response.status_code != 200 or not response.json().get('refresh_token'):
+                self.log_test("Refresh rotation", False, f"Status {response.status_code}: {response.text}")
+                return
+            second = response.json()['refresh_token']
+            self.user['access_token'] = response.json()['access_token']
+            self.log_test("Refresh rotation", second != first, "New pair issued")
+
+            reuse = self.make_request('POST', '/auth/refresh', json={"refresh_token": first})
+            self.log_test("Refresh token reuse → 401", reuse.status_code == 401, f"Status {reuse.status_code}: {reuse.text}")
+
+            # the reuse revoked every live refresh token, including the one just issued
+            revoked = self.make_request('POST', '/auth/refresh', json={"refresh_token": second})
+            self.log_test("Session revoked after reuse", revoked.status_code == 401, f"Status {revoked.status_code}: {revoked.text}")
+        except Exception as e:
+            self.log_test("Refresh rotation", False, f"Exception: {str(e)}")
+
+    def test_lookup_requires_session(self):
+        """/users/lookup without a session or admin key is a 401"""
+        try:
+            response = self.make_request('GET', '/users/lookup', params={"phone": self.phone})
+            self.log_test("Lookup without session → 401", response.status_code == 401, f"Status {response.status_code}")
+        except Exception as e:
+            self.log_test("Lookup without session → 401", False, f"Exception: {str(e)}")
+
+    def test_lookup_own_and_other_phone(self):
+        """A signed-in user finds their own phone (minimal fields) but not somebody else's"""
+        if not self.user:
+            self.log_test("Lookup own phone", False, "No registered user")
+            return
+        try:
+            response = self.make_request('GET', '/users/lookup', token=self.user['access_token'], params={"phone": self.phone})
+            data = response.json() if response.status_code == 200 else {}
+            extra = set(data) - {'id', 'first_name', 'last_name', 'phone', 'city', 'created_at'}
+            self.log_test("Lookup own phone", data.get('id') == self.user['id'] and not extra,
+                          f"Status {response.status_code}, unexpected fields: {sorted(extra)}")
+
+            other = self.register(random_phone())
+            if other.status_code != 200:
+                self.log_test("Lookup other phone → 404", False, f"Could not register second user: {other.text}")
+                return
+            self.other = other.json()
+            response = self.make_request('GET', '/users/lookup', token=self.user['access_token'], params={"phone": self.other['phone']})
+            self.log_test("Lookup other phone → 404", response.status_code == 404, f"Status {response.status_code}")
+
+            if ADMIN_API_KEY:
+                response = self.make_request('GET', '/users/lookup', headers={'X-Admin-Key': ADMIN_API_KEY}, params={"phone": self.other['phone']})
+                self.log_test("Admin lookup of any phone", response.status_code == 200, f"Status {response.status_code}")
+        except Exception as e:
+            self.log_test("Lookup own phone", False, f"Exception: {str(e)}")
+
+    def test_subscription_check_token_mismatch(self):
+        """A token for one user cannot read another user's entitlement"""
+        if not (self.user and self.other):
+            self.log_test("Subscription check with foreign user_id → 403", False, "Users not available")
+            return
+        try:
+            response = self.make_request('GET', '/subscriptions/check', token=self.user['access_token'], params={"user_id": self.other['id']})
+            self.log_test("Subscription check with foreign user_id → 403", response.status_code == 403, f"Status {response.status_code}")
+        except Exception as e:
+            self.log_test("Subscription check with foreign user_id → 403", False, f"Exception: {str(e)}")
+
+    def test_login_with_sms_code(self):
+        """After the session is revoked, the phone's owner signs back in with an SMS code"""
+        if not self.user:
+            self.log_test("Login with SMS code", False, "No registered user")
+            return
+        try:
+            response = self.make_request('POST', '/auth/otp', json={"phone": self.phone})
+            code = response.json().get('debug_code') if response.status_code == 200 else None
+            if not code:
+                self.log_test("Login with SMS code", False, f"No debug code (OTP_DEBUG off or SMS configured?): {response.status_code} {response.text}")
+                return
+            wrong = self.make_request('POST', '/auth/login', json={"phone": self.phone, "code": "999999" if code != "999999" else "000000"})
+            self.log_test("Login with a wrong code → 401", wrong.status_code == 401, f"Status {wrong.status_code}")
+            response = self.make_request('POST', '/auth/login', json={"phone": self.phone, "code": code})
+            data = response.json() if response.status_code == 200 else {}
+            self.log_test("Login with SMS code", data.get('id') == self.user['id'] and bool(data.get('access_token')),
+                          f"Status {response.status_code}: {response.text[:200]}")
+            reuse = self.make_request('POST', '/auth/login', json={"phone": self.phone, "code": code})
+            self.log_test("SMS code works once", reuse.status_code == 401, f"Status {reuse.status_code}")
+        except Exception as e:
+            self.log_test("Login with SMS code", False, f"Exception: {str(e)}")
+
+    def run_all_tests(self):
+        print("🔐 AUTH & SESSION TESTS")
+        print(f"Base URL: {self.base_url}")
+        print("=" * 60)
+        self.test_register_new_phone()
+        self.test_register_known_phone()
+        self.test_register_retry_same_key()
+        self.test_lookup_requires_session()
+        self.test_lookup_own_and_other_phone()
+        self.test_subscription_check_token_mismatch()
+        self.test_refresh_rotation()
+        self.test_login_with_sms_code()
+
+        passed = sum(1 for result in self.test_results if result['success'])
+        total = len(self.test_results)
+        print("\n" + "=" * 60)
+        print(f"Passed: {passed}/{total}")
+        for result in self.test_results:
+            if not result['success']:
+                print(f"  - {result['test']}: {result['details']}")
+        return passed == total
+
+
+if __name__ == "__main__":
+    tester = AuthSessionTester()
+    success = tester.run_all_tests()
+    sys.exit(0 if success else 1)
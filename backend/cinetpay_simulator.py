@@ -0,0 +1,165 @@
+"""
+Local CinetPay stand-in for load tests and development.
+
+Run:  uvicorn cinetpay_simulator:app --port 8010
+Then point the backend at it:
+    CINETPAY_MODE=live CINETPAY_BASE_URL=http://localhost:8010
+    CINETPAY_API_KEY=sim CINETPAY_SITE_ID=sim CINETPAY_SECRET_KEY=sim-secret
+    BACKEND_PUBLIC_BASE_URL=http://localhost:8001
+
+Config (env):
+    SIM_LATENCY_MS          mean response latency (default 150)
+    SIM_JITTER_MS           uniform +/- jitter around the mean (default 50)
+    SIM_ACCEPT_RATE         share of payments that end ACCEPTED, the rest REFUSED (default 0.9)
+    SIM_ERROR_RATE          share of API calls answered with HTTP 500 (default 0)
+    SIM_TIMEOUT_RATE        share of API calls that hang for SIM_TIMEOUT_S (default 0)
+    SIM_TIMEOUT_S           hang duration for the above (default 60)
+    SIM_SECRET_KEY          secret used to sign notifications; must match CINETPAY_SECRET_KEY (default sim-secret)
+    SIM_WEBHOOK_DELAY_MS    delay between payment init and the notification (default 500, <0 disables)
+    SIM_WEBHOOK_REPEAT      how many times each notification is sent, to mimic provider retries (default 1)
+"""
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from datetime import datetime
+import os
+import random
+import asyncio
+import hmac
+import hashlib
+import uuid
+import httpx
+
+SIM_LATENCY_MS = float(os.environ.get('SIM_LATENCY_MS', '150'))
+SIM_JITTER_MS = float(os.environ.get('SIM_JITTER_MS', '50'))
+SIM_ACCEPT_RATE = float(os.environ.get('SIM_ACCEPT_RATE', '0.9'))
+SIM_ERROR_RATE = float(os.environ.get('SIM_ERROR_RATE', '0'))
+SIM_TIMEOUT_RATE = float(os.environ.get('SIM_TIMEOUT_RATE', '0'))
+SIM_TIMEOUT_S = float(os.environ.get('SIM_TIMEOUT_S', '60'))
+SIM_SECRET_KEY = os.environ.get('SIM_SECRET_KEY', 'sim-secret')
+SIM_WEBHOOK_DELAY_MS = float(os.environ.get('SIM_WEBHOOK_DELAY_MS', '500'))
+SIM_WEBHOOK_REPEAT = int(os.environ.get('SIM_WEBHOOK_REPEAT', '1'))
+
+# Same order as CINETPAY_TOKEN_FIELDS in server.py
+TOKEN_FIELDS = (
+    'cpm_site_id', 'cpm_trans_id', 'cpm_trans_date', 'cpm_amount', 'cpm_currency', 'signature',
+    'payment_method', 'cel_phone_num', 'cpm_phone_prefixe', 'cpm_language', 'cpm_version',
+    'cpm_payment_config', 'cpm_page_action', 'cpm_custom', 'cpm_designation', 'cpm_error_message',
+)
+
+app = FastAPI(title="CinetPay simulator")
+
+# transaction_id -> {amount, currency, status}
+transactions = {}
+stats = {'init': 0, 'check': 0, 'errors': 0, 'timeouts': 0, 'webhooks_sent': 0, 'webhooks_failed': 0}
+callback_client = httpx.AsyncClient(timeout=httpx.Timeout(30.0, connect=5.0))
+pending_callbacks = set()
+
+async def _latency():
+    delay = SIM_LATENCY_MS + random.uniform(-SIM_JITTER_MS, SIM_JITTER_MS)
+    await asyncio.sleep(max(0.0, delay) / 1000.0)
+
+async def _injected_fault():
+    """Returns an error response (or hangs) for the configured share of calls."""
+    roll = random.random()
+    if roll < SIM_TIMEOUT_RATE:
+        stats['timeouts'] += 1
+        await asyncio.sleep(SIM_TIMEOUT_S)
+    elif roll < SIM_TIMEOUT_RATE + SIM_ERROR_RATE:
+        stats['errors'] += 1
+        return JSONResponse(status_code=500, content={"code": "500", "message": "INTERNAL_ERROR"})
+    return None
+
+def sign(fields):
+    data = ''.join(str(fields.get(k, '')) for k in TOKEN_FIELDS)
+    return hmac.new(SIM_SECRET_KEY.encode(), data.encode(), hashlib.sha256).hexdigest()
+
+async def _notify(notify_url, fields):
+    await asyncio.sleep(SIM_WEBHOOK_DELAY_MS / 1000.0)
+    headers = {'x-token': sign(fields)}
+    for _ in range(max(1, SIM_WEBHOOK_REPEAT)):
+        try:
+            r = await callback_client.post(notify_url, data=fields, headers=headers)
+            stats['webhooks_sent'] += 1
+            if r.status_code != 200:
+                stats['webhooks_failed'] += 1
+        except httpx.HTTPError:
+            stats['webhooks_failed'] += 1
+
+@app.post('/v2/payment')
+async def payment_init(request: Request):
+    body = await request.json()
+    await _latency()
+    fault = await _injected_fault()
+    if fault is not None:
+        return fault
+    stats['init'] += 1
+    if not body.get('transaction_id') or not body.get('amount'):
+        return {"code": "608", "message": "MINIMUM_REQUIRED_FIELDS", "data": {}}
+    token = uuid.uuid4().hex
+    transactions[body['transaction_id']] = {
+        "amount": str(body['amount']),
+        "currency": body.get('currency', 'XOF'),
+        "status": "ACCEPTED" if random.random() < SIM_ACCEPT_RATE else "REFUSED",
+    }
+    if body.get('notify_url') and SIM_WEBHOOK_DELAY_MS >= 0:
+        fields = {
+            'cpm_site_id': body.get('site_id', ''),
+            'cpm_trans_id': body['transaction_id'],
+            'cpm_trans_date': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+            'cpm_amount': str(body['amount']),
+            'cpm_currency': body.get('currency', 'XOF'),
+            'signature': token,
+            'payment_method': 'OMCIV2',
+            'cel_phone_num': '0700000000',
+            'cpm_phone_prefixe': '225',
+            'cpm_language': 'fr',
+            'cpm_version': 'V4',
+            'cpm_payment_config': 'SINGLE',
+            'cpm_page_action': 'PAYMENT',
+            'cpm_custom': '',
+            'cpm_designation': body.get('description', ''),
+            'cpm_error_message': '',
+        }
+        task = asyncio.create_task(_notify(body['notify_url'], fields))
+        pending_callbacks.add(task)
+        task.add_done_callback(pending_callbacks.discard)
+    return {
+        "code": "201",
+        "message": "CREATED",
+        "data": {
+            "payment_token": token,
+            "payment_url": f"http://localhost/sim/checkout/{token}",
+        },
+    }
+
+@app.post('/v2/payment/check')
+async def payment_check(request: Request):
+    body = await request.json()
+    await _latency()
+    fault = await _injected_fault()
+    if fault is not None:
+        return fault
+    stats['check'] += 1
+    tr = transactions.get(body.get('transaction_id'))
+    if not tr:
+        return {"code": "627", "message": "TRANSACTION_NOT_FOUND", "data": {}}
+    return {
+        "code": "00" if tr['status'] == 'ACCEPTED' else "600",
+        "message": "SUCCES" if tr['status'] == 'ACCEPTED' else "PAYMENT_FAILED",
+        "data": {
+            "amount": tr['amount'],
+            "currency": tr['currency'],
+            "status": tr['status'],
+            "payment_method": "OMCIV2",
+            "operator_id": uuid.uuid4().hex[:12],
+            "payment_date": "",
+        },
+    }
+
+@app.get('/sim/stats')
+async def sim_stats():
+    return {**stats, 'pending_callbacks': len(pending_callbacks)}
+
+@app.on_event('shutdown')
+async def on_shutdown():
+    await callback_client.aclose()
@@ -0,0 +1,64 @@
+"""
+Local stand-in for Expo's push API, for exercising POST /api/notifications/send.
+
+Run:  uvicorn expo_push_stub:app --port 8030
+Then point the backend at it:
+    EXPO_PUSH_URL=http://localhost:8030/--/api/v2/push/send
+
+Config (env):
+    STUB_LATENCY_MS          mean response latency (default 100)
+    STUB_JITTER_MS           uniform +/- jitter around the mean (default 30)
+    STUB_ERROR_RATE          share of requests answered with HTTP 500 (default 0)
+    STUB_RATE_LIMIT_RATE     share of requests answered with HTTP 429 (default 0)
+    STUB_INVALID_RATE        share of tokens answered with DeviceNotRegistered (default 0)
+"""
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+import os
+import random
+import asyncio
+import uuid
+
+STUB_LATENCY_MS = float(os.environ.get('STUB_LATENCY_MS', '100'))
+STUB_JITTER_MS = float(os.environ.get('STUB_JITTER_MS', '30'))
+STUB_ERROR_RATE = float(os.environ.get('STUB_ERROR_RATE', '0'))
+STUB_RATE_LIMIT_RATE = float(os.environ.get('STUB_RATE_LIMIT_RATE', '0'))
+STUB_INVALID_RATE = float(os.environ.get('STUB_INVALID_RATE', '0'))
+
+app = FastAPI(title="Expo push stub")
+stats = {'requests': 0, 'messages': 0, 'in_flight': 0, 'max_in_flight': 0, 'errors_injected': 0, 'oversized': 0}
+
+@app.post('/--/api/v2/push/send')
+async def push_send(request: Request):
+    body = await request.json()
+    messages = body if isinstance(body, list) else [body]
+    stats['requests'] += 1
+    stats['in_flight'] += 1
+    stats['max_in_flight'] = max(stats['max_in_flight'], stats['in_flight'])
+    try:
+        await asyncio.sleep(max(0.0, STUB_LATENCY_MS + random.uniform(-STUB_JITTER_MS, STUB_JITTER_MS)) / 1000.0)
+        roll = random.random()
+        if roll < STUB_ERROR_RATE:
+            stats['errors_injected'] += 1
+            return JSONResponse(status_code=500, content={"errors": [{"code": "INTERNAL_SERVER_ERROR", "message": "stub error"}]})
+        if roll < STUB_ERROR_RATE + STUB_RATE_LIMIT_RATE:
+            stats['errors_injected'] += 1
+            return JSONResponse(status_code=429, content={"errors": [{"code": "TOO_MANY_REQUESTS", "message": "stub rate limit"}]})
+        if len(messages) > 100:
+            stats['oversized'] += 1
+            return JSONResponse(status_code=400, content={"errors": [{"code": "PUSH_TOO_MANY_NOTIFICATIONS", "message": "max 100 per request"}]})
+        stats['messages'] += len(messages)
+        tickets = []
+        for m in messages:
+            if random.random() < STUB_INVALID_RATE:
+                tickets.append({"status": "error", "message": f"{m.get('to')} is not a registered push notification recipient",
+                                "details": {"error": "DeviceNotRegistered"}})
+            else:
+                tickets.append({"status": "ok", "id": str(uuid.uuid4())})
+        return {"data": tickets}
+    finally:
+        stats['in_flight'] -= 1
+
+@app.get('/stub/stats')
+async def stub_stats():
+    return stats
@@ -0,0 +1,113 @@
+"""
+Local OpenAI-compatible upstream for exercising /api/ai/chat without spending tokens.
+
+Run:  uvicorn llm_mock:app --port 8020
+Then point the backend at it:
+    EMERGENT_API_KEY=mock AI_BASE_URL=http://localhost:8020/v1
+
+Config (env):
+    MOCK_TOKENS              tokens per answer (default 200)
+    MOCK_TTFT_MS             delay before the first token (default 200)
+    MOCK_TOKEN_DELAY_MS      delay between tokens (default 20)
+    MOCK_ERROR_RATE          share of requests answered with HTTP 500 (default 0)
+    MOCK_RATE_LIMIT_RATE     share of requests answered with HTTP 429 (default 0)
+    MOCK_MIDSTREAM_FAIL_RATE share of streams cut off halfway without [DONE] (default 0)
+    MOCK_SCRIPT              optional JSON file with a list of token strings to replay
+"""
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import os
+import json
+import time
+import random
+import asyncio
+import uuid
+
+MOCK_TOKENS = int(os.environ.get('MOCK_TOKENS', '200'))
+MOCK_TTFT_MS = float(os.environ.get('MOCK_TTFT_MS', '200'))
+MOCK_TOKEN_DELAY_MS = float(os.environ.get('MOCK_TOKEN_DELAY_MS', '20'))
+MOCK_ERROR_RATE = float(os.environ.get('MOCK_ERROR_RATE', '0'))
+MOCK_RATE_LIMIT_RATE = float(os.environ.get('MOCK_RATE_LIMIT_RATE', '0'))
+MOCK_MIDSTREAM_FAIL_RATE = float(os.environ.get('MOCK_MIDSTREAM_FAIL_RATE', '0'))
+MOCK_SCRIPT = os.environ.get('MOCK_SCRIPT')
+
+DEFAULT_WORDS = (
+    "Abidjan est la capitale économique de la Côte d'Ivoire . Pour vos démarches , "
+    "présentez-vous avec une pièce d'identité et un justificatif de domicile . "
+).split()
+
+if MOCK_SCRIPT:
+    with open(MOCK_SCRIPT, encoding='utf-8') as f:
+        SCRIPT = json.load(f)
+else:
+    SCRIPT = [(w + ' ') for w in (DEFAULT_WORDS * (MOCK_TOKENS // len(DEFAULT_WORDS) + 1))[:MOCK_TOKENS]]
+
+app = FastAPI(title="LLM mock")
+stats = {'requests': 0, 'streams_open': 0, 'streams_completed': 0, 'streams_cancelled': 0, 'errors_injected': 0}
+
+def _chunk(cid, model, delta, finish=None):
+    return "data: " + json.dumps({
+        "id": cid, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+    }, ensure_ascii=False) + "\n\n"
+
+def _answer(body):
+    """Scripted tokens, cut to max_tokens like a real upstream (finish_reason 'length')."""
+    limit = body.get('max_tokens')
+    if limit and limit < len(SCRIPT):
+        return SCRIPT[:limit], 'length'
+    return SCRIPT, 'stop'
+
+async def _stream(cid, model, tokens, finish, fail_midway):
+    stats['streams_open'] += 1
+    try:
+        await asyncio.sleep(MOCK_TTFT_MS / 1000.0)
+        yield _chunk(cid, model, {"role": "assistant", "content": ""})
+        for i, token in enumerate(tokens):
+            if fail_midway and i == len(tokens) // 2:
+                return
+            if i:
+                await asyncio.sleep(MOCK_TOKEN_DELAY_MS / 1000.0)
+            yield _chunk(cid, model, {"content": token})
+        yield _chunk(cid, model, {}, finish=finish)
+        yield "data: [DONE]\n\n"
+        stats['streams_completed'] += 1
+    except asyncio.CancelledError:
+        stats['streams_cancelled'] += 1
+        raise
+    finally:
+        stats['streams_open'] -= 1
+
+@app.post('/v1/chat/completions')
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats['requests'] += 1
+    model = body.get('model', 'mock')
+    roll = random.random()
+    if roll < MOCK_ERROR_RATE:
+        stats['errors_injected'] += 1
+        return JSONResponse(status_code=500, content={"error": {"message": "mock upstream error", "type": "server_error"}})
+    if roll < MOCK_ERROR_RATE + MOCK_RATE_LIMIT_RATE:
+        stats['errors_injected'] += 1
+        return JSONResponse(status_code=429, content={"error": {"message": "mock rate limit", "type": "rate_limit_error"}})
+
+    cid = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    tokens, finish = _answer(body)
+    if body.get('stream'):
+        fail_midway = random.random() < MOCK_MIDSTREAM_FAIL_RATE
+        return StreamingResponse(_stream(cid, model, tokens, finish, fail_midway), media_type='text/event-stream')
+
+    await asyncio.sleep((MOCK_TTFT_MS + MOCK_TOKEN_DELAY_MS * len(tokens)) / 1000.0)
+    return {
+        "id": cid, "object": "chat.completion", "created": int(time.time()), "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": ''.join(tokens)}, "finish_reason": finish}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+    }
+
+@app.get('/v1/models')
+async def models():
+    return {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]}
+
+@app.get('/mock/stats')
+async def mock_stats():
+    return stats
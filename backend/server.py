@@ -1,29 +1,67 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Query, Depends, Request, Form, Path
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Depends, Request, Form, Path, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response, StreamingResponse
-from pydantic import BaseModel, Field, EmailStr
+from fastapi.responses import Response, StreamingResponse, JSONResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, Field, EmailStr, field_validator
 from typing import List, Optional, Literal, Dict, Any, AsyncGenerator
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from contextlib import aclosing
+from collections import defaultdict, OrderedDict
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
-from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import DuplicateKeyError, BulkWriteError, OperationFailure
+from bson import ObjectId, Binary
+from openai import AsyncOpenAI
+from PIL import Image, ImageOps, UnidentifiedImageError
 import os
 import uuid
-import requests
+import random
+import httpx
 import hmac
 import hashlib
 import logging
 import asyncio
+import heapq
+import itertools
+import io
+import gzip
+import base64
+import binascii
 import json
+import math
+import re
+import resource
+import secrets
+import time
+import unicodedata
+import zlib
+import numpy as np
+import pandas as pd
+import jwt
 
 # Load env
 ROOT_DIR = os.path.dirname(__file__)
 load_dotenv(os.path.join(ROOT_DIR, '.env'))
 
+# In-process counters, exposed on /api/metrics
+metrics: Dict[str, float] = defaultdict(float)
+
+class MongoOpCounter(monitoring.CommandListener):
+    def started(self, event):
+        metrics['mongo_ops_total'] += 1
+        metrics[f'mongo_ops.{event.command_name}'] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        metrics['mongo_errors_total'] += 1
+
 # MongoDB connection
 MONGO_URL = os.environ['MONGO_URL']
 DB_NAME = os.environ.get('DB_NAME', 'test_database')
-client = AsyncIOMotorClient(MONGO_URL)
+client = AsyncIOMotorClient(MONGO_URL, event_listeners=[MongoOpCounter()])
 db = client[DB_NAME]
 
 # CinetPay config
@@ -32,12 +70,101 @@ CINETPAY_API_KEY = os.environ.get('CINETPAY_API_KEY')
 CINETPAY_SECRET_KEY = os.environ.get('CINETPAY_SECRET_KEY')
 CINETPAY_MODE = os.environ.get('CINETPAY_MODE', 'stub')  # 'live' or 'stub'
 BACKEND_PUBLIC_BASE_URL = os.environ.get('BACKEND_PUBLIC_BASE_URL', '')
+CINETPAY_BASE_URL = os.environ.get('CINETPAY_BASE_URL', 'https://api-checkout.cinetpay.com')
+CINETPAY_CONNECT_TIMEOUT = float(os.environ.get('CINETPAY_CONNECT_TIMEOUT', '3'))
+CINETPAY_READ_TIMEOUT = float(os.environ.get('CINETPAY_READ_TIMEOUT', '15'))
+CINETPAY_MAX_RETRIES = int(os.environ.get('CINETPAY_MAX_RETRIES', '2'))
+CINETPAY_BREAKER_THRESHOLD = int(os.environ.get('CINETPAY_BREAKER_THRESHOLD', '5'))
+CINETPAY_BREAKER_COOLDOWN = float(os.environ.get('CINETPAY_BREAKER_COOLDOWN', '30'))
+SUBSCRIPTION_DAYS = int(os.environ.get('SUBSCRIPTION_DAYS', '365'))
+SUBSCRIPTION_PRICE_FCFA = int(os.environ.get('SUBSCRIPTION_PRICE_FCFA', '1200'))
+ENTITLEMENT_CACHE_TTL = float(os.environ.get('ENTITLEMENT_CACHE_TTL', '300'))
+ENTITLEMENT_CACHE_SIZE = int(os.environ.get('ENTITLEMENT_CACHE_SIZE', '50000'))
+RECONCILE_INTERVAL_S = float(os.environ.get('RECONCILE_INTERVAL_S', '300'))
+RECONCILE_MIN_AGE_MIN = int(os.environ.get('RECONCILE_MIN_AGE_MIN', '10'))
+RECONCILE_BATCH_SIZE = int(os.environ.get('RECONCILE_BATCH_SIZE', '100'))
+RECONCILE_CONCURRENCY = int(os.environ.get('RECONCILE_CONCURRENCY', '8'))
+LOOP_MONITOR_INTERVAL_S = float(os.environ.get('LOOP_MONITOR_INTERVAL_S', '0.1'))
+LOOP_STALL_THRESHOLD_MS = float(os.environ.get('LOOP_STALL_THRESHOLD_MS', '50'))
 
 # Emergent LLM config
 EMERGENT_API_KEY = os.environ.get('EMERGENT_API_KEY')
 OPENAI_MODEL = os.environ.get('OPENAI_MODEL', 'gpt-4o-mini')
 TEMPERATURE_DEFAULT = float(os.environ.get('AI_TEMPERATURE', '0.5'))
 MAX_TOKENS_DEFAULT = int(os.environ.get('AI_MAX_TOKENS', '1200'))
+AI_BASE_URL = os.environ.get('AI_BASE_URL') or None
+AI_PREMIUM_ONLY = os.environ.get('AI_PREMIUM_ONLY', 'false').lower() == 'true'
+AI_CACHE_TTL = float(os.environ.get('AI_CACHE_TTL', '86400'))
+AI_CACHE_SIZE = int(os.environ.get('AI_CACHE_SIZE', '2000'))
+AI_CACHE_PERSIST = os.environ.get('AI_CACHE_PERSIST', 'false').lower() == 'true'
+AI_CONTEXT_TOKEN_BUDGET = int(os.environ.get('AI_CONTEXT_TOKEN_BUDGET', '3000'))
+AI_SUMMARY_MAX_TOKENS = int(os.environ.get('AI_SUMMARY_MAX_TOKENS', '300'))
+AI_MAX_CONCURRENCY = int(os.environ.get('AI_MAX_CONCURRENCY', '32'))
+AI_QUEUE_MAX = int(os.environ.get('AI_QUEUE_MAX', '500'))
+AI_QUEUE_TIMEOUT_S = float(os.environ.get('AI_QUEUE_TIMEOUT_S', '15'))
+AI_SUMMARY_CONCURRENCY = int(os.environ.get('AI_SUMMARY_CONCURRENCY', '4'))
+AI_RETRIEVAL_TOP_K = int(os.environ.get('AI_RETRIEVAL_TOP_K', '5'))
+AI_RETRIEVAL_MAX_AGE_S = float(os.environ.get('AI_RETRIEVAL_MAX_AGE_S', '600'))
+AI_SYSTEM_PROMPT = os.environ.get('AI_SYSTEM_PROMPT', (
+    "Tu es Allô IA, l'assistant d'Allô Services CI. Réponds en français clair et concis, "
+    "avec des informations adaptées à la Côte d'Ivoire (démarches, santé, emploi, services publics). "
+    "Si tu n'es pas sûr d'une information (numéro, adresse, horaire), dis-le."
+))
+
+# Alert de-duplication config
+ALERT_DEDUP_WINDOW_MIN = int(os.environ.get('ALERT_DEDUP_WINDOW_MIN', '60'))
+ALERT_DEDUP_THRESHOLD = float(os.environ.get('ALERT_DEDUP_THRESHOLD', '0.5'))
+ALERT_DEDUP_MAX_KM = float(os.environ.get('ALERT_DEDUP_MAX_KM', '3'))
+
+# Profile photo config
+PHOTO_MAX_BYTES = int(os.environ.get('PHOTO_MAX_BYTES', str(8 * 1024 * 1024)))
+PHOTO_JPEG_QUALITY = int(os.environ.get('PHOTO_JPEG_QUALITY', '82'))
+PHOTO_MIGRATION_BATCH = int(os.environ.get('PHOTO_MIGRATION_BATCH', '100'))
+
+# Phone identity config
+PHONE_DEFAULT_CC = os.environ.get('PHONE_DEFAULT_CC', '225')
+PHONE_MIGRATION_BATCH = int(os.environ.get('PHONE_MIGRATION_BATCH', '500'))
+REGISTRATION_RETRY_WINDOW_S = int(os.environ.get('REGISTRATION_RETRY_WINDOW_S', '86400'))
+
+# Session token config
+JWT_SECRET = os.environ.get('JWT_SECRET')
+JWT_ALGORITHM = os.environ.get('JWT_ALGORITHM', 'HS256')
+ACCESS_TOKEN_TTL_S = int(os.environ.get('ACCESS_TOKEN_TTL_S', '900'))
+REFRESH_TOKEN_TTL_S = int(os.environ.get('REFRESH_TOKEN_TTL_S', str(30 * 24 * 3600)))
+
+# Login (one-time SMS code) config; without SMS_API_URL codes are only logged (stub mode)
+OTP_TTL_S = int(os.environ.get('OTP_TTL_S', '300'))
+OTP_RESEND_S = int(os.environ.get('OTP_RESEND_S', '60'))
+OTP_MAX_ATTEMPTS = int(os.environ.get('OTP_MAX_ATTEMPTS', '5'))
+OTP_DEBUG = os.environ.get('OTP_DEBUG', 'false').lower() == 'true'
+SMS_API_URL = os.environ.get('SMS_API_URL') or None
+SMS_API_KEY = os.environ.get('SMS_API_KEY')
+SMS_SENDER = os.environ.get('SMS_SENDER', 'AlloServices')
+
+# Saved searches / notifications config
+SAVED_SEARCHES_PER_USER = int(os.environ.get('SAVED_SEARCHES_PER_USER', '20'))
+NOTIFY_BATCH_SIZE = int(os.environ.get('NOTIFY_BATCH_SIZE', '500'))
+
+# Commodity prices config
+COMMODITY_INGEST_MAX = int(os.environ.get('COMMODITY_INGEST_MAX', '5000'))
+COMMODITY_SERIES_MAX_DAYS = int(os.environ.get('COMMODITY_SERIES_MAX_DAYS', '730'))
+PRICE_ANOMALY_WINDOW = int(os.environ.get('PRICE_ANOMALY_WINDOW', '20'))
+PRICE_ANOMALY_Z = float(os.environ.get('PRICE_ANOMALY_Z', '3'))
+PRICE_ANOMALY_PCT = float(os.environ.get('PRICE_ANOMALY_PCT', '0.2'))
+PRICE_ANOMALY_MIN_SAMPLES = int(os.environ.get('PRICE_ANOMALY_MIN_SAMPLES', '5'))
+PRICE_WATCHES_PER_USER = int(os.environ.get('PRICE_WATCHES_PER_USER', '20'))
+
+# Push notifications config
+EXPO_PUSH_URL = os.environ.get('EXPO_PUSH_URL', 'https://exp.host/--/api/v2/push/send')
+EXPO_ACCESS_TOKEN = os.environ.get('EXPO_ACCESS_TOKEN')
+PUSH_CHUNK_SIZE = min(100, int(os.environ.get('PUSH_CHUNK_SIZE', '100')))  # Expo accepts at most 100 messages per request
+PUSH_CONCURRENCY = int(os.environ.get('PUSH_CONCURRENCY', '6'))
+PUSH_MAX_RETRIES = int(os.environ.get('PUSH_MAX_RETRIES', '2'))
+PUSH_REGISTER_BULK_MAX = int(os.environ.get('PUSH_REGISTER_BULK_MAX', '1000'))
+
+# Categories config
+ADMIN_API_KEY = os.environ.get('ADMIN_API_KEY')
+CATEGORIES_MAX_AGE_S = float(os.environ.get('CATEGORIES_MAX_AGE_S', '60'))
 
 # App + Router
 app = FastAPI(title="Allô Services CI API", version="0.8.0")
@@ -50,6 +177,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Cache", "X-Answer-Source", "ETag"],
 )
 
 # Helpers
@@ -69,9 +197,76 @@ class PyObjectId(ObjectId):
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
+# httpx logs every upstream request at INFO
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+def _doc_out(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Exposes Mongo `_id` as string `id`.
+    Write routes return the document they already hold (built in memory before
+    insert_one, or from find_one_and_update(..., return_document=AFTER)) and
+    never re-read it with find_one.
+    """
+    doc['id'] = str(doc.pop('_id'))
+    return doc
+
+class TTLCache:
+    """LRU cache with per-entry expiry. Process-local; used from the event loop only."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires, value = item
+        if expires < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
 
 LangKey = Literal['fr', 'en', 'es', 'it', 'ar']
 
+_PHONE_SEPARATORS = re.compile(r'[\s().\-/]')
+
+def normalize_phone(raw: str) -> str:
+    """
+    E.164 form of a phone number ('07 07 07 07 07' -> '+2250707070707').
+    Numbers without a country code are taken as national numbers of PHONE_DEFAULT_CC.
+    Raises ValueError when the result cannot be a valid number.
+    """
+    s = _PHONE_SEPARATORS.sub('', raw or '')
+    if s.startswith('00'):
+        s = '+' + s[2:]
+    if s.startswith('+'):
+        digits = s[1:]
+    elif s.startswith(PHONE_DEFAULT_CC) and len(s) > 10:
+        digits = s
+    else:
+        digits = PHONE_DEFAULT_CC + s
+    if not digits.isdigit() or not 8 <= len(digits) <= 15:
+        raise ValueError('invalid phone number')
+    # Côte d'Ivoire moved to 10-digit national numbers in 2021
+    if digits.startswith('225') and len(digits) != 13:
+        raise ValueError('Ivorian numbers have 10 digits after +225')
+    return '+' + digits
+
 class UserCreate(BaseModel):
     first_name: str
     last_name: str
@@ -83,6 +278,11 @@ class UserCreate(BaseModel):
     preferred_lang: LangKey = 'fr'
     photo_base64: Optional[str] = None
 
+    @field_validator('phone')
+    @classmethod
+    def _phone_e164(cls, v: str) -> str:
+        return normalize_phone(v)
+
 class UserUpdate(BaseModel):
     first_name: Optional[str] = None
     last_name: Optional[str] = None
@@ -91,12 +291,20 @@ class UserUpdate(BaseModel):
     city_id: Optional[str] = None
     city: Optional[str] = None
     preferred_lang: Optional[LangKey] = None
+    photo_base64: Optional[str] = None
+
+    @field_validator('phone')
+    @classmethod
+    def _phone_e164(cls, v: Optional[str]) -> Optional[str]:
+        return normalize_phone(v) if v is not None else v
 
 class PushTokenRegister(BaseModel):
     token: str
     user_id: Optional[str] = None
     platform: Optional[str] = None
     city: Optional[str] = None
+    lat: Optional[float] = None
+    lng: Optional[float] = None
     device_info: Optional[Dict[str, Any]] = None
 
 class PushSendInput(BaseModel):
@@ -107,6 +315,45 @@ class PushSendInput(BaseModel):
     lang: Optional[LangKey] = None
     premium_only: Optional[bool] = False
 
+ContractType = Literal['CDI', 'CDD', 'stage', 'interim', 'freelance', 'autre']
+
+class JobCreate(BaseModel):
+    title: str
+    company: Optional[str] = None
+    city: str
+    commune: Optional[str] = None
+    sector: str
+    contract_type: ContractType = 'CDI'
+    description: str
+    salary: Optional[str] = None
+    contact_phone: Optional[str] = None
+    contact_email: Optional[EmailStr] = None
+    apply_url: Optional[str] = None
+    posted_at: Optional[datetime] = None
+
+class SavedSearchCreate(BaseModel):
+    user_id: Optional[str] = None  # defaults to the signed-in user
+    kind: Literal['job', 'alert']
+    city: Optional[str] = None
+    type: Optional[str] = None  # job sector or alert type
+    keywords: Optional[str] = None
+
+class CommodityPriceIn(BaseModel):
+    commodity: str
+    market: str
+    price: float = Field(gt=0)  # FCFA per unit
+    unit: str = 'kg'
+    observed_at: Optional[datetime] = None
+
+class PriceWatchCreate(BaseModel):
+    user_id: Optional[str] = None  # defaults to the signed-in user
+    commodity: str
+    market: str
+    above: Optional[float] = Field(None, gt=0)  # FCFA; notify when the price rises to it
+    below: Optional[float] = Field(None, gt=0)  # FCFA; notify when the price falls to it
+    pct_change: Optional[float] = Field(None, gt=0)  # e.g. 0.1 for a 10% move within one batch
+    anomalies: bool = True  # z-score / percent-change anomalies detected by the evaluator
+
 class AlertCreate(BaseModel):
     title: str
     type: Literal['flood', 'missing_person', 'wanted_notice', 'fire', 'accident', 'other']
@@ -143,146 +390,2620 @@ class HealthFacilityOut(BaseModel):
     lat: Optional[float] = None
     lng: Optional[float] = None
 
-# ---------- INDEXES ----------
-async def ensure_indexes():
-    await db.pharmacies.create_index([('location', '2dsphere')])
-    await db.pharmacies.create_index('name')
-    await db.alerts.create_index([('status', 1), ('created_at', -1)])
-    await db.alerts.create_index('read_by')
-    await db.categories.create_index('slug', unique=True)
-    await db.locations.create_index([('parent_id', 1), ('name', 1)])
-    await db.jobs.create_index([('posted_at', -1)])
-    await db.commodity_prices.create_index([('updated_at', -1)])
-    await db.transactions.create_index('transaction_id', unique=True)
-    await db.transactions.create_index([('user_id', 1), ('created_at', -1)])
-    await db.push_tokens.create_index('token', unique=True)
-    await db.push_tokens.create_index([('city', 1)])
-    await db.push_tokens.create_index([('preferred_lang', 1)])
-    await db.push_tokens.create_index([('is_premium', 1)])
-    await db.health_facilities.create_index([('location', '2dsphere')])
-    await db.health_facilities.create_index('name')
-    await db.health_facilities.create_index([('city', 1), ('commune', 1)])
+# ---------- INDEXES ----------
+async def ensure_indexes():
+    await db.pharmacies.create_index([('location', '2dsphere')])
+    await db.pharmacies.create_index('name')
+    await db.alerts.create_index([('status', 1), ('created_at', -1)])
+    await db.alerts.create_index('read_by')
+    await db.alerts.create_index([('type', 1), ('last_reported_at', -1)])
+    await db.categories.create_index('slug', unique=True)
+    await db.locations.create_index([('parent_id', 1), ('name', 1)])
+    await db.jobs.create_index([('posted_at', -1), ('_id', -1)])
+    # the old single-field posted_at index is a prefix of (posted_at, _id) and only costs writes
+    try:
+        await db.jobs.drop_index('posted_at_-1')
+    except OperationFailure:
+        pass  # already dropped, or a fresh database that never had it
+    # the feed filters on the normalized city_key; the raw-city indexes only cost writes
+    for name in ('city_1_posted_at_-1__id_-1', 'city_1_sector_1_contract_type_1_posted_at_-1__id_-1'):
+        try:
+            await db.jobs.drop_index(name)
+        except OperationFailure:
+            pass
+    await db.jobs.create_index([('city_key', 1), ('posted_at', -1), ('_id', -1)])
+    await db.jobs.create_index([('sector', 1), ('posted_at', -1), ('_id', -1)])
+    await db.jobs.create_index([('contract_type', 1), ('posted_at', -1), ('_id', -1)])
+    await db.jobs.create_index([('city_key', 1), ('sector', 1), ('contract_type', 1), ('posted_at', -1), ('_id', -1)])
+    await db.jobs.create_index(
+        [('title', 'text'), ('company', 'text'), ('description', 'text')],
+        name='jobs_text', default_language='french', weights={'title': 10, 'company': 5, 'description': 1},
+    )
+    await db.commodity_prices.create_index([('updated_at', -1)])
+    await db.commodity_prices.create_index([('commodity', 1), ('market', 1), ('observed_at', -1)])
+    await db.commodity_rollups.create_index([('commodity', 1), ('market', 1), ('period', 1), ('bucket', 1)], unique=True)
+    await db.commodity_latest.create_index([('market', 1), ('commodity', 1)], unique=True)
+    await db.commodity_stats.create_index([('commodity', 1), ('market', 1)], unique=True)
+    await db.price_watches.create_index([('user_id', 1), ('created_at', -1)])
+    await db.transactions.create_index('transaction_id', unique=True)
+    await db.transactions.create_index([('user_id', 1), ('created_at', -1), ('_id', -1)])
+    await db.transactions.create_index([('status', 1), ('created_at', 1)])
+    await db.subscriptions.create_index([('user_id', 1), ('status', 1), ('expires_at', -1)])
+    await dedupe_subscriptions()
+    await db.subscriptions.create_index('user_id', unique=True)
+    await db.push_tokens.create_index('token', unique=True)
+    await db.push_tokens.create_index([('city', 1)])
+    await db.push_tokens.create_index([('preferred_lang', 1)])
+    await db.push_tokens.create_index([('is_premium', 1)])
+    await db.push_tokens.create_index([('user_id', 1)])
+    await db.health_facilities.create_index([('location', '2dsphere')])
+    await db.health_facilities.create_index('name')
+    await db.health_facilities.create_index([('city', 1), ('commune', 1)])
+    await db.ai_cache.create_index('expires_at', expireAfterSeconds=0)
+    await db.refresh_tokens.create_index('expires_at', expireAfterSeconds=0)
+    await db.refresh_tokens.create_index([('user_id', 1), ('used_at', 1)])
+    await db.otp_codes.create_index('expires_at', expireAfterSeconds=0)
+    await db.user_photos.create_index('user_id')
+    await db.saved_searches.create_index([('user_id', 1), ('created_at', -1)])
+    await db.notifications.create_index([('user_id', 1), ('created_at', -1)])
+
+# ---------- BASIC ROUTES ----------
+@api.get('/health')
+async def health():
+    return {"status": "ok"}
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+def _rss_bytes() -> float:
+    """Current resident set size; falls back to the peak where /proc is unavailable."""
+    try:
+        with open('/proc/self/statm') as f:
+            return float(int(f.read().split()[1]) * _PAGE_SIZE)
+    except (OSError, ValueError, IndexError):
+        return float(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+
+@api.get('/metrics')
+async def get_metrics():
+    return {**metrics, 'process_rss_bytes': _rss_bytes()}
+
+@api.get('/')
+async def api_root():
+    return {"message": "Allô Services CI API", "paths": [r.path for r in app.router.routes]}
+
+# ---------- AUTH / USERS ----------
+def _user_out(doc: Dict[str, Any]) -> Dict[str, Any]:
+    for field in ('photo_base64', 'registration_key'):
+        doc.pop(field, None)
+    return _doc_out(doc)
+
+def _registration_key(idempotency_key: Optional[str]) -> Optional[str]:
+    return hashlib.sha256(idempotency_key.encode()).hexdigest() if idempotency_key else None
+
+@api.post("/auth/register")
+@api.post("/auth/register/")
+async def register_user(payload: UserCreate, idempotency_key: Optional[str] = Header(None)):
+    """
+    One account per E.164 phone (unique users.phone index). Tokens are only issued for an
+    account this call created: a known phone gets 409 and nothing about that account, since
+    knowing a number does not prove owning it. A retry of the same registration (same
+    Idempotency-Key, within REGISTRATION_RETRY_WINDOW_S) gets the same account back.
+    """
+    doc = payload.model_dump()
+    doc['registration_key'] = _registration_key(idempotency_key)
+    photo_base64 = doc.pop('photo_base64')
+    if doc.get('city_id'):
+        doc.update(resolve_city_id(doc['city_id']))
+    doc['_id'] = ObjectId()
+    if photo_base64:
+        doc.update(await store_user_photo(doc['_id'], photo_base64))
+    doc['created_at'] = datetime.utcnow()
+    doc['is_premium'] = False
+    doc['premium_until'] = None
+    try:
+        saved = await db.users.find_one_and_update(
+            {'phone': doc['phone']}, {'$setOnInsert': doc}, upsert=True, return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # lost a concurrent upsert race on the unique index; the winner's document is there now
+        saved = await db.users.find_one({'phone': doc['phone']})
+    if saved['_id'] != doc['_id']:
+        if doc.get('photo_id'):
+            await db.user_photos.delete_one({'_id': ObjectId(doc['photo_id'])})
+        retried = (
+            doc['registration_key'] and saved.get('registration_key')
+            and hmac.compare_digest(doc['registration_key'], saved['registration_key'])
+            and saved['created_at'] > doc['created_at'] - timedelta(seconds=REGISTRATION_RETRY_WINDOW_S)
+        )
+        if not retried:
+            metrics['users_register_existing_total'] += 1
+            raise HTTPException(status_code=409, detail="Phone already registered")
+        # the client lost the first answer: same account, fresh tokens
+        metrics['users_register_retried_total'] += 1
+        return {**_user_out(saved), **await issue_tokens(saved)}
+    metrics['users_registered_total'] += 1
+    entitlements.set(doc['_id'], None)
+    return {**_user_out(saved), **await issue_tokens(saved)}
+
+async def sync_push_tokens(user_id: ObjectId, updates: Dict[str, Any]):
+    """Copies the profile fields push audiences are selected on to the user's tokens."""
+    fields = {k: updates[k] for k in ('city', 'preferred_lang') if k in updates}
+    if fields:
+        await db.push_tokens.update_many({'user_id': user_id}, {'$set': fields})
+
+@api.patch("/users/{user_id}")
+async def update_user(user_id: str, payload: UserUpdate):
+    try:
+        _id = ObjectId(user_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid user_id")
+    updates = {k: v for k, v in payload.model_dump(exclude_unset=True).items() if v is not None}
+    if not updates:
+        return {"updated": False}
+    if updates.get('city_id'):
+        updates.update(resolve_city_id(updates['city_id']))
+    photo_base64 = updates.pop('photo_base64', None)
+    if photo_base64 is None:
+        updates['updated_at'] = datetime.utcnow()
+        try:
+            saved = await db.users.find_one_and_update({'_id': _id}, {'$set': updates}, return_document=ReturnDocument.AFTER)
+        except DuplicateKeyError:
+            raise HTTPException(status_code=409, detail="Phone already registered")
+        if not saved:
+            raise HTTPException(status_code=404, detail="User not found")
+        await sync_push_tokens(_id, updates)
+        return _user_out(saved)
+    # Photo change: read the previous photo_id from the same round trip so its variants can be dropped
+    updates.update(await store_user_photo(_id, photo_base64))
+    updates['updated_at'] = datetime.utcnow()
+    try:
+        before = await db.users.find_one_and_update({'_id': _id}, {'$set': updates, '$unset': {'photo_base64': ''}})
+    except DuplicateKeyError:
+        await db.user_photos.delete_one({'_id': ObjectId(updates['photo_id'])})
+        raise HTTPException(status_code=409, detail="Phone already registered")
+    if not before:
+        await db.user_photos.delete_one({'_id': ObjectId(updates['photo_id'])})
+        raise HTTPException(status_code=404, detail="User not found")
+    if before.get('photo_id'):
+        await db.user_photos.delete_one({'_id': ObjectId(before['photo_id'])})
+    await sync_push_tokens(_id, updates)
+    return _user_out({**before, **updates})
+
+# ---------- PROFILE PHOTOS ----------
+# Photos live in db.user_photos as pre-resized JPEG variants (a few KB to a few tens
+# of KB each, far below the 16 MB document limit, so GridFS chunking buys nothing).
+# Users only keep photo_id/photo_url; the variant bytes are read by GET /photos/... alone.
+PHOTO_VARIANTS = {'sm': 64, 'md': 256, 'lg': 512}
+Image.MAX_IMAGE_PIXELS = 40_000_000
+
+def _photo_url(photo_id: ObjectId, variant: str = 'md') -> str:
+    return f"/api/photos/{photo_id}/{variant}"
+
+def _decode_photo(photo_base64: str) -> bytes:
+    # accept both bare base64 and data URLs (data:image/jpeg;base64,...)
+    if photo_base64.startswith('data:'):
+        photo_base64 = photo_base64.split(',', 1)[-1]
+    if len(photo_base64) > PHOTO_MAX_BYTES * 4 // 3 + 4:
+        raise HTTPException(status_code=413, detail="Photo too large")
+    try:
+        return base64.b64decode(photo_base64, validate=False)
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid photo encoding")
+
+def render_avatar_variants(raw: bytes) -> Dict[str, bytes]:
+    """Center-crops to a square and renders each PHOTO_VARIANTS size as JPEG. CPU-bound: run off the loop."""
+    with Image.open(io.BytesIO(raw)) as img:
+        img = ImageOps.exif_transpose(img)
+        img = img.convert('RGB')
+        side = min(img.size)
+        img = ImageOps.fit(img, (side, side), method=Image.LANCZOS)
+        out = {}
+        for variant, px in PHOTO_VARIANTS.items():
+            buf = io.BytesIO()
+            img.resize((min(px, side), min(px, side)), Image.LANCZOS).save(buf, 'JPEG', quality=PHOTO_JPEG_QUALITY, optimize=True, progressive=True)
+            out[variant] = buf.getvalue()
+    return out
+
+async def store_user_photo(user_id: ObjectId, photo_base64: str) -> Dict[str, Any]:
+    """Stores the variants and returns the fields to $set on the user."""
+    raw = _decode_photo(photo_base64)
+    try:
+        variants = await asyncio.to_thread(render_avatar_variants, raw)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise HTTPException(status_code=400, detail="Invalid image")
+    photo_id = ObjectId()
+    await db.user_photos.insert_one({
+        '_id': photo_id,
+        'user_id': user_id,
+        'content_type': 'image/jpeg',
+        'variants': {k: Binary(v) for k, v in variants.items()},
+        'created_at': datetime.utcnow(),
+    })
+    metrics['photos_stored_total'] += 1
+    metrics['photo_bytes_stored_total'] += sum(len(v) for v in variants.values())
+    return {'photo_id': str(photo_id), 'photo_url': _photo_url(photo_id)}
+
+@api.get('/photos/{photo_id}/{variant}')
+async def get_photo(photo_id: str, variant: Literal['sm', 'md', 'lg']):
+    try:
+        _id = ObjectId(photo_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid photo_id")
+    doc = await db.user_photos.find_one({'_id': _id}, {f'variants.{variant}': 1, 'content_type': 1})
+    if not doc or variant not in doc.get('variants', {}):
+        raise HTTPException(status_code=404, detail="Photo not found")
+    # a photo_id is never rewritten (a new upload gets a new id), so clients may cache forever
+    return Response(
+        content=bytes(doc['variants'][variant]),
+        media_type=doc.get('content_type', 'image/jpeg'),
+        headers={'Cache-Control': 'public, max-age=31536000, immutable'},
+    )
+
+async def migrate_user_photos() -> int:
+    """
+    Moves legacy inline users.photo_base64 into db.user_photos, PHOTO_MIGRATION_BATCH users at a
+    time in _id order. The last migrated _id is recorded in db.migrations after each batch so a
+    restart resumes there; a user whose photo fails to move keeps it inline and is retried on
+    the next full pass.
+    """
+    state = await db.migrations.find_one({'_id': 'user_photos'}) or {}
+    last_id = state.get('last_id')
+    moved = failed = 0
+    while True:
+        criteria: Dict[str, Any] = {'photo_base64': {'$exists': True}}
+        if last_id:
+            criteria['_id'] = {'$gt': last_id}
+        batch = await db.users.find(criteria, {'photo_base64': 1}).sort('_id', 1).limit(PHOTO_MIGRATION_BATCH).to_list(PHOTO_MIGRATION_BATCH)
+        if not batch:
+            break
+        ops = []
+        for u in batch:
+            fields: Dict[str, Any] = {}
+            if u.get('photo_base64'):
+                try:
+                    fields = await store_user_photo(u['_id'], u['photo_base64'])
+                except HTTPException:
+                    logger.warning("Dropping unreadable photo for user %s", u['_id'])
+                except Exception:
+                    logger.exception("Photo migration failed for user %s", u['_id'])
+                    failed += 1
+                    metrics['photos_migration_errors_total'] += 1
+                    continue
+            ops.append(UpdateOne({'_id': u['_id']}, {'$set': fields, '$unset': {'photo_base64': ''}} if fields else {'$unset': {'photo_base64': ''}}))
+        if ops:
+            await db.users.bulk_write(ops, ordered=False)
+        moved += len(ops)
+        metrics['photos_migrated_total'] += len(ops)
+        last_id = batch[-1]['_id']
+        await db.migrations.update_one(
+            {'_id': 'user_photos'}, {'$set': {'last_id': last_id, 'updated_at': datetime.utcnow()}}, upsert=True,
+        )
+    # full pass done: the next one starts over, and only finds the users that failed here
+    await db.migrations.update_one(
+        {'_id': 'user_photos'}, {'$set': {'last_id': None, 'done_at': datetime.utcnow(), 'failed': failed}}, upsert=True,
+    )
+    if moved or failed:
+        logger.info("Photo migration pass done: %d moved, %d failed", moved, failed)
+    return moved
+
+# ---------- USERS: phone identity migration ----------
+async def _merge_user_group(ids: List[ObjectId]):
+    """Folds users sharing one phone into the oldest account and re-points everything that references the others."""
+    docs = await db.users.find({'_id': {'$in': ids}}).sort([('created_at', 1), ('_id', 1)]).to_list(None)
+    if len(docs) < 2:
+        return
+    keep, dups = docs[0], docs[1:]
+    keep_id, dup_ids = keep['_id'], [d['_id'] for d in dups]
+    # profile fields the survivor lacks come from the newest duplicate that has them
+    fill: Dict[str, Any] = {}
+    for d in dups:
+        for k, v in d.items():
+            if k not in ('_id', 'premium_until', 'is_premium') and v is not None and keep.get(k) is None:
+                fill[k] = v
+    premium_until = max((d['premium_until'] for d in docs if d.get('premium_until')), default=None)
+    await db.users.update_one({'_id': keep_id}, {'$set': {**fill, 'premium_until': premium_until, 'updated_at': datetime.utcnow()}})
+
+    ref = {'user_id': {'$in': dup_ids}}
+    await db.transactions.update_many(ref, {'$set': {'user_id': keep_id}})
+    await collapse_subscriptions(keep_id, dup_ids)
+    await db.alerts.update_many({'read_by': {'$in': dup_ids}}, {'$addToSet': {'read_by': keep_id}})
+    await db.alerts.update_many({'read_by': {'$in': dup_ids}}, {'$pull': {'read_by': {'$in': dup_ids}}})
+    photo_id = fill.get('photo_id') or keep.get('photo_id')
+    stale_photos = [ObjectId(d['photo_id']) for d in dups if d.get('photo_id') and d['photo_id'] != photo_id]
+    if stale_photos:
+        await db.user_photos.delete_many({'_id': {'$in': stale_photos}})
+    await db.user_photos.update_many(ref, {'$set': {'user_id': keep_id}})
+    async for summary in db.payment_summaries.find({'_id': {'$in': dup_ids}}):
+        await db.payment_summaries.update_one(
+            {'_id': keep_id},
+            {
+                '$inc': {'total_paid': summary.get('total_paid', 0), 'payments_count': summary.get('payments_count', 0)},
+                '$max': {'last_payment_at': summary.get('last_payment_at')},
+                '$addToSet': {'transaction_ids': {'$each': summary.get('transaction_ids') or []}},
+                '$setOnInsert': {'last_transaction_id': summary.get('last_transaction_id'), 'currency': 'XOF'},
+            },
+            upsert=True,
+        )
+    await db.payment_summaries.delete_many({'_id': {'$in': dup_ids}})
+    await db.users.delete_many({'_id': {'$in': dup_ids}})
+    for uid in ids:
+        entitlements.pop(uid)
+
+async def migrate_user_phones() -> int:
+    """
+    One-off: rewrites users.phone to E.164 in PHONE_MIGRATION_BATCH batches, merges accounts
+    that now share a phone, then builds the unique index registration upserts rely on.
+    Recorded in db.migrations so later startups only ensure the index.
+    """
+    if await db.migrations.find_one({'_id': 'users_phone_e164'}):
+        await db.users.create_index('phone', unique=True, partialFilterExpression={'phone': {'$type': 'string'}})
+        return 0
+    last_id = None
+    while True:
+        criteria = {'_id': {'$gt': last_id}} if last_id else {}
+        batch = await db.users.find(criteria, {'phone': 1}).sort('_id', 1).limit(PHONE_MIGRATION_BATCH).to_list(PHONE_MIGRATION_BATCH)
+        if not batch:
+            break
+        ops = []
+        for u in batch:
+            try:
+                e164 = normalize_phone(u.get('phone') or '')
+            except ValueError:
+                continue  # left as typed; still unique-checked, just never matched by lookup
+            if e164 != u.get('phone'):
+                ops.append(UpdateOne({'_id': u['_id']}, {'$set': {'phone': e164}}))
+        if ops:
+            await db.users.bulk_write(ops, ordered=False)
+            metrics['users_phone_normalized_total'] += len(ops)
+        last_id = batch[-1]['_id']
+
+    merged = 0
+    groups = db.users.aggregate([
+        {'$match': {'phone': {'$type': 'string'}}},
+        {'$group': {'_id': '$phone', 'ids': {'$push': '$_id'}, 'n': {'$sum': 1}}},
+        {'$match': {'n': {'$gt': 1}}},
+    ], allowDiskUse=True)
+    async for group in groups:
+        await _merge_user_group(group['ids'])
+        merged += group['n'] - 1
+    metrics['users_merged_total'] += merged
+    await db.users.create_index('phone', unique=True, partialFilterExpression={'phone': {'$type': 'string'}})
+    await db.migrations.update_one(
+        {'_id': 'users_phone_e164'}, {'$set': {'done_at': datetime.utcnow(), 'merged': merged}}, upsert=True,
+    )
+    logger.info("Phone migration done, merged %d duplicate users", merged)
+    return merged
+
+# ---------- SESSIONS ----------
+# Short-lived HS256 access tokens carry what gated routes need (user id, lang, city,
+# premium_until), so verifying one is CPU only. Refresh tokens are the only path that
+# re-reads the user, which is also how a new premium_until reaches the client.
+if not JWT_SECRET:
+    JWT_SECRET = uuid.uuid4().hex + uuid.uuid4().hex
+    logger.warning("JWT_SECRET not set: using a per-process secret, sessions will not survive a restart")
+
+class RefreshInput(BaseModel):
+    refresh_token: str
+
+class OtpRequestInput(BaseModel):
+    phone: str
+
+    @field_validator('phone')
+    @classmethod
+    def _phone_e164(cls, v: str) -> str:
+        return normalize_phone(v)
+
+class LoginInput(OtpRequestInput):
+    code: str
+
+def _epoch_s(dt: Optional[datetime]) -> Optional[int]:
+    return int((dt - _EPOCH).total_seconds()) if dt else None
+
+async def issue_tokens(user: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Access + refresh token pair for a user document (needs _id or id, and premium_until).
+    The refresh token's jti is recorded in db.refresh_tokens so it can be used exactly once.
+    """
+    now = int(time.time())
+    sub = str(user.get('_id') or user['id'])
+    access = {
+        'sub': sub,
+        'typ': 'access',
+        'lang': user.get('preferred_lang'),
+        'city': user.get('city'),
+        'premium_until': _epoch_s(user.get('premium_until')),
+        'iat': now,
+        'exp': now + ACCESS_TOKEN_TTL_S,
+    }
+    refresh = {'sub': sub, 'typ': 'refresh', 'jti': uuid.uuid4().hex, 'iat': now, 'exp': now + REFRESH_TOKEN_TTL_S}
+    await db.refresh_tokens.insert_one({
+        '_id': refresh['jti'],
+        'user_id': ObjectId(sub),
+        'used_at': None,
+        'expires_at': _EPOCH + timedelta(seconds=refresh['exp']),
+    })
+    return {
+        'access_token': jwt.encode(access, JWT_SECRET, algorithm=JWT_ALGORITHM),
+        'refresh_token': jwt.encode(refresh, JWT_SECRET, algorithm=JWT_ALGORITHM),
+        'token_type': 'bearer',
+        'expires_in': ACCESS_TOKEN_TTL_S,
+    }
+
+def decode_token(token: str, typ: str) -> Dict[str, Any]:
+    try:
+        claims = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM], options={'require': ['sub', 'exp']})
+    except jwt.ExpiredSignatureError:
+        metrics['session_tokens_expired_total'] += 1
+        raise HTTPException(status_code=401, detail="Token expired", headers={'WWW-Authenticate': 'Bearer'})
+    except jwt.InvalidTokenError:
+        metrics['session_tokens_invalid_total'] += 1
+        raise HTTPException(status_code=401, detail="Invalid token", headers={'WWW-Authenticate': 'Bearer'})
+    if claims.get('typ') != typ or not ObjectId.is_valid(claims['sub']):
+        metrics['session_tokens_invalid_total'] += 1
+        raise HTTPException(status_code=401, detail="Invalid token", headers={'WWW-Authenticate': 'Bearer'})
+    return claims
+
+async def session_claims(authorization: Optional[str] = Header(None)) -> Optional[Dict[str, Any]]:
+    """
+    Verified access-token claims from `Authorization: Bearer ...`, without touching Mongo.
+    None when no token is sent (legacy clients still pass user_id); 401 when one is sent but bad.
+    """
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        raise HTTPException(status_code=401, detail="Invalid authorization header", headers={'WWW-Authenticate': 'Bearer'})
+    return decode_token(token.strip(), 'access')
+
+def claims_premium(claims: Dict[str, Any]) -> bool:
+    premium_until = claims.get('premium_until')
+    return bool(premium_until and premium_until > time.time())
+
+def require_owner(user_id: Optional[str], claims: Optional[Dict[str, Any]]) -> ObjectId:
+    """The signed-in user's id for a per-user route: 401 without a session, 403 for another user_id."""
+    if claims is None:
+        raise HTTPException(status_code=401, detail="Missing token", headers={'WWW-Authenticate': 'Bearer'})
+    if user_id and user_id != claims['sub']:
+        raise HTTPException(status_code=403, detail="Token does not match user_id")
+    return ObjectId(claims['sub'])
+
+@api.post('/auth/refresh')
+async def refresh_session(payload: RefreshInput):
+    """
+    Rotates the session: the presented refresh token is marked used and a new pair is issued.
+    A refresh token presented twice (or unknown) means it leaked, so every live refresh
+    token of that user is revoked and the client has to sign in again.
+    """
+    claims = decode_token(payload.refresh_token, 'refresh')
+    uid = ObjectId(claims['sub'])
+    now = datetime.utcnow()
+    used = await db.refresh_tokens.find_one_and_update(
+        {'_id': claims.get('jti'), 'user_id': uid, 'used_at': None},
+        {'$set': {'used_at': now}},
+    )
+    if not used:
+        await db.refresh_tokens.update_many({'user_id': uid, 'used_at': None}, {'$set': {'used_at': now, 'revoked': True}})
+        metrics['session_refresh_reuse_total'] += 1
+        raise HTTPException(status_code=401, detail="Refresh token already used", headers={'WWW-Authenticate': 'Bearer'})
+    user = await db.users.find_one({'_id': uid}, {'preferred_lang': 1, 'city': 1, 'premium_until': 1})
+    if not user:
+        raise HTTPException(status_code=401, detail="Unknown user", headers={'WWW-Authenticate': 'Bearer'})
+    entitlements.set(uid, user.get('premium_until'))
+    metrics['session_refresh_total'] += 1
+    return await issue_tokens(user)
+
+USER_LOOKUP_PROJECTION = {'first_name': 1, 'last_name': 1, 'phone': 1, 'city': 1, 'created_at': 1}
+
+@api.get("/users/lookup")
+async def lookup_user(
+    phone: str,
+    claims: Optional[Dict[str, Any]] = Depends(session_claims),
+    x_admin_key: Optional[str] = Header(None),
+):
+    """Admins may look up any phone; a signed-in user only their own (404 otherwise, so numbers cannot be probed)."""
+    admin = is_admin(x_admin_key)
+    if not admin and claims is None:
+        raise HTTPException(status_code=401, detail="Authentication required", headers={'WWW-Authenticate': 'Bearer'})
+    try:
+        e164 = normalize_phone(phone)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    criteria: Dict[str, Any] = {'phone': e164}
+    if not admin:
+        criteria['_id'] = ObjectId(claims['sub'])
+    user = await db.users.find_one(criteria, USER_LOOKUP_PROJECTION)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return _doc_out(user)
+
+# ---------- LOGIN (SMS one-time code) ----------
+# Owning the phone is what proves identity: POST /auth/otp texts a 6-digit code, and
+# POST /auth/login trades it for a session. Codes are stored as HMACs (keyed with the
+# session secret), are single-use, expire after OTP_TTL_S and allow OTP_MAX_ATTEMPTS guesses.
+def _otp_hash(phone: str, code: str) -> str:
+    return hmac.new(JWT_SECRET.encode(), f"{phone}:{code}".encode(), hashlib.sha256).hexdigest()
+
+async def send_sms(phone: str, text: str):
+    if not SMS_API_URL:
+        logger.info("SMS stub to %s: %s", phone, text)
+        return
+    resp = await push_http().post(
+        SMS_API_URL, json={'to': phone, 'from': SMS_SENDER, 'text': text},
+        headers={'Authorization': f"Bearer {SMS_API_KEY}"} if SMS_API_KEY else None,
+    )
+    resp.raise_for_status()
+
+@api.post('/auth/otp')
+async def request_login_code(payload: OtpRequestInput):
+    """Texts a login code to a registered phone. The answer is the same for unknown phones, so numbers cannot be probed."""
+    now = datetime.utcnow()
+    recent = await db.otp_codes.find_one({'_id': payload.phone, 'sent_at': {'$gt': now - timedelta(seconds=OTP_RESEND_S)}}, {'_id': 1})
+    if recent:
+        raise HTTPException(status_code=429, detail="Code déjà envoyé, réessayez dans un instant", headers={'Retry-After': str(OTP_RESEND_S)})
+    out: Dict[str, Any] = {"sent": True, "expires_in": OTP_TTL_S}
+    if not await db.users.find_one({'phone': payload.phone}, {'_id': 1}):
+        metrics['otp_unknown_phone_total'] += 1
+        return out
+    code = f"{secrets.randbelow(10 ** 6):06d}"
+    await db.otp_codes.replace_one(
+        {'_id': payload.phone},
+        {'code_hash': _otp_hash(payload.phone, code), 'attempts': 0, 'sent_at': now, 'expires_at': now + timedelta(seconds=OTP_TTL_S)},
+        upsert=True,
+    )
+    try:
+        await send_sms(payload.phone, f"Allô Services CI : votre code de connexion est {code}")
+    except Exception:
+        logger.exception("Sending login code failed")
+        await db.otp_codes.delete_one({'_id': payload.phone})
+        raise HTTPException(status_code=503, detail="Envoi du SMS impossible, réessayez plus tard")
+    metrics['otp_sent_total'] += 1
+    if OTP_DEBUG and not SMS_API_URL:
+        out['debug_code'] = code
+    return out
+
+@api.post('/auth/login')
+async def login(payload: LoginInput):
+    now = datetime.utcnow()
+    # consuming the code and checking it is one atomic step, so a code logs in at most once
+    used = await db.otp_codes.find_one_and_delete({
+        '_id': payload.phone, 'code_hash': _otp_hash(payload.phone, payload.code.strip()),
+        'expires_at': {'$gt': now}, 'attempts': {'$lt': OTP_MAX_ATTEMPTS},
+    })
+    if not used:
+        await db.otp_codes.update_one({'_id': payload.phone}, {'$inc': {'attempts': 1}})
+        metrics['login_failed_total'] += 1
+        raise HTTPException(status_code=401, detail="Code invalide ou expiré")
+    user = await db.users.find_one({'phone': payload.phone})
+    if not user:
+        raise HTTPException(status_code=401, detail="Code invalide ou expiré")
+    entitlements.set(user['_id'], user.get('premium_until'))
+    metrics['login_total'] += 1
+    return {**_user_out(user), **await issue_tokens(user)}
+
+# ---------- ENTITLEMENTS ----------
+# user_id -> premium_until (None when never premium). Expiry is compared at read
+# time, so only payment writes need to invalidate an entry.
+entitlements = TTLCache(ENTITLEMENT_CACHE_SIZE, ENTITLEMENT_CACHE_TTL)
+_NOT_CACHED = object()
+
+async def get_premium_until(uid: ObjectId) -> Optional[datetime]:
+    """
+    Premium expiry from the entitlement cache, else from the denormalized
+    users.premium_until. Raises KeyError for unknown users.
+    """
+    cached = entitlements.get(uid, _NOT_CACHED)
+    if cached is not _NOT_CACHED:
+        metrics['entitlement_cache_hits'] += 1
+        return cached
+    metrics['entitlement_cache_misses'] += 1
+    user = await db.users.find_one({'_id': uid}, {'premium_until': 1})
+    if not user:
+        raise KeyError(uid)
+    if 'premium_until' in user:
+        premium_until = user['premium_until']
+    else:
+        # user created before premium_until existed: derive it once and store it
+        sub = await db.subscriptions.find_one(
+            {'user_id': uid, 'status': {'$in': ['paid', 'active']}},
+            {'expires_at': 1},
+            sort=[('expires_at', -1)],
+        )
+        premium_until = sub.get('expires_at') if sub else None
+        await db.users.update_one({'_id': uid}, {'$set': {'premium_until': premium_until}})
+    entitlements.set(uid, premium_until)
+    return premium_until
+
+@api.get("/subscriptions/check")
+async def check_subscription(user_id: Optional[str] = None, claims: Optional[Dict[str, Any]] = Depends(session_claims)):
+    if claims is not None:
+        if user_id and user_id != claims['sub']:
+            raise HTTPException(status_code=403, detail="Token does not match user_id")
+        if claims_premium(claims):
+            # answered from the token alone
+            metrics['entitlement_token_hits'] += 1
+            return {"is_premium": True, "expires_at": _EPOCH + timedelta(seconds=claims['premium_until'])}
+        # token predates a payment maybe: fall through to the entitlement cache
+        user_id = claims['sub']
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Missing token or user_id", headers={'WWW-Authenticate': 'Bearer'})
+    try:
+        uid = ObjectId(user_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid user_id")
+    try:
+        premium_until = await get_premium_until(uid)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="User not found")
+    active = bool(premium_until and premium_until > datetime.utcnow())
+    return {"is_premium": active, "expires_at": premium_until if active else None}
+
+async def _is_user_premium(uid: ObjectId) -> bool:
+    try:
+        premium_until = await get_premium_until(uid)
+    except KeyError:
+        return False
+    return bool(premium_until and premium_until > datetime.utcnow())
+
+# ---------- PAYMENTS (CinetPay) ----------
+class CinetPayUnavailable(Exception):
+    pass
+
+class CircuitBreaker:
+    """
+    Closed until `threshold` consecutive failures, then open (fail fast) for
+    `cooldown` seconds; after that a single probe call is let through (half-open).
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        return 'half_open' if time.monotonic() - self.opened_at >= self.cooldown else 'open'
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'half_open' and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+    def end_probe(self):
+        # a probe that ended without an outcome (cancelled, unexpected error) must not
+        # keep the breaker half-open with the probe slot taken forever
+        self._probing = False
+
+class CinetPayClient:
+    """
+    Shared async client for the CinetPay API (created on startup, keep-alive pooled).
+    Failures that guarantee the request was not processed (connect errors, pool
+    timeouts) are retried, with full-jitter exponential backoff. A 5xx only proves the
+    answer failed, not the request, so it is retried for idempotent calls (status
+    checks) only; a read timeout is never retried since CinetPay may already have
+    registered the transaction.
+    """
+
+    RETRYABLE = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+    def __init__(self, base_url: str, connect_timeout: float, read_timeout: float, max_retries: int, breaker: CircuitBreaker):
+        self.base_url = base_url
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout, pool=connect_timeout)
+        self.max_retries = max_retries
+        self.breaker = breaker
+        self._http: Optional[httpx.AsyncClient] = None
+
+    async def start(self):
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30),
+            )
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def post(self, path: str, payload: Dict[str, Any], idempotent: bool = False) -> httpx.Response:
+        probe = self.breaker.state == 'half_open'
+        if not self.breaker.allow():
+            metrics['cinetpay_fast_failures_total'] += 1
+            raise CinetPayUnavailable("CinetPay temporarily unavailable")
+        try:
+            await self.start()
+            last_error: Optional[Exception] = None
+            for attempt in range(self.max_retries + 1):
+                if attempt:
+                    metrics['cinetpay_retries_total'] += 1
+                    await asyncio.sleep(random.uniform(0, 0.2 * 2 ** attempt))
+                t0 = time.perf_counter()
+                try:
+                    metrics['cinetpay_requests_total'] += 1
+                    resp = await self._http.post(path, json=payload)
+                except self.RETRYABLE as e:
+                    last_error = e
+                    continue
+                except httpx.HTTPError as e:
+                    last_error = e
+                    break
+                finally:
+                    metrics['cinetpay_latency_ms_sum'] += (time.perf_counter() - t0) * 1000.0
+                if resp.status_code >= 500:
+                    last_error = CinetPayUnavailable(f"CinetPay HTTP {resp.status_code}")
+                    if idempotent:
+                        continue
+                    break
+                self.breaker.record_success()
+                return resp
+            self.breaker.record_failure()
+            if self.breaker.state != 'closed':
+                metrics['cinetpay_circuit_open_total'] += 1
+            raise CinetPayUnavailable(str(last_error) or type(last_error).__name__)
+        finally:
+            if probe:
+                self.breaker.end_probe()
+
+cinetpay = CinetPayClient(
+    CINETPAY_BASE_URL,
+    CINETPAY_CONNECT_TIMEOUT,
+    CINETPAY_READ_TIMEOUT,
+    CINETPAY_MAX_RETRIES,
+    CircuitBreaker(CINETPAY_BREAKER_THRESHOLD, CINETPAY_BREAKER_COOLDOWN),
+)
+
+class PaymentInitInput(BaseModel):
+    user_id: str
+    amount_fcfa: Optional[int] = None  # ignored: sent by older apps, the price is SUBSCRIPTION_PRICE_FCFA
+
+def cinetpay_live() -> bool:
+    return CINETPAY_MODE.lower() == 'live' and bool(CINETPAY_API_KEY and CINETPAY_SITE_ID and BACKEND_PUBLIC_BASE_URL)
+
+@api.post("/payments/cinetpay/initiate")
+async def cinetpay_initiate(payload: PaymentInitInput):
+    try:
+        user_id = ObjectId(payload.user_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid user_id")
+
+    transaction_id = f"SUB_{uuid.uuid4().hex[:14]}"
+
+    tr_doc = {
+        'transaction_id': transaction_id,
+        'user_id': user_id,
+        'amount': SUBSCRIPTION_PRICE_FCFA,
+        'currency': 'XOF',
+        'status': 'PENDING',
+        'provider': 'cinetpay',
+        'payment_url': None,
+        'created_at': datetime.utcnow(),
+        'expires_at': datetime.utcnow() + timedelta(minutes=45)
+    }
+    await db.transactions.insert_one(tr_doc)
+
+    if not cinetpay_live():
+        stub_url = f"https://checkout.cinetpay.com/stub/{transaction_id}"
+        await db.transactions.update_one({'transaction_id': transaction_id}, {'$set': {'status': 'INITIALIZED', 'payment_url': stub_url}})
+        return {"transaction_id": transaction_id, "provider": "cinetpay", "payment_url": stub_url}
+
+    try:
+        cinetpay_payload = {
+            "apikey": CINETPAY_API_KEY,
+            "site_id": CINETPAY_SITE_ID,
+            "transaction_id": transaction_id,
+            "amount": SUBSCRIPTION_PRICE_FCFA,
+            "currency": "XOF",
+            "description": "Abonnement annuel Allô Services CI",
+            "notify_url": f"{BACKEND_PUBLIC_BASE_URL}/api/payments/cinetpay/webhook",
+            "return_url": f"{BACKEND_PUBLIC_BASE_URL}/api/payments/cinetpay/return",
+            "channels": "ALL",
+            "lang": "fr",
+        }
+        resp = await cinetpay.post("/v2/payment", cinetpay_payload)
+        data = resp.json() if resp.headers.get('content-type','').startswith('application/json') else {}
+        if resp.status_code != 200 or data.get('code') not in ("201","00"):
+            raise HTTPException(status_code=400, detail=data.get('message','CinetPay init failed'))
+        payment_url = data.get('data',{}).get('payment_url') or data.get('payment_url')
+        if not payment_url:
+            raise HTTPException(status_code=400, detail="No payment_url returned by CinetPay")
+        await db.transactions.update_one({'transaction_id': transaction_id}, {'$set': {'status': 'INITIALIZED', 'payment_url': payment_url}})
+        return {"transaction_id": transaction_id, "provider": "cinetpay", "payment_url": payment_url}
+    except HTTPException:
+        raise
+    except CinetPayUnavailable as e:
+        logger.warning(f"CinetPay unavailable for {transaction_id}: {e}")
+        raise HTTPException(status_code=503, detail="CinetPay indisponible, réessayez plus tard")
+    except Exception as e:
+        logger.exception("CinetPay init error")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# CinetPay notification fields, in the order they are concatenated for the x-token HMAC
+CINETPAY_TOKEN_FIELDS = (
+    'cpm_site_id', 'cpm_trans_id', 'cpm_trans_date', 'cpm_amount', 'cpm_currency', 'signature',
+    'payment_method', 'cel_phone_num', 'cpm_phone_prefixe', 'cpm_language', 'cpm_version',
+    'cpm_payment_config', 'cpm_page_action', 'cpm_custom', 'cpm_designation', 'cpm_error_message',
+)
+
+# Allowed transitions: a transaction only ever moves forward, terminal states never change
+# (EXPIRED only marks that no outcome was known before expires_at; a late ACCEPTED still applies)
+# MISMATCH: accepted by CinetPay for less than the price or in another currency; never activates
+TX_PREVIOUS_STATES = {
+    'INITIALIZED': ['PENDING'],
+    'ACCEPTED': ['PENDING', 'INITIALIZED', 'EXPIRED'],
+    'REFUSED': ['PENDING', 'INITIALIZED', 'EXPIRED'],
+    'MISMATCH': ['PENDING', 'INITIALIZED', 'EXPIRED'],
+    'EXPIRED': ['PENDING', 'INITIALIZED'],
+}
+TX_FINAL_STATES = ('ACCEPTED', 'REFUSED', 'MISMATCH')
+TX_OPEN_STATES = ('PENDING', 'INITIALIZED')
+
+def verify_cinetpay_token(fields: Dict[str, Any], token: str) -> bool:
+    if not CINETPAY_SECRET_KEY or not token:
+        return False
+    data = ''.join(str(fields.get(k, '')) for k in CINETPAY_TOKEN_FIELDS)
+    expected = hmac.new(CINETPAY_SECRET_KEY.encode(), data.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, token)
+
+async def cinetpay_check_status(transaction_id: str) -> Dict[str, Any]:
+    """Authoritative status from CinetPay (the notification itself carries no status)."""
+    resp = await cinetpay.post("/v2/payment/check", {
+        "apikey": CINETPAY_API_KEY,
+        "site_id": CINETPAY_SITE_ID,
+        "transaction_id": transaction_id,
+    }, idempotent=True)
+    data = resp.json() if resp.headers.get('content-type', '').startswith('application/json') else {}
+    return data.get('data') or {}
+
+async def collapse_subscriptions(user_id: ObjectId, other_user_ids: List[ObjectId]):
+    """
+    Folds every subscription of `user_id` and `other_user_ids` into the one with the latest
+    expiry, owned by `user_id` (subscriptions.user_id is unique).
+    """
+    docs = await db.subscriptions.find({'user_id': {'$in': [user_id, *other_user_ids]}}).sort('expires_at', -1).to_list(None)
+    if not docs or (len(docs) == 1 and docs[0]['user_id'] == user_id):
+        return
+    keep, rest = docs[0], docs[1:]
+    transactions = list(dict.fromkeys(t for d in docs for t in d.get('transactions') or []))
+    merged: Dict[str, Any] = {'user_id': user_id, 'transactions': transactions}
+    created = [d['created_at'] for d in docs if d.get('created_at')]
+    if created:
+        merged['created_at'] = min(created)
+    await db.subscriptions.delete_many({'_id': {'$in': [d['_id'] for d in rest]}})
+    await db.subscriptions.update_one({'_id': keep['_id']}, {'$set': merged})
+
+async def dedupe_subscriptions():
+    """Collapses users holding several subscription documents, ahead of the unique user_id index."""
+    dups = db.subscriptions.aggregate([
+        {'$group': {'_id': '$user_id', 'n': {'$sum': 1}}},
+        {'$match': {'n': {'$gt': 1}}},
+    ])
+    async for d in dups:
+        await collapse_subscriptions(d['_id'], [])
+        metrics['subscriptions_deduped_total'] += 1
+
+async def activate_subscription(user_id: ObjectId, transaction_id: str, now: datetime) -> Dict[str, Any]:
+    """
+    Creates the user's subscription or extends it from max(now, expires_at), in one
+    atomic update, then mirrors the expiry onto users.premium_until. Idempotent per
+    transaction: a transaction already listed on the subscription extends nothing, so
+    a replay after a crash is harmless.
+    """
+    applied = {'$in': [transaction_id, {'$ifNull': ['$transactions', []]}]}
+    update = [{'$set': {
+        'user_id': user_id,
+        'status': 'active',
+        'expires_at': {'$cond': [
+            applied, '$expires_at', {'$add': [{'$max': ['$expires_at', now]}, SUBSCRIPTION_DAYS * 86400 * 1000]},
+        ]},
+        'transactions': {'$cond': [
+            applied, '$transactions', {'$concatArrays': [{'$ifNull': ['$transactions', []]}, [transaction_id]]},
+        ]},
+        'created_at': {'$ifNull': ['$created_at', now]},
+        'updated_at': now,
+    }}]
+    try:
+        sub = await db.subscriptions.find_one_and_update(
+            {'user_id': user_id}, update, upsert=True, return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # concurrent first activation for this user inserted it; apply on top of it
+        sub = await db.subscriptions.find_one_and_update(
+            {'user_id': user_id}, update, return_document=ReturnDocument.AFTER,
+        )
+    await db.users.update_one(
+        {'_id': user_id},
+        {'$max': {'premium_until': sub['expires_at']}, '$set': {'is_premium': True}},
+    )
+    await db.push_tokens.update_many({'user_id': user_id}, {'$set': {'is_premium': True, 'premium_until': sub['expires_at']}})
+    entitlements.pop(user_id)
+    return sub
+
+def _provider_status(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: data.get(k) for k in ('status', 'payment_method', 'operator_id', 'payment_date', 'amount', 'currency') if k in data}
+
+def confirmed_status(tr: Dict[str, Any], status: str, data: Optional[Dict[str, Any]]) -> str:
+    """
+    ACCEPTED only if CinetPay confirms at least the price, in XOF; otherwise MISMATCH.
+    The price is the one stored at initiate (never below the current one: older
+    transactions may carry a client-supplied amount).
+    """
+    if status != 'ACCEPTED':
+        return status
+    data = data or {}
+    try:
+        paid = float(data.get('amount'))
+    except (TypeError, ValueError):
+        paid = 0.0
+    price = max(tr.get('amount') or 0, SUBSCRIPTION_PRICE_FCFA)
+    if paid >= price and str(data.get('currency') or '').upper() == 'XOF':
+        return status
+    logger.warning(f"Payment mismatch for {tr.get('transaction_id')}: {data.get('amount')} {data.get('currency')} for a price of {price} XOF")
+    metrics['transactions_mismatch_detected_total'] += 1
+    return 'MISMATCH'
+
+async def apply_transaction_status(transaction_id: str, status: str, provider_data: Optional[Dict[str, Any]] = None) -> bool:
+    """
+    Moves a transaction to `status` if it is a forward transition. On ACCEPTED the
+    subscription is activated *before* the transaction is finalized: both side effects are
+    idempotent per transaction_id, so if anything fails in between, the transaction is still
+    open and the provider's retry (or the reconciliation sweep) replays them harmlessly.
+    The final write is a compare-and-set on the status, so it is applied and counted once.
+    """
+    tr = await db.transactions.find_one({'transaction_id': transaction_id}, {'transaction_id': 1, 'user_id': 1, 'amount': 1, 'status': 1})
+    if not tr:
+        return False
+    status = confirmed_status(tr, status, provider_data)
+    previous = TX_PREVIOUS_STATES.get(status, [])
+    if tr['status'] not in previous:
+        return False
+    now = datetime.utcnow()
+    if status == 'ACCEPTED':
+        await activate_subscription(tr['user_id'], transaction_id, now)
+        await record_payment(tr['user_id'], transaction_id, tr.get('amount') or 0, now)
+    updates: Dict[str, Any] = {'status': status, 'updated_at': now}
+    if provider_data:
+        updates['provider_status'] = _provider_status(provider_data)
+    res = await db.transactions.update_one(
+        {'transaction_id': transaction_id, 'status': {'$in': previous}},
+        {'$set': updates},
+    )
+    if not res.modified_count:
+        return False
+    metrics[f'transactions_{status.lower()}_total'] += 1
+    return True
+
+async def record_payment(user_id: ObjectId, transaction_id: str, amount: int, paid_at: datetime):
+    """
+    Maintains the per-user payment summary as counters (keyed by user _id, so upserts cannot
+    race). Idempotent per transaction: transaction_ids records what was already counted.
+    """
+    counted = {'$in': [transaction_id, {'$ifNull': ['$transaction_ids', []]}]}
+    await db.payment_summaries.update_one(
+        {'_id': user_id},
+        [{'$set': {
+            'total_paid': {'$cond': [counted, '$total_paid', {'$add': [{'$ifNull': ['$total_paid', 0]}, amount]}]},
+            'payments_count': {'$cond': [counted, '$payments_count', {'$add': [{'$ifNull': ['$payments_count', 0]}, 1]}]},
+            'last_payment_at': {'$cond': [counted, '$last_payment_at', {'$max': ['$last_payment_at', paid_at]}]},
+            'last_transaction_id': {'$cond': [counted, '$last_transaction_id', transaction_id]},
+            'transaction_ids': {'$cond': [
+                counted, '$transaction_ids', {'$concatArrays': [{'$ifNull': ['$transaction_ids', []]}, [transaction_id]]},
+            ]},
+            'currency': 'XOF',
+        }}],
+        upsert=True,
+    )
+
+# ---------- PAYMENTS: reconciliation worker ----------
+async def _reconcile_batch(batch: List[Dict[str, Any]], sem: asyncio.Semaphore, run_id: str) -> int:
+    """
+    Checks a batch against CinetPay concurrently, activates the accepted ones (each on its
+    own, so one failure does not cost the others), then applies every final state with one
+    bulk_write. A transaction whose activation failed stays open for the next pass.
+    """
+    async def check(tr):
+        async with sem:
+            try:
+                return tr, await cinetpay_check_status(tr['transaction_id'])
+            except CinetPayUnavailable:
+                metrics['reconcile_errors_total'] += 1
+                return tr, None
+            except Exception as e:
+                # one malformed answer must not abort the batch: skip it, retry next pass
+                logger.error(f"Reconcile: status check failed for {tr['transaction_id']}: {e!r}")
+                metrics['reconcile_errors_total'] += 1
+                return tr, None
+
+    async def activate(tr):
+        await activate_subscription(tr['user_id'], tr['transaction_id'], now)
+        await record_payment(tr['user_id'], tr['transaction_id'], tr.get('amount') or 0, now)
+
+    results = await asyncio.gather(*(check(tr) for tr in batch))
+    metrics['reconcile_checked_total'] += len(batch)
+    now = datetime.utcnow()
+    final = []
+    for tr, data in results:
+        if data is None:
+            continue
+        status = str(data.get('status') or '').upper()
+        if status not in TX_FINAL_STATES:
+            if not (tr.get('expires_at') and tr['expires_at'] < now):
+                continue
+            status = 'EXPIRED'
+        final.append((tr, data, confirmed_status(tr, status, data)))
+    accepted = [tr for tr, _, status in final if status == 'ACCEPTED']
+    failed = set()
+    for tr, outcome in zip(accepted, await asyncio.gather(*(activate(tr) for tr in accepted), return_exceptions=True)):
+        if isinstance(outcome, Exception):
+            logger.error(f"Reconcile: activation failed for {tr['transaction_id']}: {outcome!r}")
+            metrics['reconcile_errors_total'] += 1
+            failed.add(tr['_id'])
+    ops = []
+    for tr, data, status in final:
+        if tr['_id'] in failed:
+            continue
+        ops.append(UpdateOne(
+            {'_id': tr['_id'], 'status': {'$in': TX_PREVIOUS_STATES[status]}},
+            {'$set': {'status': status, 'updated_at': now, 'reconciled_by': run_id, 'provider_status': _provider_status(data)}},
+        ))
+    if not ops:
+        return 0
+    res = await db.transactions.bulk_write(ops, ordered=False)
+    metrics['reconcile_applied_total'] += res.modified_count
+    return res.modified_count
+
+async def reconcile_transactions() -> Dict[str, Any]:
+    """
+    One pass over open transactions older than RECONCILE_MIN_AGE_MIN, oldest first,
+    streamed from the (status, created_at) index in RECONCILE_BATCH_SIZE batches.
+    """
+    t0 = time.perf_counter()
+    run_id = uuid.uuid4().hex
+    sem = asyncio.Semaphore(RECONCILE_CONCURRENCY)
+    cutoff = datetime.utcnow() - timedelta(minutes=RECONCILE_MIN_AGE_MIN)
+    cur = db.transactions.find(
+        {'status': {'$in': list(TX_OPEN_STATES)}, 'created_at': {'$lt': cutoff}},
+        {'transaction_id': 1, 'user_id': 1, 'amount': 1, 'expires_at': 1, 'created_at': 1},
+    ).sort('created_at', 1).batch_size(RECONCILE_BATCH_SIZE)
+    checked = applied = 0
+    lag_s = 0.0
+    batch: List[Dict[str, Any]] = []
+    async for tr in cur:
+        if not checked and not batch:
+            lag_s = (datetime.utcnow() - tr['created_at']).total_seconds()
+        batch.append(tr)
+        if len(batch) >= RECONCILE_BATCH_SIZE:
+            applied += await _reconcile_batch(batch, sem, run_id)
+            checked += len(batch)
+            batch = []
+            if cinetpay.breaker.state == 'open':
+                logger.warning("Reconciliation stopped early: CinetPay circuit open")
+                break
+    else:
+        if batch:
+            applied += await _reconcile_batch(batch, sem, run_id)
+            checked += len(batch)
+    duration = time.perf_counter() - t0
+    metrics['reconcile_runs_total'] += 1
+    metrics['reconcile_last_duration_s'] = duration
+    metrics['reconcile_last_throughput_per_s'] = checked / duration if duration else 0.0
+    metrics['reconcile_lag_s'] = lag_s
+    return {'checked': checked, 'applied': applied, 'duration_s': duration, 'lag_s': lag_s}
+
+async def reconcile_loop():
+    while True:
+        await asyncio.sleep(RECONCILE_INTERVAL_S)
+        try:
+            summary = await reconcile_transactions()
+            if summary['checked']:
+                logger.info(f"Reconciled transactions: {summary}")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Reconciliation run failed")
+
+HISTORY_PROJECTION = {'transaction_id': 1, 'amount': 1, 'currency': 1, 'status': 1, 'provider': 1, 'created_at': 1, 'updated_at': 1}
+
+_EPOCH = datetime(1970, 1, 1)
+
+def _encode_cursor(created_at: datetime, oid: ObjectId) -> str:
+    return f"{(created_at - _EPOCH) // timedelta(milliseconds=1)}_{oid}"
+
+def _decode_cursor(cursor: str) -> tuple:
+    ms, oid = cursor.split('_', 1)
+    return _EPOCH + timedelta(milliseconds=int(ms)), ObjectId(oid)
+
+@api.get("/payments/history")
+async def payments_history(
+    response: Response,
+    user_id: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    limit: int = Query(50),
+    cursor: Optional[str] = Query(None),
+    claims: Optional[Dict[str, Any]] = Depends(session_claims),
+):
+    """
+    Newest-first transactions of the signed-in user, keyset-paginated on (created_at, _id).
+    The cursor for the next page is returned in the X-Next-Cursor header.
+    """
+    uid = require_owner(user_id, claims)
+    criteria: Dict[str, Any] = {'user_id': uid}
+    if status:
+        criteria['status'] = status.upper()
+    if cursor:
+        try:
+            c_at, c_id = _decode_cursor(cursor)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        criteria['$or'] = [{'created_at': {'$lt': c_at}}, {'created_at': c_at, '_id': {'$lt': c_id}}]
+    limit = max(1, min(limit, 100))
+    cur = db.transactions.find(criteria, HISTORY_PROJECTION).sort([('created_at', -1), ('_id', -1)]).limit(limit + 1)
+    out = []
+    last = None
+    async for t in cur:
+        if len(out) == limit:
+            response.headers['X-Next-Cursor'] = _encode_cursor(last['created_at'], last['_id'])
+            break
+        last = dict(t)
+        out.append(_doc_out(t))
+    return out
+
+@api.get("/payments/summary")
+async def payments_summary(user_id: Optional[str] = None, claims: Optional[Dict[str, Any]] = Depends(session_claims)):
+    uid = require_owner(user_id, claims)
+    summary = await db.payment_summaries.find_one({'_id': uid}, {'_id': 0, 'transaction_ids': 0})
+    if not summary:
+        return {"total_paid": 0, "payments_count": 0, "currency": "XOF", "last_payment_at": None, "last_transaction_id": None}
+    return summary
+
+@api.get("/payments/cinetpay/webhook")
+async def cinetpay_webhook_ping():
+    # CinetPay checks that the notify_url answers before posting to it
+    return {"status": "ok"}
+
+@api.post("/payments/cinetpay/webhook")
+async def cinetpay_webhook(request: Request):
+    form = await request.form()
+    fields = {k: v for k, v in form.items()}
+    if not verify_cinetpay_token(fields, request.headers.get('x-token', '')):
+        metrics['cinetpay_webhook_rejected_total'] += 1
+        raise HTTPException(status_code=401, detail="Invalid signature")
+    if CINETPAY_SITE_ID and str(fields.get('cpm_site_id')) != str(CINETPAY_SITE_ID):
+        raise HTTPException(status_code=400, detail="Unknown site_id")
+    transaction_id = fields.get('cpm_trans_id')
+    if not transaction_id:
+        raise HTTPException(status_code=400, detail="Missing cpm_trans_id")
+
+    metrics['cinetpay_webhook_total'] += 1
+    tr = await db.transactions.find_one({'transaction_id': transaction_id}, {'transaction_id': 1, 'amount': 1, 'status': 1})
+    if not tr:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+    if tr['status'] in TX_FINAL_STATES:
+        # provider retry of an already applied notification
+        metrics['cinetpay_webhook_duplicates_total'] += 1
+        return {"transaction_id": transaction_id, "status": tr['status'], "duplicate": True}
+
+    try:
+        data = await cinetpay_check_status(transaction_id)
+    except CinetPayUnavailable:
+        # non-200 makes CinetPay retry the notification later
+        raise HTTPException(status_code=503, detail="CinetPay check unavailable")
+    status = str(data.get('status') or '').upper()
+    if status not in TX_FINAL_STATES:
+        return {"transaction_id": transaction_id, "status": tr['status'], "duplicate": False}
+    status = confirmed_status(tr, status, data)
+    applied = await apply_transaction_status(transaction_id, status, data)
+    if not applied:
+        metrics['cinetpay_webhook_duplicates_total'] += 1
+    return {"transaction_id": transaction_id, "status": status, "duplicate": not applied}
+
+# ---------- CATEGORIES ----------
+# Served from an in-memory snapshot: every body is serialized, hashed and gzipped once per
+# reload, so a request is a dict lookup and an app launch with a cached copy is a 304.
+# The snapshot reloads right after a local write and at most CATEGORIES_MAX_AGE_S later on
+# other instances; the ETag is a content hash, so a reload without changes keeps it.
+CATEGORIES_SEED_PATH = os.path.join(ROOT_DIR, 'data', 'categories.json')
+
+class CategoryIn(BaseModel):
+    title: str
+    icon: Optional[str] = None
+    is_premium: bool = True
+    order: int = 0
+    items: List[Dict[str, Any]] = Field(default_factory=list)
+
+class CachedBody:
+    __slots__ = ('body', 'gzipped', 'etag')
+
+    def __init__(self, payload: Any):
+        self.body = json.dumps(payload, ensure_ascii=False, separators=(',', ':'), default=str).encode()
+        self.gzipped = gzip.compress(self.body, compresslevel=9, mtime=0)
+        self.etag = '"' + hashlib.blake2b(self.body, digest_size=12).hexdigest() + '"'
+
+    def response(self, request: Request) -> Response:
+        headers = {'ETag': self.etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+        if_none_match = request.headers.get('if-none-match')
+        if if_none_match:
+            tags = [t.strip().removeprefix('W/') for t in if_none_match.split(',')]
+            if '*' in tags or self.etag in tags:
+                metrics['categories_not_modified_total'] += 1
+                return Response(status_code=304, headers=headers)
+        if 'gzip' in request.headers.get('accept-encoding', ''):
+            return Response(self.gzipped, media_type='application/json', headers={**headers, 'Content-Encoding': 'gzip'})
+        return Response(self.body, media_type='application/json', headers=headers)
+
+class CategorySnapshot:
+    def __init__(self, max_age_s: float):
+        self.max_age_s = max_age_s
+        self.listing: Optional[CachedBody] = None
+        self.by_slug: Dict[str, CachedBody] = {}
+        self.loaded_at: Optional[float] = None
+        self._reloading: Optional[asyncio.Task] = None
+
+    async def ensure_fresh(self):
+        if self.loaded_at is None:
+            await self.reload()
+        elif time.monotonic() - self.loaded_at > self.max_age_s and (self._reloading is None or self._reloading.done()):
+            # serve the current snapshot while the next one loads
+            self._reloading = asyncio.create_task(self.reload())
+
+    async def reload(self):
+        docs = await db.categories.find({}, {'_id': 0, 'created_at': 0, 'updated_at': 0}).sort([('order', 1), ('slug', 1)]).to_list(None)
+        listing = [
+            {**{k: d.get(k) for k in ('slug', 'title', 'icon', 'is_premium', 'order')}, 'items_count': len(d.get('items') or [])}
+            for d in docs
+        ]
+        by_slug = {d['slug']: CachedBody(d) for d in docs}
+        # swap both at once; in-flight requests keep the objects they already hold
+        self.listing, self.by_slug = CachedBody(listing), by_slug
+        self.loaded_at = time.monotonic()
+        metrics['categories_reloads_total'] += 1
+        metrics['categories_count'] = len(docs)
+
+category_snapshot = CategorySnapshot(CATEGORIES_MAX_AGE_S)
+
+def is_admin(x_admin_key: Optional[str]) -> bool:
+    return bool(ADMIN_API_KEY and x_admin_key and hmac.compare_digest(ADMIN_API_KEY, x_admin_key))
+
+def require_admin(x_admin_key: Optional[str] = Header(None)):
+    if not is_admin(x_admin_key):
+        raise HTTPException(status_code=403, detail="Admin key required")
+
+async def seed_categories() -> int:
+    """Inserts bundled categories whose slug is missing; never overwrites edited ones."""
+    with open(CATEGORIES_SEED_PATH, encoding='utf-8') as f:
+        seed = json.load(f)
+    now = datetime.utcnow()
+    ops = [UpdateOne({'slug': c['slug']}, {'$setOnInsert': {**c, 'created_at': now, 'updated_at': now}}, upsert=True) for c in seed]
+    res = await db.categories.bulk_write(ops, ordered=False)
+    if res.upserted_count:
+        logger.info("Seeded %d categories", res.upserted_count)
+        await category_snapshot.reload()
+        retrieval_index.mark_dirty()
+    return res.upserted_count
+
+@api.post('/seed')
+async def seed():
+    inserted = await seed_categories()
+    return {"status": "ok", "categories_inserted": inserted}
+
+@api.get('/categories')
+async def list_categories(request: Request):
+    await category_snapshot.ensure_fresh()
+    return category_snapshot.listing.response(request)
+
+@api.get('/categories/{slug}')
+async def get_category(slug: str, request: Request):
+    await category_snapshot.ensure_fresh()
+    cached = category_snapshot.by_slug.get(slug)
+    if cached is None:
+        raise HTTPException(status_code=404, detail="Category not found")
+    return cached.response(request)
+
+@api.put('/categories/{slug}', dependencies=[Depends(require_admin)])
+async def upsert_category(slug: str, payload: CategoryIn):
+    now = datetime.utcnow()
+    await db.categories.update_one(
+        {'slug': slug},
+        {'$set': {**payload.model_dump(), 'updated_at': now}, '$setOnInsert': {'created_at': now}},
+        upsert=True,
+    )
+    await category_snapshot.reload()
+    retrieval_index.mark_dirty()
+    return {"slug": slug, "etag": category_snapshot.by_slug[slug].etag}
+
+# ---------- LOCATIONS ----------
+# region -> city -> commune (-> quartier), materialized in memory at startup: every node
+# carries its ancestor ids and names, and a prefix trie over accent-folded names (and each
+# word suffix, so "bouet" finds Port-Bouët) answers autocomplete without touching Mongo.
+LOCATIONS_SEED_PATH = os.path.join(ROOT_DIR, 'data', 'locations.json')
+LOCATION_LEVELS = ('region', 'city', 'commune', 'quartier')
+AUTOCOMPLETE_NODE_CAP = 32
+# people mostly type the city they live in
+AUTOCOMPLETE_LEVEL_RANK = {'city': 0, 'commune': 1, 'region': 2, 'quartier': 3}
+
+def _location_id(parent_id: Optional[str], name: str) -> str:
+    slug = _normalize_text(name).replace(' ', '-')
+    return f"{parent_id}.{slug}" if parent_id else slug
+
+class LocationTree:
+    def __init__(self):
+        self.nodes: Dict[str, Dict[str, Any]] = {}
+        self.children: Dict[Optional[str], List[str]] = {}
+        self.trie: Dict[str, Any] = {}
+
+    def load(self, docs: List[Dict[str, Any]]):
+        by_id = {d['_id']: d for d in docs}
+        nodes: Dict[str, Dict[str, Any]] = {}
+
+        def materialize(nid: str) -> Dict[str, Any]:
+            if nid in nodes:
+                return nodes[nid]
+            d = by_id[nid]
+            parent = materialize(d['parent_id']) if d.get('parent_id') in by_id else None
+            nodes[nid] = {
+                'id': nid,
+                'name': d['name'],
+                'level': d['level'],
+                'parent_id': parent['id'] if parent else None,
+                'path_ids': (parent['path_ids'] if parent else []) + [nid],
+                'path': (parent['path'] if parent else []) + [d['name']],
+                'aliases': d.get('aliases') or [],
+            }
+            return nodes[nid]
+
+        for nid in by_id:
+            materialize(nid)
+        children: Dict[Optional[str], List[str]] = defaultdict(list)
+        for node in nodes.values():
+            children[node['parent_id']].append(node['id'])
+        for ids in children.values():
+            ids.sort(key=lambda i: _normalize_text(nodes[i]['name']))
+
+        # best candidates first, so the capped list kept on each trie node is the top of the ranking
+        trie: Dict[str, Any] = {}
+        ranked = sorted(nodes.values(), key=lambda n: (AUTOCOMPLETE_LEVEL_RANK[n['level']], len(n['name']), n['name']))
+        for node in ranked:
+            for label in [node['name'], *node['aliases']]:
+                words = _normalize_text(label).split()
+                for i in range(len(words)):
+                    cur = trie
+                    for ch in ' '.join(words[i:]):
+                        cur = cur.setdefault(ch, {})
+                        hits = cur.setdefault('', [])
+                        if len(hits) < AUTOCOMPLETE_NODE_CAP and node['id'] not in hits:
+                            hits.append(node['id'])
+
+        # swap in one go; readers never see a half-built tree
+        self.nodes, self.children, self.trie = nodes, dict(children), trie
+        metrics['locations_count'] = len(nodes)
+
+    def get(self, location_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        return self.nodes.get(location_id) if location_id else None
+
+    def ancestor(self, node: Dict[str, Any], level: str) -> Optional[Dict[str, Any]]:
+        return next((self.nodes[i] for i in node['path_ids'] if self.nodes[i]['level'] == level), None)
+
+    def complete(self, prefix: str, limit: int, level: Optional[str] = None) -> List[Dict[str, Any]]:
+        cur = self.trie
+        for ch in _normalize_text(prefix):
+            cur = cur.get(ch)
+            if cur is None:
+                return []
+        ids = cur.get('', [])
+        out = [self.nodes[i] for i in ids if level is None or self.nodes[i]['level'] == level]
+        return out[:limit]
+
+    def public(self, node: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'id': node['id'], 'name': node['name'], 'level': node['level'], 'parent_id': node['parent_id'],
+            'path': node['path'], 'has_children': bool(self.children.get(node['id'])),
+        }
+
+location_tree = LocationTree()
+
+async def seed_locations() -> int:
+    """Inserts bundled locations whose id is missing (ids are slugs of the ancestor path)."""
+    with open(LOCATIONS_SEED_PATH, encoding='utf-8') as f:
+        seed = json.load(f)
+    ops = []
+
+    def walk(items: List[Dict[str, Any]], parent_id: Optional[str], depth: int):
+        for item in items:
+            nid = _location_id(parent_id, item['name'])
+            doc = {'name': item['name'], 'level': LOCATION_LEVELS[depth], 'parent_id': parent_id, 'aliases': item.get('aliases', [])}
+            ops.append(UpdateOne({'_id': nid}, {'$setOnInsert': doc}, upsert=True))
+            walk(item.get('children', []), nid, depth + 1)
+
+    walk(seed, None, 0)
+    res = await db.locations.bulk_write(ops, ordered=False)
+    if res.upserted_count:
+        logger.info("Seeded %d locations", res.upserted_count)
+    return res.upserted_count
+
+async def load_locations():
+    location_tree.load(await db.locations.find({}).to_list(None))
+
+@api.get('/locations/children')
+async def location_children(parent_id: Optional[str] = None):
+    """Direct children of parent_id; the regions when omitted."""
+    if parent_id and parent_id not in location_tree.nodes:
+        raise HTTPException(status_code=404, detail="Location not found")
+    return [location_tree.public(location_tree.nodes[i]) for i in location_tree.children.get(parent_id, [])]
+
+@api.get('/locations/autocomplete')
+async def location_autocomplete(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=AUTOCOMPLETE_NODE_CAP),
+    level: Optional[Literal['region', 'city', 'commune', 'quartier']] = None,
+):
+    t0 = time.perf_counter()
+    out = [location_tree.public(n) for n in location_tree.complete(q, limit, level)]
+    metrics['locations_autocomplete_total'] += 1
+    metrics['locations_autocomplete_us_sum'] += (time.perf_counter() - t0) * 1e6
+    return out
+
+@api.get('/locations/{location_id}')
+async def get_location(location_id: str):
+    node = location_tree.get(location_id)
+    if node is None:
+        raise HTTPException(status_code=404, detail="Location not found")
+    return {
+        **location_tree.public(node),
+        'ancestors': [{'id': i, 'name': location_tree.nodes[i]['name'], 'level': location_tree.nodes[i]['level']} for i in node['path_ids'][:-1]],
+    }
+
+def resolve_city_id(city_id: str) -> Dict[str, Any]:
+    """Validates a user's city_id and returns the denormalized city/commune names to store with it."""
+    node = location_tree.get(city_id)
+    if node is None or node['level'] == 'region':
+        raise HTTPException(status_code=400, detail="Unknown city_id")
+    city = location_tree.ancestor(node, 'city')
+    commune = location_tree.ancestor(node, 'commune')
+    return {'city_id': city_id, 'city': city['name'] if city else node['name'], 'commune': commune['name'] if commune else None}
+
+# ---------- LOCATIONS: reverse geocoding ----------
+GEO_BOUNDARIES_PATH = os.environ.get('GEO_BOUNDARIES_PATH', os.path.join(ROOT_DIR, 'data', 'communes.geojson'))
+GEO_BACKFILL_BATCH = int(os.environ.get('GEO_BACKFILL_BATCH', '1000'))
+
+class ReverseGeocoder:
+    """
+    Commune polygons from GeoJSON, kept as flat numpy edge arrays. A lookup filters
+    polygons by bounding box, then runs an even-odd ray cast over all edges of each
+    candidate at once; locate_many does the same for a whole batch of points per polygon.
+    Features marked `outline` clip the communes: a point outside all of them (at sea) is
+    in no commune. `version` is a hash of the file, stored with every tag it produced.
+    Longitude is x, latitude is y, as in GeoJSON.
+    """
+
+    def __init__(self):
+        self.props: List[Dict[str, Any]] = []
+        self.bbox = np.empty((0, 4))
+        self.edges: List[np.ndarray] = []
+        self.outlines: List[np.ndarray] = []
+        self.by_location: Dict[str, Dict[str, Any]] = {}
+        self.version: Optional[str] = None
+
+    def load(self, path: str):
+        with open(path, 'rb') as f:
+            raw = f.read()
+        collection = json.loads(raw)
+        props, boxes, edges, outlines = [], [], [], []
+        for feature in collection.get('features', []):
+            geometry = feature.get('geometry') or {}
+            if geometry.get('type') == 'Polygon':
+                polygons = [geometry['coordinates']]
+            elif geometry.get('type') == 'MultiPolygon':
+                polygons = geometry['coordinates']
+            else:
+                continue
+            # outer rings and holes alike: even-odd crossing counts handle holes
+            segs = []
+            for polygon in polygons:
+                for ring in polygon:
+                    pts = np.asarray(ring, dtype=float)[:, :2]
+                    segs.append(np.hstack([pts[:-1], pts[1:]]))
+            e = np.vstack(segs)
+            if (feature.get('properties') or {}).get('outline'):
+                outlines.append(e)
+                continue
+            props.append(feature.get('properties') or {})
+            boxes.append([e[:, [0, 2]].min(), e[:, [1, 3]].min(), e[:, [0, 2]].max(), e[:, [1, 3]].max()])
+            edges.append(e)
+        self.props, self.bbox, self.edges, self.outlines = props, np.asarray(boxes).reshape(-1, 4), edges, outlines
+        self.by_location = {p['location_id']: p for p in props if p.get('location_id')}
+        self.version = hashlib.sha256(raw).hexdigest()[:12]
+        metrics['geo_polygons'] = len(props)
+
+    @staticmethod
+    def _inside(e: np.ndarray, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """points (x, y) x edges -> bool per point"""
+        x1, y1, x2, y2 = (e[:, i][None, :] for i in range(4))
+        px, py = x[:, None], y[:, None]
+        straddles = (y1 > py) != (y2 > py)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+        return (np.count_nonzero(straddles & (px < x_cross), axis=1) % 2) == 1
+
+    def locate(self, lat: Optional[float], lng: Optional[float]) -> Optional[Dict[str, Any]]:
+        if lat is None or lng is None or not len(self.props):
+            return None
+        return self.locate_many([lat], [lng])[0]
+
+    def locate_many(self, lats: List[float], lngs: List[float]) -> List[Optional[Dict[str, Any]]]:
+        x, y = np.asarray(lngs, dtype=float), np.asarray(lats, dtype=float)
+        found = np.full(len(x), -1)
+        if self.outlines:
+            # -2: outside the district, never looked up
+            on_land = np.zeros(len(x), dtype=bool)
+            for e in self.outlines:
+                on_land |= self._inside(e, x, y)
+            found[~on_land] = -2
+        for i, (minx, miny, maxx, maxy) in enumerate(self.bbox):
+            cand = np.nonzero((found == -1) & (x >= minx) & (x <= maxx) & (y >= miny) & (y <= maxy))[0]
+            if len(cand):
+                found[cand[self._inside(self.edges[i], x[cand], y[cand])]] = i
+        return [self.props[i] if i >= 0 else None for i in found]
+
+geocoder = ReverseGeocoder()
+
+def _geo_filled(doc: Dict[str, Any]) -> set:
+    """The city/commune fields an earlier geocoding filled in (as opposed to given by the author)."""
+    if 'geo_fields' in doc:
+        return set(doc['geo_fields'] or [])
+    if not doc.get('geo_tagged_at'):
+        return set()
+    # tagged before geo_fields was recorded: a commune equal to its polygon's came from it
+    # (not the city: every polygon is in Abidjan, so an equal city says nothing)
+    place = geocoder.by_location.get(doc.get('location_id')) or {}
+    return {'commune'} if doc.get('commune') and doc['commune'] == place.get('commune') else set()
+
+def geo_tags(doc: Dict[str, Any], place: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Fields to set on a document from its geocoded place. A city or commune given by the
+    author is never overwritten; one filled by an earlier geocoding is replaced, or
+    cleared when the point is no longer in any commune.
+    """
+    filled = _geo_filled(doc)
+    tags: Dict[str, Any] = {'location_id': (place or {}).get('location_id'), 'geo_version': geocoder.version, 'geo_fields': []}
+    for key in ('commune', 'city'):
+        if place and place.get(key) and (not doc.get(key) or key in filled):
+            tags[key] = place[key]
+            tags['geo_fields'].append(key)
+        elif key in filled:
+            tags[key] = None
+    return tags
+
+def doc_coords(doc: Dict[str, Any]) -> Optional[tuple]:
+    """(lat, lng) from top-level lat/lng (alerts, push tokens) or a GeoJSON `location` point (facilities, pharmacies)."""
+    lat, lng = doc.get('lat'), doc.get('lng')
+    if isinstance(lat, (int, float)) and isinstance(lng, (int, float)):
+        return float(lat), float(lng)
+    coords = (doc.get('location') or {}).get('coordinates')
+    if isinstance(coords, (list, tuple)) and len(coords) == 2:
+        return float(coords[1]), float(coords[0])
+    return None
+
+async def backfill_geo_tags(collection: str) -> Dict[str, int]:
+    """
+    Tags every document with coordinates that was never geocoded, or was geocoded against
+    another version of the boundaries, GEO_BACKFILL_BATCH at a time.
+    """
+    coll = db[collection]
+    criteria = {
+        'geo_version': {'$ne': geocoder.version},
+        '$or': [
+            {'lat': {'$type': 'number'}, 'lng': {'$type': 'number'}},
+            {'location.coordinates': {'$type': 'number'}},
+        ],
+    }
+    scanned = tagged = 0
+    last_id = None
+    while True:
+        q = {**criteria, '_id': {'$gt': last_id}} if last_id else criteria
+        batch = await coll.find(q, {'lat': 1, 'lng': 1, 'location': 1, 'city': 1, 'commune': 1, 'location_id': 1, 'geo_fields': 1, 'geo_tagged_at': 1}).sort('_id', 1).limit(GEO_BACKFILL_BATCH).to_list(GEO_BACKFILL_BATCH)
+        if not batch:
+            break
+        now = datetime.utcnow()
+        coords = [doc_coords(d) or (float('nan'), float('nan')) for d in batch]
+        places = geocoder.locate_many([c[0] for c in coords], [c[1] for c in coords])
+        ops = []
+        for d, place in zip(batch, places):
+            tags = geo_tags(d, place)
+            tagged += bool(tags['location_id'])
+            ops.append(UpdateOne({'_id': d['_id']}, {'$set': {**tags, 'geo_tagged_at': now}}))
+        await coll.bulk_write(ops, ordered=False)
+        scanned += len(batch)
+        last_id = batch[-1]['_id']
+    metrics[f'geo_backfill_{collection}_tagged_total'] += tagged
+    return {'scanned': scanned, 'tagged': tagged}
+
+@api.get('/geo/reverse')
+async def reverse_geocode(lat: float, lng: float):
+    place = geocoder.locate(lat, lng)
+    if place is None:
+        raise HTTPException(status_code=404, detail="No commune at this position")
+    return place
+
+@api.post('/admin/geo/backfill', dependencies=[Depends(require_admin)])
+async def geo_backfill(
+    collections: List[Literal['alerts', 'health_facilities', 'pharmacies', 'push_tokens']] = Query(['alerts', 'health_facilities', 'pharmacies', 'push_tokens']),
+):
+    return {c: await backfill_geo_tags(c) for c in collections}
+
+# ---------- JOBS ----------
+# List items come from a projection that leaves out `description`; the short `summary`
+# is computed once at insert, so the feed never loads full texts.
+JOB_LIST_PROJECTION = {
+    'title': 1, 'company': 1, 'city': 1, 'commune': 1, 'sector': 1, 'contract_type': 1,
+    'salary': 1, 'summary': 1, 'posted_at': 1,
+}
+JOB_SUMMARY_CHARS = 160
+JOB_MIGRATION_BATCH = int(os.environ.get('JOB_MIGRATION_BATCH', '1000'))
+
+def _job_summary(description: str) -> str:
+    text = ' '.join(description.split())
+    if len(text) <= JOB_SUMMARY_CHARS:
+        return text
+    return text[:JOB_SUMMARY_CHARS].rsplit(' ', 1)[0] + '…'
+
+async def migrate_job_cities() -> int:
+    """
+    One-off: adds city_key (the city as _normalize_text folds it) to jobs posted before the
+    feed filtered on it, JOB_MIGRATION_BATCH at a time. Resumes by itself (it only picks
+    jobs without city_key) and is recorded in db.migrations once nothing is left.
+    """
+    if await db.migrations.find_one({'_id': 'jobs_city_key'}):
+        return 0
+    migrated = 0
+    while True:
+        batch = await db.jobs.find({'city_key': {'$exists': False}}, {'city': 1}).limit(JOB_MIGRATION_BATCH).to_list(JOB_MIGRATION_BATCH)
+        if not batch:
+            break
+        await db.jobs.bulk_write([UpdateOne({'_id': j['_id']}, {'$set': {'city_key': _normalize_text(j.get('city'))}}) for j in batch], ordered=False)
+        migrated += len(batch)
+    metrics['jobs_city_key_migrated_total'] += migrated
+    await db.migrations.update_one({'_id': 'jobs_city_key'}, {'$set': {'done_at': datetime.utcnow(), 'migrated': migrated}}, upsert=True)
+    return migrated
+
+@api.post('/jobs', dependencies=[Depends(require_admin)])
+async def create_job(payload: JobCreate):
+    doc = payload.model_dump()
+    now = datetime.utcnow()
+    doc['_id'] = ObjectId()
+    doc['posted_at'] = doc.get('posted_at') or now
+    doc['created_at'] = now
+    doc['sector'] = doc['sector'].strip().lower()
+    # the feed filters on city_key, so "Bouaké", "bouake" and "BOUAKE " are one city
+    doc['city_key'] = _normalize_text(doc['city'])
+    doc['summary'] = _job_summary(doc['description'])
+    await db.jobs.insert_one(doc)
+    dispatch_matches('job', doc)
+    return _doc_out(doc)
+
+@api.get('/jobs')
+async def list_jobs(
+    response: Response,
+    city: Optional[str] = None,
+    sector: Optional[str] = None,
+    contract_type: Optional[ContractType] = None,
+    q: Optional[str] = Query(None, max_length=200),
+    limit: int = Query(20),
+    cursor: Optional[str] = Query(None),
+):
+    """
+    Newest-first job feed, keyset-paginated on (posted_at, _id) like /payments/history
+    (next cursor in X-Next-Cursor). Filters are served by the (city_key|sector|contract_type,
+    posted_at, _id) indexes; `q` goes through the French text index and keeps the same order.
+    The city matches regardless of case and accents.
+    """
+    criteria: Dict[str, Any] = {}
+    if city:
+        criteria['city_key'] = _normalize_text(city)
+    if sector:
+        criteria['sector'] = sector.strip().lower()
+    if contract_type:
+        criteria['contract_type'] = contract_type
+    if q and q.strip():
+        criteria['$text'] = {'$search': q.strip(), '$language': 'french'}
+    if cursor:
+        try:
+            c_at, c_id = _decode_cursor(cursor)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        criteria['$or'] = [{'posted_at': {'$lt': c_at}}, {'posted_at': c_at, '_id': {'$lt': c_id}}]
+    limit = max(1, min(limit, 50))
+    cur = db.jobs.find(criteria, JOB_LIST_PROJECTION).sort([('posted_at', -1), ('_id', -1)]).limit(limit + 1)
+    out = []
+    last = None
+    async for j in cur:
+        if len(out) == limit:
+            response.headers['X-Next-Cursor'] = _encode_cursor(last['posted_at'], last['_id'])
+            break
+        last = dict(j)
+        out.append(_doc_out(j))
+    return out
+
+@api.get('/jobs/{job_id}')
+async def get_job(job_id: str):
+    try:
+        _id = ObjectId(job_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid job_id")
+    job = await db.jobs.find_one({'_id': _id})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _doc_out(job)
+
+# ---------- SAVED SEARCHES ----------
+class SavedSearchIndex:
+    """
+    In-memory inverted index of saved searches. Each search is posted under a single
+    anchor key: its longest keyword (longer words are rarer), else its type, else its
+    city, else the kind-wide bucket. A new item only probes the keys it could satisfy
+    (its own terms, type and city), so matching costs O(item terms + candidates) rather
+    than O(saved searches); candidates are then checked against every criterion.
+    """
+
+    def __init__(self):
+        self._searches: Dict[ObjectId, Dict[str, Any]] = {}
+        self._postings: Dict[tuple, set] = defaultdict(set)
+
+    def __len__(self):
+        return len(self._searches)
+
+    @staticmethod
+    def _anchor(entry: Dict[str, Any]) -> tuple:
+        if entry['keywords']:
+            return (entry['kind'], 'kw', max(sorted(entry['keywords']), key=len))
+        if entry['type']:
+            return (entry['kind'], 'type', entry['type'])
+        if entry['city']:
+            return (entry['kind'], 'city', entry['city'])
+        return (entry['kind'], '*')
+
+    def add(self, doc: Dict[str, Any]):
+        entry = {
+            'id': doc['_id'],
+            'user_id': doc['user_id'],
+            'kind': doc['kind'],
+            'city': _normalize_text(doc.get('city')) or None,
+            'type': _normalize_text(doc.get('type')) or None,
+            'keywords': frozenset(_terms(doc.get('keywords'))),
+        }
+        self.remove(doc['_id'])
+        self._searches[doc['_id']] = entry
+        self._postings[self._anchor(entry)].add(doc['_id'])
+
+    def remove(self, search_id: ObjectId):
+        entry = self._searches.pop(search_id, None)
+        if entry is not None:
+            key = self._anchor(entry)
+            self._postings[key].discard(search_id)
+            if not self._postings[key]:
+                del self._postings[key]
+
+    def match(self, kind: str, city: Optional[str], type_: Optional[str], text: str) -> List[Dict[str, Any]]:
+        city, type_ = _normalize_text(city) or None, _normalize_text(type_) or None
+        terms = set(_terms(text))
+        keys = [(kind, 'kw', t) for t in terms] + [(kind, 'type', type_), (kind, 'city', city), (kind, '*')]
+        out = []
+        for key in keys:
+            for sid in self._postings.get(key, ()):
+                s = self._searches[sid]
+                if s['city'] and s['city'] != city:
+                    continue
+                if s['type'] and s['type'] != type_:
+                    continue
+                if not s['keywords'] <= terms:
+                    continue
+                out.append(s)
+        return out
+
+    async def warm(self):
+        async for doc in db.saved_searches.find({}):
+            self.add(doc)
+        metrics['saved_searches'] = len(self)
+
+saved_searches = SavedSearchIndex()
+pending_dispatches: set = set()
+
+def _match_item(kind: str, item: Dict[str, Any]) -> tuple:
+    """(city, type, text) a job or an alert is matched on."""
+    if kind == 'job':
+        return item.get('city'), item.get('sector'), ' '.join(filter(None, [item.get('title'), item.get('company'), item.get('description')]))
+    return item.get('city'), item.get('type'), ' '.join(filter(None, [item.get('title'), item.get('description')]))
+
+def _notification_text(kind: str, item: Dict[str, Any]) -> tuple:
+    if kind == 'job':
+        where = f" — {item['city']}" if item.get('city') else ''
+        return f"Nouvelle offre : {item.get('title')}", f"{item.get('company') or ''}{where}".strip(' —') or item.get('summary', '')
+    return f"Alerte : {item.get('title')}", (item.get('description') or '')[:140]
+
+async def deliver_notifications(batch: List[Dict[str, Any]]):
+    """
+    Delivery hook for one batch of matched notifications: stored in each user's inbox, then
+    pushed to the users' registered devices (one fan-out per distinct title/body).
+    """
+    await db.notifications.insert_many(batch, ordered=False)
+    metrics['notifications_delivered_total'] += len(batch)
+    metrics['notification_batches_total'] += 1
+    groups: Dict[tuple, Dict[str, Any]] = {}
+    for n in batch:
+        group = groups.setdefault((n['title'], n['body']), {'users': set(), 'kind': n['kind'], 'ref_id': str(n['ref_id'])})
+        group['users'].add(n['user_id'])
+    for (title, body), group in groups.items():
+        # the inbox copy is the record: a failed push is logged, never retried from here
+        try:
+            await fan_out_push(
+                {'user_id': {'$in': list(group['users'])}},
+                {'title': title, 'body': body, 'data': {'kind': group['kind'], 'ref_id': group['ref_id']}},
+            )
+        except Exception:
+            metrics['notification_push_errors_total'] += 1
+            logger.exception("Push for notification batch failed")
+
+def track_dispatch(task: asyncio.Task):
+    """Keeps a background delivery task referenced until it ends, and surfaces its failure."""
+    pending_dispatches.add(task)
+    task.add_done_callback(_dispatch_done)
+
+def _dispatch_done(task: asyncio.Task):
+    pending_dispatches.discard(task)
+    if task.cancelled():
+        return
+    exc = task.exception()
+    if exc is not None:
+        metrics['notification_dispatch_errors_total'] += 1
+        logger.error("Notification dispatch failed", exc_info=exc)
+
+async def _dispatch(kind: str, item: Dict[str, Any]):
+    t0 = time.perf_counter()
+    city, type_, text = _match_item(kind, item)
+    matches = saved_searches.match(kind, city, type_, text)
+    metrics['saved_search_match_us_sum'] += (time.perf_counter() - t0) * 1e6
+    metrics['saved_search_matches_total'] += len(matches)
+    author = str(item.get('posted_by') or '')
+    title, body = _notification_text(kind, item)
+    now = datetime.utcnow()
+    batch: List[Dict[str, Any]] = []
+    seen_users = set()
+    for m in matches:
+        # one notification per user, and never for your own alert
+        if m['user_id'] in seen_users or str(m['user_id']) == author:
+            continue
+        seen_users.add(m['user_id'])
+        batch.append({
+            'user_id': m['user_id'], 'kind': kind, 'ref_id': item['_id'], 'search_id': m['id'],
+            'title': title, 'body': body, 'created_at': now, 'read_at': None,
+        })
+        if len(batch) == NOTIFY_BATCH_SIZE:
+            await deliver_notifications(batch)
+            batch = []
+    if batch:
+        await deliver_notifications(batch)
+
+def dispatch_matches(kind: str, item: Dict[str, Any]):
+    """Matches a freshly inserted job/alert off the request path."""
+    # copy: the route serializes (and mutates) its document before the task runs
+    track_dispatch(asyncio.create_task(_dispatch(kind, dict(item))))
+
+@api.post('/saved-searches')
+async def create_saved_search(payload: SavedSearchCreate, claims: Optional[Dict[str, Any]] = Depends(session_claims)):
+    uid = require_owner(payload.user_id, claims)
+    if not (payload.city or payload.type or (payload.keywords and _terms(payload.keywords))):
+        raise HTTPException(status_code=400, detail="At least one of city, type or keywords is required")
+    if await db.saved_searches.count_documents({'user_id': uid}) >= SAVED_SEARCHES_PER_USER:
+        raise HTTPException(status_code=409, detail="Too many saved searches")
+    doc = payload.model_dump()
+    doc['_id'] = ObjectId()
+    doc['user_id'] = uid
+    doc['created_at'] = datetime.utcnow()
+    await db.saved_searches.insert_one(doc)
+    saved_searches.add(doc)
+    metrics['saved_searches'] = len(saved_searches)
+    doc['user_id'] = str(uid)
+    return _doc_out(doc)
+
+@api.get('/saved-searches')
+async def list_saved_searches(user_id: Optional[str] = None, claims: Optional[Dict[str, Any]] = Depends(session_claims)):
+    uid = require_owner(user_id, claims)
+    out = []
+    async for d in db.saved_searches.find({'user_id': uid}).sort('created_at', -1):
+        d['user_id'] = str(uid)
+        out.append(_doc_out(d))
+    return out
+
+@api.delete('/saved-searches/{search_id}')
+async def delete_saved_search(search_id: str, user_id: Optional[str] = None, claims: Optional[Dict[str, Any]] = Depends(session_claims)):
+    uid = require_owner(user_id, claims)
+    try:
+        sid = ObjectId(search_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid id")
+    res = await db.saved_searches.delete_one({'_id': sid, 'user_id': uid})
+    if not res.deleted_count:
+        raise HTTPException(status_code=404, detail="Saved search not found")
+    saved_searches.remove(sid)
+    metrics['saved_searches'] = len(saved_searches)
+    return {"deleted": True}
+
+@api.get('/notifications')
+async def list_notifications(user_id: Optional[str] = None, limit: int = 50, claims: Optional[Dict[str, Any]] = Depends(session_claims)):
+    uid = require_owner(user_id, claims)
+    cur = db.notifications.find({'user_id': uid}, {'user_id': 0}).sort('created_at', -1).limit(max(1, min(limit, 200)))
+    out = []
+    async for n in cur:
+        n['ref_id'] = str(n['ref_id'])
+        n['search_id'] = str(n['search_id'])
+        out.append(_doc_out(n))
+    return out
+
+# ---------- COMMODITY PRICES ----------
+# Raw observations go to commodity_prices; ingest folds each batch into daily and weekly
+# rollups (min/max/mean/last) and a latest-price row, per market and for all markets
+# ('*'), so reads are a single indexed find with no aggregation. A batch is identified by
+# a hash of its observations: each rollup remembers the last few batches folded into it,
+# so a retried ingest neither double-counts nor duplicates raw rows.
+COMMODITY_ALL_MARKETS = '*'
+COMMODITY_PERIODS = ('day', 'week')
+COMMODITY_BATCH_MEMORY = 64
+
+def _commodity_key(value: str) -> str:
+    return ' '.join(value.split()).lower()
+
+def _rollup_batch(rows: List[Dict[str, Any]]) -> Dict[str, list]:
+    """Per (commodity, market, period, bucket) aggregates of one ingest batch."""
+    df = pd.DataFrame(rows, columns=['commodity', 'market', 'price', 'unit', 'observed_at'])
+    df = df.sort_values('observed_at', kind='stable')
+    df = pd.concat([df, df.assign(market=COMMODITY_ALL_MARKETS)], ignore_index=True)
+    day = df['observed_at'].dt.floor('D')
+    buckets = {'day': day, 'week': day - pd.to_timedelta(day.dt.weekday, unit='D')}
+    out: Dict[str, list] = {}
+    for period in COMMODITY_PERIODS:
+        g = df.assign(bucket=buckets[period]).groupby(['commodity', 'market', 'bucket'], sort=False)
+        agg = g.agg(
+            min=('price', 'min'), max=('price', 'max'), sum=('price', 'sum'), count=('price', 'size'),
+            last=('price', 'last'), last_at=('observed_at', 'last'), unit=('unit', 'last'),
+        ).reset_index()
+        out[period] = agg.to_dict('records')
+    latest = df.groupby(['commodity', 'market'], sort=False).agg(
+        price=('price', 'last'), unit=('unit', 'last'), observed_at=('observed_at', 'last'),
+    ).reset_index()
+    out['latest'] = latest.to_dict('records')
+    return out
+
+def _batch_id(rows: List[Dict[str, Any]]) -> str:
+    h = hashlib.sha1()
+    for r in rows:
+        h.update(f"{r['commodity']}|{r['market']}|{r['price']!r}|{r['unit']}|{r['observed_at'].isoformat()}\n".encode())
+    return h.hexdigest()
+
+def _row_id(batch_id: str, i: int) -> ObjectId:
+    """Deterministic raw-row _id, so re-inserting a retried batch hits the _id index."""
+    return ObjectId(hashlib.sha1(f"{batch_id}:{i}".encode()).digest()[:12])
+
+def _rollup_update(period: str, r: Dict[str, Any], batch_id: str, now: datetime) -> UpdateOne:
+    """
+    Merges a batch aggregate into the stored bucket in one pipeline update: min/max/sum/count
+    combine, `last` only moves forward in time, and mean is recomputed from sum/count. A
+    bucket that already folded `batch_id` in is left untouched.
+    """
+    last_at = r['last_at'].to_pydatetime()
+    seen = {'$in': [batch_id, {'$ifNull': ['$batches', []]}]}
+    newer = {'$and': [{'$not': [seen]}, {'$gte': [last_at, {'$ifNull': ['$last_at', _EPOCH]}]}]}
+
+    def fresh(value: Any, field: str) -> Dict[str, Any]:
+        return {'$cond': [seen, '$' + field, value]}
+
+    return UpdateOne(
+        {'commodity': r['commodity'], 'market': r['market'], 'period': period, 'bucket': r['bucket'].to_pydatetime()},
+        [
+            {'$set': {
+                'min': fresh({'$min': ['$min', float(r['min'])]}, 'min'),
+                'max': fresh({'$max': ['$max', float(r['max'])]}, 'max'),
+                'sum': fresh({'$add': [{'$ifNull': ['$sum', 0]}, float(r['sum'])]}, 'sum'),
+                'count': fresh({'$add': [{'$ifNull': ['$count', 0]}, int(r['count'])]}, 'count'),
+                'last': {'$cond': [newer, float(r['last']), '$last']},
+                'last_at': {'$cond': [newer, last_at, '$last_at']},
+                'unit': {'$cond': [newer, r['unit'], '$unit']},
+                'batches': fresh({'$slice': [{'$concatArrays': [{'$ifNull': ['$batches', []]}, [batch_id]]}, -COMMODITY_BATCH_MEMORY]}, 'batches'),
+                'updated_at': fresh(now, 'updated_at'),
+            }},
+            {'$set': {'mean': {'$divide': ['$sum', '$count']}}},
+        ],
+        upsert=True,
+    )
+
+def _latest_update(r: Dict[str, Any], now: datetime) -> UpdateOne:
+    observed_at = r['observed_at'].to_pydatetime()
+    newer = {'$gte': [observed_at, {'$ifNull': ['$observed_at', _EPOCH]}]}
+    return UpdateOne(
+        {'market': r['market'], 'commodity': r['commodity']},
+        [{'$set': {
+            'price': {'$cond': [newer, float(r['price']), '$price']},
+            'unit': {'$cond': [newer, r['unit'], '$unit']},
+            'observed_at': {'$cond': [newer, observed_at, '$observed_at']},
+            'updated_at': now,
+        }}],
+        upsert=True,
+    )
+
+@api.post('/commodities/prices', dependencies=[Depends(require_admin)])
+async def ingest_commodity_prices(payload: List[CommodityPriceIn]):
+    if not payload:
+        raise HTTPException(status_code=400, detail="No observations")
+    if len(payload) > COMMODITY_INGEST_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {COMMODITY_INGEST_MAX} observations per batch")
+    now = datetime.utcnow()
+    rows = []
+    for o in payload:
+        observed_at = o.observed_at or now
+        if observed_at.tzinfo is not None:
+            observed_at = observed_at.astimezone(timezone.utc).replace(tzinfo=None)
+        rows.append({
+            'commodity': _commodity_key(o.commodity),
+            'market': _commodity_key(o.market),
+            'price': o.price,
+            'unit': o.unit,
+            'observed_at': observed_at,
+        })
+    batch_id = _batch_id(rows)
+    for i, r in enumerate(rows):
+        r['_id'] = _row_id(batch_id, i)
+    rollups = await asyncio.to_thread(_rollup_batch, rows)
+    # derived data first: if a later step fails the client retries the whole batch, and
+    # the rollups skip a batch they already hold while the raw rows below are upserted by _id
+    ops = [_rollup_update(p, r, batch_id, now) for p in COMMODITY_PERIODS for r in rollups[p]]
+    res = await db.commodity_rollups.bulk_write(ops, ordered=False)
+    await db.commodity_latest.bulk_write([_latest_update(r, now) for r in rollups['latest']], ordered=False)
+    try:
+        await db.commodity_prices.insert_many([{**r, 'updated_at': now} for r in rows], ordered=False)
+    except BulkWriteError as e:
+        if any(err.get('code') != 11000 for err in e.details.get('writeErrors', [])):
+            raise
+    if not res.upserted_count and not res.modified_count:
+        # a replay of a batch that was fully applied: its watchers were already notified
+        metrics['commodity_batches_replayed_total'] += 1
+        return {"ingested": 0, "buckets": len(ops), "anomalies": 0, "replayed": True}
+    metrics['commodity_prices_ingested_total'] += len(rows)
+    flagged = await evaluate_prices(rows)
+    return {"ingested": len(rows), "buckets": len(ops), "anomalies": flagged}
+
+@api.get('/commodities/latest')
+async def commodity_latest(market: str = COMMODITY_ALL_MARKETS, commodity: Optional[str] = None):
+    """Latest price per commodity for one market (default: across all markets)."""
+    criteria: Dict[str, Any] = {'market': _commodity_key(market)}
+    if commodity:
+        criteria['commodity'] = _commodity_key(commodity)
+    cur = db.commodity_latest.find(criteria, {'_id': 0, 'updated_at': 0}).sort('commodity', 1)
+    return [r async for r in cur]
+
+@api.get('/commodities/{commodity}/series')
+async def commodity_series(
+    commodity: str,
+    market: str = COMMODITY_ALL_MARKETS,
+    period: Literal['day', 'week'] = 'day',
+    days: int = Query(90),
+):
+    """Chart points (oldest first) read straight from the precomputed rollups."""
+    days = max(1, min(days, COMMODITY_SERIES_MAX_DAYS))
+    since = datetime.utcnow() - timedelta(days=days)
+    cur = db.commodity_rollups.find(
+        {'commodity': _commodity_key(commodity), 'market': _commodity_key(market), 'period': period, 'bucket': {'$gte': since}},
+        {'_id': 0, 'bucket': 1, 'min': 1, 'max': 1, 'mean': 1, 'last': 1, 'count': 1, 'unit': 1},
+    ).sort('bucket', 1)
+    points = [p async for p in cur]
+    if not points:
+        raise HTTPException(status_code=404, detail="No prices for this commodity")
+    return {"commodity": _commodity_key(commodity), "market": _commodity_key(market), "period": period, "points": points}
+
+# ---------- PRICE ANOMALIES / WATCHES ----------
+class PriceAnomalyDetector:
+    """
+    Streaming evaluator over ingested prices. Each (commodity, market) series owns one slot
+    in flat arrays: an exponentially weighted mean/variance over ~`window` observations, the
+    last price and its time. State and per-batch cost therefore do not depend on how much
+    history a series has. A batch is evaluated in rounds: round r takes the r-th observation
+    (in time order) of every series at once, scores it against its series' state (z-score,
+    change since the previous price) and folds it in. Observations older than a series'
+    last price are back-fills: they reach the rollups but are not scored.
+    """
+
+    def __init__(self, window: int, z_threshold: float, pct_threshold: float, min_samples: int):
+        self.alpha = 2.0 / (window + 1)
+        self.z_threshold = z_threshold
+        self.pct_threshold = pct_threshold
+        self.min_samples = min_samples
+        self.keys: List[tuple] = []
+        self._slots: Dict[tuple, int] = {}
+        self.count = np.zeros(0, dtype=np.int64)
+        self.mean = np.zeros(0)
+        self.var = np.zeros(0)
+        self.last = np.zeros(0)
+        self.last_at = np.zeros(0, dtype=np.int64)  # ns since epoch
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _grow(self, size: int):
+        cap = max(64, len(self.count))
+        while cap < size:
+            cap *= 2
+        if cap == len(self.count):
+            return
+        pad = cap - len(self.count)
+        self.count = np.concatenate([self.count, np.zeros(pad, dtype=np.int64)])
+        self.mean = np.concatenate([self.mean, np.zeros(pad)])
+        self.var = np.concatenate([self.var, np.zeros(pad)])
+        self.last = np.concatenate([self.last, np.zeros(pad)])
+        self.last_at = np.concatenate([self.last_at, np.full(pad, np.iinfo(np.int64).min, dtype=np.int64)])
+
+    def slots(self, keys: List[tuple]) -> np.ndarray:
+        out = np.empty(len(keys), dtype=np.int64)
+        for i, key in enumerate(keys):
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._slots[key] = len(self.keys)
+                self.keys.append(key)
+            out[i] = slot
+        self._grow(len(self.keys))
+        return out
+
+    def evaluate(self, keys: List[tuple], price: np.ndarray, ts: np.ndarray) -> Dict[str, np.ndarray]:
+        """Per observation: slot, ts, scored (not a back-fill), previous price, z, pct, anomaly."""
+        n = len(keys)
+        slot = self.slots(keys)
+        out = {
+            'slot': slot, 'ts': ts, 'scored': np.zeros(n, dtype=bool), 'prev': np.full(n, np.nan),
+            'z': np.zeros(n), 'pct': np.zeros(n), 'anomaly': np.zeros(n, dtype=bool),
+        }
+        if not n:
+            return out
+        # rank of each observation within its series, in time order
+        order = np.lexsort((ts, slot))
+        first = np.r_[True, slot[order][1:] != slot[order][:-1]]
+        pos = np.arange(n)
+        rank = np.empty(n, dtype=np.int64)
+        rank[order] = pos - np.maximum.accumulate(np.where(first, pos, 0))
+        by_rank = np.argsort(rank, kind='stable')
+        bounds = np.r_[0, np.cumsum(np.bincount(rank))]
+        for r in range(len(bounds) - 1):
+            idx = by_rank[bounds[r]:bounds[r + 1]]
+            idx = idx[ts[idx] >= self.last_at[slot[idx]]]
+            if not len(idx):
+                continue
+            s, p = slot[idx], price[idx]
+            cnt, m, v, prev = self.count[s], self.mean[s], self.var[s], self.last[s]
+            std = np.sqrt(v)
+            warm = cnt >= self.min_samples
+            seen = cnt > 0
+            z = np.where(warm & (std > 0), (p - m) / np.where(std > 0, std, 1.0), 0.0)
+            pct = np.where(seen, (p - prev) / np.where(seen, prev, 1.0), 0.0)
+            out['scored'][idx] = True
+            out['prev'][idx] = np.where(seen, prev, np.nan)
+            out['z'][idx] = z
+            out['pct'][idx] = pct
+            out['anomaly'][idx] = warm & ((np.abs(z) >= self.z_threshold) | (np.abs(pct) >= self.pct_threshold))
+            delta = p - m
+            self.mean[s] = np.where(seen, m + self.alpha * delta, p)
+            self.var[s] = np.where(seen, (1 - self.alpha) * (v + self.alpha * delta * delta), 0.0)
+            self.count[s] = cnt + 1
+            self.last[s] = p
+            self.last_at[s] = ts[idx]
+        return out
+
+    def state(self, slots: np.ndarray) -> List[UpdateOne]:
+        ops = []
+        for s in np.unique(slots).tolist():
+            commodity, market = self.keys[s]
+            ops.append(UpdateOne({'commodity': commodity, 'market': market}, {'$set': {
+                'count': int(self.count[s]), 'mean': float(self.mean[s]), 'var': float(self.var[s]),
+                'last': float(self.last[s]), 'last_at': int(self.last_at[s]),
+            }}, upsert=True))
+        return ops
+
+    async def warm(self):
+        async for d in db.commodity_stats.find({}):
+            s = int(self.slots([(d['commodity'], d['market'])])[0])
+            self.count[s], self.mean[s], self.var[s] = d['count'], d['mean'], d['var']
+            self.last[s], self.last_at[s] = d['last'], d['last_at']
+        metrics['price_series'] = len(self)
+
+class PriceWatchIndex:
+    """
+    User price watches grouped per (commodity, market), with each group's thresholds kept
+    as arrays so a batch is checked against all watchers of a series in one comparison.
+    Adds and removes only touch their group's member map; the arrays are (re)built from
+    that group alone the next time it is evaluated.
+    """
+
+    def __init__(self):
+        self._watches: Dict[ObjectId, Dict[str, Any]] = {}
+        self._members: Dict[tuple, Dict[ObjectId, Dict[str, Any]]] = defaultdict(dict)
+        self._groups: Dict[tuple, Dict[str, Any]] = {}
+
+    def __len__(self):
+        return len(self._watches)
+
+    @staticmethod
+    def key(doc: Dict[str, Any]) -> tuple:
+        return (_commodity_key(doc['commodity']), _commodity_key(doc['market']))
 
-# ---------- BASIC ROUTES ----------
-@api.get('/health')
-async def health():
-    return {"status": "ok"}
+    def _build(self, key: tuple) -> Dict[str, Any]:
+        members = list(self._members[key].values())
+        col = lambda f: np.array([np.nan if w[f] is None else w[f] for w in members], dtype=float)
+        return {
+            'ids': [w['_id'] for w in members],
+            'users': [w['user_id'] for w in members],
+            'above': col('above'), 'below': col('below'), 'pct': col('pct_change'),
+            'anomalies': np.array([bool(w['anomalies']) for w in members]),
+        }
 
-@api.get('/')
-async def api_root():
-    return {"message": "Allô Services CI API", "paths": [r.path for r in app.router.routes]}
+    def add(self, doc: Dict[str, Any]):
+        entry = {f: doc.get(f) for f in ('_id', 'user_id', 'above', 'below', 'pct_change', 'anomalies')}
+        entry['key'] = self.key(doc)
+        self.remove(doc['_id'])
+        self._watches[doc['_id']] = entry
+        self._members[entry['key']][doc['_id']] = entry
+        self._groups.pop(entry['key'], None)
 
-# ---------- AUTH / USERS ----------
-@api.post("/auth/register")
-@api.post("/auth/register/")
-async def register_user(payload: UserCreate):
+    def remove(self, watch_id: ObjectId):
+        entry = self._watches.pop(watch_id, None)
+        if entry is None:
+            return
+        key = entry['key']
+        self._members[key].pop(watch_id, None)
+        if not self._members[key]:
+            del self._members[key]
+        self._groups.pop(key, None)
+
+    def group(self, key: tuple) -> Optional[Dict[str, Any]]:
+        if key not in self._members:
+            return None
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = self._build(key)
+        return group
+
+    async def warm(self):
+        async for doc in db.price_watches.find({}):
+            self.add(doc)
+        metrics['price_watches'] = len(self)
+
+price_detector = PriceAnomalyDetector(PRICE_ANOMALY_WINDOW, PRICE_ANOMALY_Z, PRICE_ANOMALY_PCT, PRICE_ANOMALY_MIN_SAMPLES)
+price_watches = PriceWatchIndex()
+_price_eval_lock = asyncio.Lock()
+
+def _price_notifications(rows: List[Dict[str, Any]], result: Dict[str, np.ndarray], now: datetime) -> List[Dict[str, Any]]:
+    """
+    For every watched series touched by the batch: compares the price before the batch with
+    the batch's high, low and largest move against all of the series' watches at once.
+    """
+    scored = np.nonzero(result['scored'])[0]
+    out: List[Dict[str, Any]] = []
+    if not len(scored):
+        return out
+    price = np.array([rows[i]['price'] for i in scored])
+    slot = result['slot'][scored]
+    for s in np.unique(slot).tolist():
+        commodity, market = price_detector.keys[s]
+        group = price_watches.group((commodity, market))
+        if group is None:
+            continue
+        # scored rows of this series, in time order (the batch itself may not be)
+        mine = np.nonzero(slot == s)[0]
+        mine = mine[np.argsort(result['ts'][scored[mine]], kind='stable')]
+        idx, p = scored[mine], price[mine]
+        before = result['prev'][idx[0]]  # NaN for a brand-new series
+        last = float(p[-1])
+        known = not np.isnan(before)
+        # largest move from the pre-batch price, so a spike inside the batch is not averaged away
+        rel = (p - before) / before if known else np.zeros(len(p))
+        change = float(rel[np.argmax(np.abs(rel))])
+        hit = np.zeros(len(group['ids']), dtype=bool)
+        reasons = [[] for _ in group['ids']]
+        if known:
+            rose = (before < group['above']) & (group['above'] <= p.max())
+            fell = (before > group['below']) & (group['below'] >= p.min())
+            moved = abs(change) >= group['pct']
+            for mask, label in ((rose, 'seuil haut atteint'), (fell, 'seuil bas atteint'), (moved, f"variation de {change:+.0%}")):
+                for w in np.nonzero(mask)[0].tolist():
+                    reasons[w].append(label)
+                hit |= mask
+        if result['anomaly'][idx].any():
+            for w in np.nonzero(group['anomalies'])[0].tolist():
+                reasons[w].append('variation inhabituelle')
+            hit |= group['anomalies']
+        ref = rows[int(idx[-1])]
+        for w in np.nonzero(hit)[0].tolist():
+            out.append({
+                'user_id': group['users'][w], 'kind': 'price', 'ref_id': ref['_id'], 'search_id': group['ids'][w],
+                'title': f"Prix : {commodity} à {market}",
+                'body': f"{last:.0f} FCFA/{ref['unit']} — {', '.join(reasons[w])}",
+                'created_at': now, 'read_at': None,
+            })
+    return out
+
+async def _deliver_all(docs: List[Dict[str, Any]]):
+    for i in range(0, len(docs), NOTIFY_BATCH_SIZE):
+        await deliver_notifications(docs[i:i + NOTIFY_BATCH_SIZE])
+
+async def evaluate_prices(rows: List[Dict[str, Any]]) -> int:
+    """Scores an ingested batch, persists the touched series state and notifies watchers."""
+    keys = [(r['commodity'], r['market']) for r in rows]
+    price = np.array([r['price'] for r in rows], dtype=float)
+    ts = np.array([r['observed_at'] for r in rows], dtype='datetime64[ns]').astype(np.int64)
+    t0 = time.perf_counter()
+    async with _price_eval_lock:
+        result = await asyncio.to_thread(price_detector.evaluate, keys, price, ts)
+        ops = price_detector.state(result['slot'])
+        docs = _price_notifications(rows, result, datetime.utcnow())
+    metrics['price_eval_us_sum'] += (time.perf_counter() - t0) * 1e6
+    metrics['price_series'] = len(price_detector)
+    flagged = int(result['anomaly'].sum())
+    metrics['price_anomalies_total'] += flagged
+    await db.commodity_stats.bulk_write(ops, ordered=False)
+    if docs:
+        track_dispatch(asyncio.create_task(_deliver_all(docs)))
+    return flagged
+
+@api.post('/price-watches')
+async def create_price_watch(payload: PriceWatchCreate, claims: Optional[Dict[str, Any]] = Depends(session_claims)):
+    uid = require_owner(payload.user_id, claims)
+    if await db.price_watches.count_documents({'user_id': uid}) >= PRICE_WATCHES_PER_USER:
+        raise HTTPException(status_code=409, detail="Too many price watches")
     doc = payload.model_dump()
+    doc['_id'] = ObjectId()
+    doc['user_id'] = uid
+    doc['commodity'], doc['market'] = PriceWatchIndex.key(doc)
     doc['created_at'] = datetime.utcnow()
-    doc['is_premium'] = False
-    res = await db.users.insert_one(doc)
-    saved = await db.users.find_one({'_id': res.inserted_id})
-    saved['id'] = str(saved['_id'])
-    del saved['_id']
-    return saved
+    await db.price_watches.insert_one(doc)
+    price_watches.add(doc)
+    metrics['price_watches'] = len(price_watches)
+    doc['user_id'] = str(uid)
+    return _doc_out(doc)
 
-@api.patch("/users/{user_id}")
-async def update_user(user_id: str, payload: UserUpdate):
-    try:
-        _id = ObjectId(user_id)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid user_id")
-    updates = {k: v for k, v in payload.model_dump(exclude_unset=True).items() if v is not None}
-    if not updates:
-        return {"updated": False}
-    updates['updated_at'] = datetime.utcnow()
-    r = await db.users.update_one({'_id': _id}, {'$set': updates})
-    if r.matched_count == 0:
-        raise HTTPException(status_code=404, detail="User not found")
-    saved = await db.users.find_one({'_id': _id})
-    saved['id'] = str(saved['_id'])
-    del saved['_id']
-    return saved
+@api.get('/price-watches')
+async def list_price_watches(user_id: Optional[str] = None, claims: Optional[Dict[str, Any]] = Depends(session_claims)):
+    uid = require_owner(user_id, claims)
+    out = []
+    async for d in db.price_watches.find({'user_id': uid}).sort('created_at', -1):
+        d['user_id'] = str(uid)
+        out.append(_doc_out(d))
+    return out
 
-@api.get("/subscriptions/check")
-async def check_subscription(user_id: str):
+@api.delete('/price-watches/{watch_id}')
+async def delete_price_watch(watch_id: str, user_id: Optional[str] = None, claims: Optional[Dict[str, Any]] = Depends(session_claims)):
+    uid = require_owner(user_id, claims)
     try:
-        uid = ObjectId(user_id)
+        wid = ObjectId(watch_id)
     except Exception:
-        raise HTTPException(status_code=400, detail="Invalid user_id")
-    user = await db.users.find_one({'_id': uid})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    sub = await db.subscriptions.find_one({'user_id': uid, 'status': {'$in': ['paid','active']}}, sort=[('expires_at', -1)])
-    active = False
-    expires_at = None
-    if sub and sub.get('expires_at') and sub['expires_at'] > datetime.utcnow():
-        active = True
-        expires_at = sub['expires_at']
-    return {"is_premium": active, "expires_at": expires_at}
+        raise HTTPException(status_code=400, detail="Invalid id")
+    res = await db.price_watches.delete_one({'_id': wid, 'user_id': uid})
+    if not res.deleted_count:
+        raise HTTPException(status_code=404, detail="Price watch not found")
+    price_watches.remove(wid)
+    metrics['price_watches'] = len(price_watches)
+    return {"deleted": True}
 
-async def _is_user_premium(uid: ObjectId) -> bool:
-    sub = await db.subscriptions.find_one({'user_id': uid, 'status': {'$in': ['paid','active']}}, sort=[('expires_at', -1)])
-    return bool(sub and sub.get('expires_at') and sub['expires_at'] > datetime.utcnow())
+# ---------- PUSH NOTIFICATIONS ----------
+# Tokens carry the audience fields (city, preferred_lang, is_premium) copied from the user
+# at registration and kept in sync on profile/subscription changes, so a send is a single
+# indexed cursor over push_tokens with no join on users.
+_push_http: Optional[httpx.AsyncClient] = None
 
-# ---------- PAYMENTS (CinetPay) ----------
-class PaymentInitInput(BaseModel):
-    user_id: str
-    amount_fcfa: int = 1200
+def push_http() -> httpx.AsyncClient:
+    global _push_http
+    if _push_http is None:
+        headers = {'Accept': 'application/json', 'Accept-Encoding': 'gzip, deflate'}
+        if EXPO_ACCESS_TOKEN:
+            headers['Authorization'] = f"Bearer {EXPO_ACCESS_TOKEN}"
+        _push_http = httpx.AsyncClient(
+            headers=headers,
+            timeout=httpx.Timeout(15.0, connect=5.0),
+            limits=httpx.Limits(max_connections=PUSH_CONCURRENCY, max_keepalive_connections=PUSH_CONCURRENCY),
+        )
+    return _push_http
 
-@api.post("/payments/cinetpay/initiate")
-async def cinetpay_initiate(payload: PaymentInitInput):
-    try:
-        user_id = ObjectId(payload.user_id)
-    except Exception:
+async def push_token_ops(payloads: List[PushTokenRegister]) -> List[UpdateOne]:
+    """One upsert per token (keyed on the unique token index), enriched from its user in one read."""
+    now = datetime.utcnow()
+    uids = {}
+    for p in payloads:
+        if p.user_id and ObjectId.is_valid(p.user_id):
+            uids[p.user_id] = ObjectId(p.user_id)
+    users = {}
+    if uids:
+        cur = db.users.find({'_id': {'$in': list(uids.values())}}, {'city': 1, 'preferred_lang': 1, 'premium_until': 1})
+        users = {u['_id']: u async for u in cur}
+    ops = []
+    for p in payloads:
+        # only what this registration carries: re-registering a token without its position
+        # keeps the stored one. The owner is always what this registration says, so an
+        # anonymous registration (signed out, or another person on the device) unlinks it
+        doc = p.model_dump(exclude={'token', 'user_id'}, exclude_none=True)
+        on_insert: Dict[str, Any] = {'created_at': now}
+        doc['user_id'] = uids.get(p.user_id)
+        user = users.get(doc['user_id']) if doc['user_id'] else None
+        if user is None:
+            doc.update({'premium_until': None, 'is_premium': False})
+        else:
+            premium_until = user.get('premium_until')
+            if not doc.get('city') and user.get('city'):
+                doc['city'] = user['city']
+            doc['preferred_lang'] = user.get('preferred_lang') or 'fr'
+            doc['premium_until'] = premium_until
+            doc['is_premium'] = bool(premium_until and premium_until > now)
+        if 'preferred_lang' not in doc:
+            on_insert['preferred_lang'] = 'fr'
+        if p.lat is not None and p.lng is not None:
+            doc.update(geo_tags(doc, geocoder.locate(p.lat, p.lng)))
+            doc['geo_tagged_at'] = now
+        doc['updated_at'] = now
+        ops.append(UpdateOne({'token': p.token}, {'$set': doc, '$setOnInsert': on_insert}, upsert=True))
+    return ops
+
+@api.post('/notifications/register')
+async def register_push_token(payload: PushTokenRegister, claims: Optional[Dict[str, Any]] = Depends(session_claims)):
+    """A token is linked to the signed-in user only; without a session it is registered anonymously."""
+    if payload.user_id and not ObjectId.is_valid(payload.user_id):
         raise HTTPException(status_code=400, detail="Invalid user_id")
+    if claims is not None:
+        if payload.user_id and payload.user_id != claims['sub']:
+            raise HTTPException(status_code=403, detail="Cannot register a token for another user")
+        payload.user_id = claims['sub']
+    elif payload.user_id:
+        # legacy clients send user_id without a session: keep the device reachable for
+        # broadcasts, but never link it to an account it has not proven it owns
+        metrics['push_tokens_unlinked_total'] += 1
+        payload.user_id = None
+    await db.push_tokens.bulk_write(await push_token_ops([payload]))
+    metrics['push_tokens_registered_total'] += 1
+    return {"registered": True}
 
-    transaction_id = f"SUB_{uuid.uuid4().hex[:14]}"
+@api.post('/notifications/register/bulk', dependencies=[Depends(require_admin)])
+async def register_push_tokens_bulk(payload: List[PushTokenRegister]):
+    if len(payload) > PUSH_REGISTER_BULK_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {PUSH_REGISTER_BULK_MAX} tokens per request")
+    if not payload:
+        return {"upserted": 0, "updated": 0}
+    res = await db.push_tokens.bulk_write(await push_token_ops(payload), ordered=False)
+    metrics['push_tokens_registered_total'] += len(payload)
+    return {"upserted": res.upserted_count, "updated": res.modified_count}
 
-    tr_doc = {
-        'transaction_id': transaction_id,
-        'user_id': user_id,
-        'amount': payload.amount_fcfa,
-        'currency': 'XOF',
-        'status': 'PENDING',
-        'provider': 'cinetpay',
-        'payment_url': None,
-        'created_at': datetime.utcnow(),
-        'expires_at': datetime.utcnow() + timedelta(minutes=45)
-    }
-    await db.transactions.insert_one(tr_doc)
+async def _send_push_chunk(tokens: List[str], message: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    One Expo request for up to 100 tokens. Like CinetPayClient, only failures where Expo
+    cannot have accepted the messages (connect errors, 429, 5xx) are retried, with
+    full-jitter backoff, so a retry never double-delivers.
+    """
+    body = [{'to': t, 'sound': 'default', **message} for t in tokens]
+    for attempt in range(PUSH_MAX_RETRIES + 1):
+        if attempt:
+            metrics['push_retries_total'] += 1
+            await asyncio.sleep(random.uniform(0, 0.2 * 2 ** attempt))
+        try:
+            resp = await push_http().post(EXPO_PUSH_URL, json=body)
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+            continue
+        except httpx.HTTPError:
+            break
+        if resp.status_code == 429 or resp.status_code >= 500:
+            continue
+        if resp.status_code != 200:
+            break
+        tickets = resp.json().get('data') or []
+        sent = sum(1 for t in tickets if t.get('status') == 'ok')
+        invalid = [tok for tok, t in zip(tokens, tickets) if (t.get('details') or {}).get('error') == 'DeviceNotRegistered']
+        return {'sent': sent, 'failed': len(tokens) - sent, 'invalid': invalid}
+    return {'sent': 0, 'failed': len(tokens), 'invalid': []}
 
-    if CINETPAY_MODE.lower() != 'live' or not (CINETPAY_API_KEY and CINETPAY_SITE_ID and BACKEND_PUBLIC_BASE_URL):
-        stub_url = f"https://checkout.cinetpay.com/stub/{transaction_id}"
-        await db.transactions.update_one({'transaction_id': transaction_id}, {'$set': {'status': 'INITIALIZED', 'payment_url': stub_url}})
-        return {"transaction_id": transaction_id, "provider": "cinetpay", "payment_url": stub_url}
+async def fan_out_push(criteria: Dict[str, Any], message: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Streams matching tokens from an indexed cursor and sends them in PUSH_CHUNK_SIZE chunks,
+    at most PUSH_CONCURRENCY at a time. The cursor waits for a free slot before reading on,
+    so memory stays at a few chunks whatever the audience size.
+    """
+    t0 = time.perf_counter()
+    slots = asyncio.Semaphore(PUSH_CONCURRENCY)
+    report = {'matched': 0, 'chunks': 0, 'sent': 0, 'failed': 0, 'errors': 0}
+    invalid: List[str] = []
+    in_flight: set = set()
 
-    try:
-        cinetpay_payload = {
-            "apikey": CINETPAY_API_KEY,
-            "site_id": CINETPAY_SITE_ID,
-            "transaction_id": transaction_id,
-            "amount": payload.amount_fcfa,
-            "currency": "XOF",
-            "description": "Abonnement annuel Allô Services CI",
-            "notify_url": f"{BACKEND_PUBLIC_BASE_URL}/api/payments/cinetpay/webhook",
-            "return_url": f"{BACKEND_PUBLIC_BASE_URL}/api/payments/cinetpay/return",
-            "channels": "ALL",
-            "lang": "fr",
-        }
-        resp = requests.post("https://api-checkout.cinetpay.com/v2/payment", json=cinetpay_payload, timeout=30)
-        data = resp.json() if resp.headers.get('content-type','').startswith('application/json') else {}
-        if resp.status_code != 200 or data.get('code') not in ("201","00"):
-            raise HTTPException(status_code=400, detail=data.get('message','CinetPay init failed'))
-        payment_url = data.get('data',{}).get('payment_url') or data.get('payment_url')
-        if not payment_url:
-            raise HTTPException(status_code=400, detail="No payment_url returned by CinetPay")
-        await db.transactions.update_one({'transaction_id': transaction_id}, {'$set': {'status': 'INITIALIZED', 'payment_url': payment_url}})
-        return {"transaction_id": transaction_id, "provider": "cinetpay", "payment_url": payment_url}
-    except Exception as e:
-        logger.exception("CinetPay init error")
-        raise HTTPException(status_code=500, detail=str(e))
+    async def send(chunk: List[str]):
+        # a chunk that blows up (e.g. a 200 with a non-JSON body) only fails its own tokens
+        try:
+            r = await _send_push_chunk(chunk, message)
+        except Exception:
+            logger.exception("Push chunk of %d tokens failed", len(chunk))
+            report['errors'] += 1
+            r = {'sent': 0, 'failed': len(chunk), 'invalid': []}
+        finally:
+            slots.release()
+        report['sent'] += r['sent']
+        report['failed'] += r['failed']
+        invalid.extend(r['invalid'])
+
+    async def submit(chunk: List[str]):
+        await slots.acquire()
+        report['chunks'] += 1
+        task = asyncio.create_task(send(chunk))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+
+    chunk: List[str] = []
+    async for d in db.push_tokens.find(criteria, {'token': 1, '_id': 0}).batch_size(PUSH_CHUNK_SIZE * PUSH_CONCURRENCY):
+        chunk.append(d['token'])
+        report['matched'] += 1
+        if len(chunk) == PUSH_CHUNK_SIZE:
+            await submit(chunk)
+            chunk = []
+    if chunk:
+        await submit(chunk)
+    await asyncio.gather(*in_flight)
+    if invalid:
+        await db.push_tokens.delete_many({'token': {'$in': invalid}})
+    elapsed = time.perf_counter() - t0
+    metrics['push_sends_total'] += 1
+    metrics['push_messages_sent_total'] += report['sent']
+    metrics['push_messages_failed_total'] += report['failed']
+    metrics['push_chunk_errors_total'] += report['errors']
+    metrics['push_tokens_pruned_total'] += len(invalid)
+    return {
+        **report,
+        'invalid_removed': len(invalid),
+        'duration_ms': round(elapsed * 1000.0, 1),
+        'messages_per_s': round(report['sent'] / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+
+@api.post('/notifications/send', dependencies=[Depends(require_admin)])
+async def send_push(payload: PushSendInput):
+    criteria: Dict[str, Any] = {}
+    if payload.city:
+        criteria['city'] = payload.city
+    if payload.lang:
+        criteria['preferred_lang'] = payload.lang
+    if payload.premium_only:
+        criteria['is_premium'] = True
+        criteria['premium_until'] = {'$gt': datetime.utcnow()}
+    message = {'title': payload.title, 'body': payload.body}
+    if payload.data:
+        message['data'] = payload.data
+    return await fan_out_push(criteria, message)
 
 # ---------- PHARMACIES ----------
+def compute_on_duty(doc: Dict[str, Any]) -> bool:
+    """Pharmacie de garde today: explicit on_duty flag, else duty_days (Monday=0 .. Sunday=6)."""
+    # Explicit flag wins if present
+    if isinstance(doc.get('on_duty'), bool):
+        return bool(doc['on_duty'])
+    duty_days = doc.get('duty_days') or doc.get('dutyDays')
+    if isinstance(duty_days, list):
+        try:
+            # Python weekday(): Monday=0 .. Sunday=6
+            today = datetime.utcnow().weekday()
+            return any(int(d) == today for d in duty_days)
+        except Exception:
+            return False
+    return False
+
 @api.get('/pharmacies')
 async def list_pharmacies(
     on_duty: Optional[bool] = Query(None),
@@ -315,26 +3036,10 @@ async def list_pharmacies(
             }
         }
 
-    # Helper to compute dynamic on-duty
-    def compute_on_duty(doc: Dict[str, Any]) -> bool:
-        # Explicit flag wins if present
-        if isinstance(doc.get('on_duty'), bool):
-            return bool(doc['on_duty'])
-        duty_days = doc.get('duty_days') or doc.get('dutyDays')
-        if isinstance(duty_days, list):
-            try:
-                # Python weekday(): Monday=0 .. Sunday=6
-                today = datetime.utcnow().weekday()
-                return any(int(d) == today for d in duty_days)
-            except Exception:
-                return False
-        return False
-
     cur = db.pharmacies.find(criteria).limit(300)
     out: List[Dict[str, Any]] = []
     async for p in cur:
-        p['id'] = str(p['_id'])
-        del p['_id']
+        _doc_out(p)
         # Compute dynamic on_duty and expose it consistently
         computed = compute_on_duty(p)
         p['on_duty'] = computed
@@ -591,13 +3296,149 @@ async def seed_health_facilities():
         lat = h.get('lat'); lng = h.get('lng')
         if lat is not None and lng is not None:
             doc['location'] = { 'type': 'Point', 'coordinates': [float(lng), float(lat)] }
-        elif 'location' in h:
-            # already set (like CHU Angré)
-            pass
+        coords = doc_coords(doc)  # lat/lng above, or a location already set (like CHU Angré)
+        if coords:
+            doc.update(geo_tags(doc, geocoder.locate(*coords)))
+            doc['geo_tagged_at'] = datetime.utcnow()
         docs.append(doc)
     if docs:
         await db.health_facilities.insert_many(docs)
         logger.info(f"Seeded {len(docs)} health facilities for Abidjan")
+        retrieval_index.mark_dirty()
+
+# ---------- ALERTS: near-duplicate clustering (MinHash / LSH) ----------
+_MINHASH_PERMS = 64
+_LSH_BANDS = 32
+_LSH_ROWS = _MINHASH_PERMS // _LSH_BANDS
+_MERSENNE_31 = (1 << 31) - 1
+_minhash_rng = np.random.default_rng(0xA110)
+_MINHASH_A = _minhash_rng.integers(1, _MERSENNE_31, size=(_MINHASH_PERMS, 1), dtype=np.uint64)
+_MINHASH_B = _minhash_rng.integers(0, _MERSENNE_31, size=(_MINHASH_PERMS, 1), dtype=np.uint64)
+
+def _normalize_text(value: Optional[str]) -> str:
+    """Lowercase, strip accents and punctuation, collapse whitespace."""
+    if not value:
+        return ''
+    value = unicodedata.normalize('NFKD', value)
+    value = ''.join(c for c in value if not unicodedata.combining(c))
+    return ' '.join(re.sub(r'[^0-9a-z]+', ' ', value.lower()).split())
+
+def _minhash_signature(text: str, k: int = 4) -> Optional[np.ndarray]:
+    """MinHash signature of the character k-shingles of an already-normalized text."""
+    text = text[:1000]
+    if not text:
+        return None
+    grams = {text[i:i + k] for i in range(max(1, len(text) - k + 1))}
+    hashes = np.fromiter((zlib.crc32(g.encode()) & _MERSENNE_31 for g in grams), dtype=np.uint64, count=len(grams))
+    return ((_MINHASH_A * hashes + _MINHASH_B) % _MERSENNE_31).min(axis=1)
+
+def _haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lng2 - lng1)
+    h = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 12742.0 * math.asin(math.sqrt(h))
+
+class AlertDedupIndex:
+    """
+    In-memory LSH index of recently reported alerts.
+    Candidates must share (type, city) and have been reported within the window;
+    they are confirmed by estimated Jaccard similarity and, when both sides carry
+    coordinates, by distance.
+    """
+
+    def __init__(self, window_min: int, threshold: float, max_km: float):
+        self.window = timedelta(minutes=window_min)
+        self.threshold = threshold
+        self.max_km = max_km
+        self._entries: Dict[ObjectId, Dict[str, Any]] = {}
+        self._buckets: Dict[tuple, set] = {}
+        self._expiry: List[tuple] = []  # (last_seen, alert_id), appended in time order
+
+    @staticmethod
+    def scope(alert: Dict[str, Any]) -> tuple:
+        return (alert.get('type') or 'other', _normalize_text(alert.get('city')))
+
+    @staticmethod
+    def _band_keys(scope: tuple, sig: np.ndarray) -> List[tuple]:
+        return [(scope, b, sig[b * _LSH_ROWS:(b + 1) * _LSH_ROWS].tobytes()) for b in range(_LSH_BANDS)]
+
+    def prune(self, now: datetime):
+        cutoff = now - self.window
+        keep_from = 0
+        for keep_from, (seen, aid) in enumerate(self._expiry):
+            if seen >= cutoff:
+                break
+            entry = self._entries.get(aid)
+            if entry and entry['last_seen'] < cutoff:
+                self.remove(aid)
+        else:
+            keep_from = len(self._expiry)
+        del self._expiry[:keep_from]
+
+    def match(self, scope: tuple, sig: Optional[np.ndarray], lat: Optional[float], lng: Optional[float], now: datetime) -> Optional[ObjectId]:
+        if sig is None:
+            return None
+        self.prune(now)
+        candidates = set()
+        for key in self._band_keys(scope, sig):
+            candidates |= self._buckets.get(key, set())
+        best, best_score = None, self.threshold
+        for aid in candidates:
+            entry = self._entries[aid]
+            if None not in (lat, lng, entry['lat'], entry['lng']):
+                if _haversine_km(lat, lng, entry['lat'], entry['lng']) > self.max_km:
+                    continue
+            score = float(np.count_nonzero(entry['sig'] == sig)) / _MINHASH_PERMS
+            if score >= best_score:
+                best, best_score = aid, score
+        return best
+
+    def add(self, alert_id: ObjectId, scope: tuple, sig: Optional[np.ndarray], lat: Optional[float], lng: Optional[float], seen: datetime):
+        if sig is None:
+            return
+        keys = self._band_keys(scope, sig)
+        self._entries[alert_id] = {'sig': sig, 'keys': keys, 'lat': lat, 'lng': lng, 'last_seen': seen}
+        for key in keys:
+            self._buckets.setdefault(key, set()).add(alert_id)
+        self._expiry.append((seen, alert_id))
+
+    def touch(self, alert_id: ObjectId, seen: datetime):
+        entry = self._entries.get(alert_id)
+        if entry:
+            entry['last_seen'] = seen
+            self._expiry.append((seen, alert_id))
+
+    def remove(self, alert_id: ObjectId):
+        entry = self._entries.pop(alert_id, None)
+        if not entry:
+            return
+        for key in entry['keys']:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(alert_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    async def warm(self):
+        now = datetime.utcnow()
+        cur = db.alerts.find(
+            {'last_reported_at': {'$gte': now - self.window}},
+            {'type': 1, 'city': 1, 'title': 1, 'description': 1, 'lat': 1, 'lng': 1, 'last_reported_at': 1},
+        ).sort('last_reported_at', 1)
+        async for a in cur:
+            sig = _minhash_signature(_normalize_text(f"{a.get('title', '')} {a.get('description', '')}"))
+            self.add(a['_id'], self.scope(a), sig, a.get('lat'), a.get('lng'), a['last_reported_at'])
+
+alert_dedup = AlertDedupIndex(ALERT_DEDUP_WINDOW_MIN, ALERT_DEDUP_THRESHOLD, ALERT_DEDUP_MAX_KM)
+# cluster heads indexed but not yet inserted -> resolves to whether the insert landed
+_pending_alerts: Dict[ObjectId, asyncio.Future] = {}
+
+def _serialize_alert(a: Dict[str, Any]) -> Dict[str, Any]:
+    _doc_out(a)
+    # Convert ObjectId objects in read_by to strings for JSON serialization
+    if 'read_by' in a and isinstance(a['read_by'], list):
+        a['read_by'] = [str(obj_id) for obj_id in a['read_by']]
+    return a
 
 # ---------- ALERTS: basic CRUD + unread count + read mark ----------
 class MarkReadInput(BaseModel):
@@ -605,27 +3446,67 @@ class MarkReadInput(BaseModel):
 
 @api.post('/alerts')
 async def create_alert(payload: AlertCreate):
+    """
+    Creates an alert, or folds it into a recent near-identical alert of the same
+    type and city (reporter_count is incremented instead of storing a new document).
+    """
     doc = payload.model_dump()
-    doc['created_at'] = datetime.utcnow()
+    now = datetime.utcnow()
+    if doc.get('lat') is not None and doc.get('lng') is not None:
+        doc.update(geo_tags(doc, geocoder.locate(doc['lat'], doc['lng'])))
+        doc['geo_tagged_at'] = now
+    scope = alert_dedup.scope(doc)
+    sig = _minhash_signature(_normalize_text(f"{doc['title']} {doc['description']}"))
+    cluster_id = alert_dedup.match(scope, sig, doc.get('lat'), doc.get('lng'), now)
+    if cluster_id is not None:
+        alert_dedup.touch(cluster_id, now)
+        update: Dict[str, Any] = {'$inc': {'reporter_count': 1}, '$set': {'last_reported_at': now, 'updated_at': now}}
+        if doc.get('posted_by'):
+            update['$addToSet'] = {'reporters': doc['posted_by']}
+        cluster = await db.alerts.find_one_and_update({'_id': cluster_id}, update, return_document=ReturnDocument.AFTER)
+        pending = _pending_alerts.get(cluster_id)
+        if cluster is None and pending is not None and await asyncio.shield(pending):
+            # matched a head whose insert had not landed yet: fold into it once it has
+            metrics['alerts_dedup_pending_waits_total'] += 1
+            cluster = await db.alerts.find_one_and_update({'_id': cluster_id}, update, return_document=ReturnDocument.AFTER)
+        if cluster:
+            cluster['merged'] = True
+            return _serialize_alert(cluster)
+        if pending is None:
+            # cluster head was deleted meanwhile; store as a fresh alert
+            alert_dedup.remove(cluster_id)
+
+    # _id is allocated up front so concurrent duplicates can match before the insert lands
+    doc['_id'] = ObjectId()
+    doc['created_at'] = now
     doc['status'] = doc.get('status') or 'new'
     doc['read_by'] = []
-    res = await db.alerts.insert_one(doc)
-    saved = await db.alerts.find_one({'_id': res.inserted_id})
-    saved['id'] = str(saved['_id'])
-    del saved['_id']
-    return saved
+    doc['reporter_count'] = 1
+    doc['reporters'] = [doc['posted_by']] if doc.get('posted_by') else []
+    doc['last_reported_at'] = now
+    alert_dedup.add(doc['_id'], scope, sig, doc.get('lat'), doc.get('lng'), now)
+    inserted = _pending_alerts[doc['_id']] = asyncio.get_running_loop().create_future()
+    landed = False
+    try:
+        await db.alerts.insert_one(doc)
+        landed = True
+    except Exception:
+        alert_dedup.remove(doc['_id'])
+        raise
+    finally:
+        # duplicates waiting on this head fold in only if the insert landed
+        inserted.set_result(landed)
+        _pending_alerts.pop(doc['_id'], None)
+    # only a new cluster notifies; merged duplicates returned above
+    dispatch_matches('alert', doc)
+    return _serialize_alert(doc)
 
 @api.get('/alerts')
 async def list_alerts(limit: int = 50):
     cur = db.alerts.find({}).sort('created_at', -1).limit(max(1, min(limit, 200)))
     out = []
     async for a in cur:
-        a['id'] = str(a['_id'])
-        del a['_id']
-        # Convert ObjectId objects in read_by to strings for JSON serialization
-        if 'read_by' in a and isinstance(a['read_by'], list):
-            a['read_by'] = [str(obj_id) for obj_id in a['read_by']]
-        out.append(a)
+        out.append(_serialize_alert(a))
     return out
 
 @api.patch('/alerts/{alert_id}/read')
@@ -638,16 +3519,14 @@ async def mark_alert_read(alert_id: str, payload: MarkReadInput):
         uid = ObjectId(payload.user_id)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid user_id")
-    r = await db.alerts.update_one({'_id': aid}, {'$addToSet': {'read_by': uid}, '$set': {'updated_at': datetime.utcnow(), 'status': 'read'}})
-    if r.matched_count == 0:
+    a = await db.alerts.find_one_and_update(
+        {'_id': aid},
+        {'$addToSet': {'read_by': uid}, '$set': {'updated_at': datetime.utcnow(), 'status': 'read'}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if not a:
         raise HTTPException(status_code=404, detail="Alert not found")
-    a = await db.alerts.find_one({'_id': aid})
-    a['id'] = str(a['_id'])
-    del a['_id']
-    # Convert ObjectId objects in read_by to strings for JSON serialization
-    if 'read_by' in a and isinstance(a['read_by'], list):
-        a['read_by'] = [str(obj_id) for obj_id in a['read_by']]
-    return a
+    return _serialize_alert(a)
 
 @api.get('/alerts/unread_count')
 async def alerts_unread_count(user_id: Optional[str] = None):
@@ -682,13 +3561,647 @@ class ChatMessage(BaseModel):
 class ChatRequest(BaseModel):
     messages: List[ChatMessage]
     stream: Optional[bool] = True
+    temperature: Optional[float] = None
+    max_tokens: Optional[int] = None
+    user_id: Optional[str] = None  # ignored: sent by older apps, the user comes from the bearer token
+
+_llm: Optional[AsyncOpenAI] = None
+
+def llm_client() -> AsyncOpenAI:
+    """Shared OpenAI-compatible client; one keep-alive pool for every chat request."""
+    global _llm
+    if _llm is None:
+        _llm = AsyncOpenAI(
+            api_key=EMERGENT_API_KEY,
+            base_url=AI_BASE_URL,
+            timeout=httpx.Timeout(60.0, connect=5.0),
+            max_retries=1,
+            http_client=httpx.AsyncClient(limits=httpx.Limits(max_connections=200, max_keepalive_connections=50)),
+        )
+    return _llm
+
+async def llm_stream(
+    messages: List[Dict[str, str]], temperature: float, max_tokens: int, meta: Optional[Dict[str, Any]] = None,
+) -> AsyncGenerator[str, None]:
+    """
+    Yields content deltas as they arrive; closing the generator closes the upstream response.
+    `meta['finish_reason']` is filled in when the upstream reports it.
+    """
+    stream = await llm_client().chat.completions.create(
+        model=OPENAI_MODEL, messages=messages, temperature=temperature, max_tokens=max_tokens, stream=True,
+    )
+    try:
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            if chunk.choices[0].finish_reason and meta is not None:
+                meta['finish_reason'] = chunk.choices[0].finish_reason
+            if chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        await stream.close()
+
+async def llm_complete(
+    messages: List[Dict[str, str]], temperature: float, max_tokens: int, meta: Optional[Dict[str, Any]] = None,
+) -> str:
+    resp = await llm_client().chat.completions.create(
+        model=OPENAI_MODEL, messages=messages, temperature=temperature, max_tokens=max_tokens,
+    )
+    if meta is not None:
+        meta['finish_reason'] = resp.choices[0].finish_reason
+    return resp.choices[0].message.content or ''
+
+# Allô IA response cache: in-memory LRU/TTL, optionally backed by db.ai_cache
+ai_cache = TTLCache(AI_CACHE_SIZE, AI_CACHE_TTL)
+
+def _approx_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+def ai_cache_key(messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> str:
+    """Hash of model, temperature bucket (0.5 steps), max_tokens and normalized messages, system prompt included."""
+    norm = [[m['role'], _normalize_text(m['content'])] for m in messages]
+    raw = json.dumps([OPENAI_MODEL, round(temperature * 2) / 2, max_tokens, norm], separators=(',', ':'))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+async def ai_cache_get(key: str) -> Optional[Dict[str, Any]]:
+    entry = ai_cache.get(key)
+    if entry is None and AI_CACHE_PERSIST:
+        doc = await db.ai_cache.find_one({'_id': key, 'expires_at': {'$gt': datetime.utcnow()}})
+        if doc:
+            entry = {'content': doc['content'], 'gen_ms': doc.get('gen_ms', 0.0), 'tokens': doc.get('tokens', 0)}
+            ai_cache.set(key, entry)
+    if entry is None:
+        metrics['ai_cache_misses'] += 1
+        return None
+    metrics['ai_cache_hits'] += 1
+    metrics['ai_cache_tokens_saved'] += entry['tokens']
+    metrics['ai_cache_latency_saved_ms'] += entry['gen_ms']
+    return entry
+
+async def ai_cache_put(key: str, messages: List[Dict[str, str]], content: str, gen_ms: float, finish_reason: Optional[str]):
+    """
+    Caches an answer only if the model finished it (finish_reason 'stop'): a reply cut by
+    max_tokens or a content filter must not be served to later requests. Never raises; the
+    answer has already been delivered when this runs.
+    """
+    if not content or finish_reason != 'stop':
+        metrics['ai_cache_skipped_incomplete'] += bool(content)
+        return
+    tokens = sum(_approx_tokens(m['content']) for m in messages) + _approx_tokens(content)
+    ai_cache.set(key, {'content': content, 'gen_ms': gen_ms, 'tokens': tokens})
+    if AI_CACHE_PERSIST:
+        try:
+            await db.ai_cache.update_one(
+                {'_id': key},
+                {'$set': {'content': content, 'gen_ms': gen_ms, 'tokens': tokens,
+                          'expires_at': datetime.utcnow() + timedelta(seconds=AI_CACHE_TTL)}},
+                upsert=True,
+            )
+        except Exception:
+            logger.exception("AI cache write failed")
+            metrics['ai_cache_write_errors_total'] += 1
+
+async def _replay_sse(content: str) -> AsyncGenerator[str, None]:
+    for i in range(0, len(content), 256):
+        yield _sse({'content': content[i:i + 256]})
+    yield "data: [DONE]\n\n"
+
+# Conversation context: system prompt + rolling summary + most recent turns within a token budget.
+# prefix digest of the folded turns -> summary of those turns
+conversation_summaries = TTLCache(5000, 6 * 3600)
+_summary_tasks: Dict[str, asyncio.Task] = {}
+_summary_semaphore = asyncio.Semaphore(AI_SUMMARY_CONCURRENCY)
+
+def _message_tokens(m: Dict[str, str]) -> int:
+    # ~4 tokens of per-message framing in the chat format
+    return _approx_tokens(m['content']) + 4
+
+def _prefix_digests(messages: List[Dict[str, str]]) -> List[str]:
+    """digests[i] identifies messages[:i + 1]."""
+    h = hashlib.sha256()
+    out = []
+    for m in messages:
+        h.update(f"{m['role']}\0{m['content']}\1".encode())
+        out.append(h.copy().hexdigest())
+    return out
+
+async def _summarize_turns(previous: Optional[str], turns: List[Dict[str, str]], digest: str):
+    try:
+        text = '\n'.join(f"{m['role']}: {m['content']}" for m in turns)[-AI_CONTEXT_TOKEN_BUDGET * 4:]
+        prompt = [
+            {'role': 'system', 'content': "Résume cette conversation en quelques phrases. Garde les faits, noms, lieux, "
+                                          "chiffres et demandes de l'utilisateur utiles pour la suite de l'échange."},
+            {'role': 'user', 'content': (f"Résumé précédent : {previous}\n\n" if previous else '') + text},
+        ]
+        # summaries share the upstream with interactive chats: they queue behind every user
+        # request and at most AI_SUMMARY_CONCURRENCY of them hold a slot at once
+        async with _summary_semaphore:
+            slot = await ai_admission.acquire(f"summary:{digest}", 3, AI_QUEUE_TIMEOUT_S)
+            try:
+                summary = await llm_complete(prompt, 0.2, AI_SUMMARY_MAX_TOKENS)
+            finally:
+                slot.release()
+        conversation_summaries.set(digest, summary)
+        metrics['ai_summaries_total'] += 1
+    except AdmissionRejected as e:
+        # the next turn of the conversation will try again
+        metrics['ai_summaries_skipped_total'] += 1
+        logger.info("Conversation summary skipped: %s", e)
+    except Exception:
+        logger.exception("Conversation summary failed")
+    finally:
+        _summary_tasks.pop(digest, None)
+
+def fit_context(messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """
+    Keeps system messages and the newest turns that fit AI_CONTEXT_TOKEN_BUDGET (the last
+    turn is always kept). Older turns are replaced by the most recent cached summary that
+    covers a prefix of them; a summary up to the current fold point is built in the
+    background so the answer itself never waits on summarization.
+    """
+    system = [m for m in messages if m['role'] == 'system']
+    turns = [m for m in messages if m['role'] != 'system']
+    budget = AI_CONTEXT_TOKEN_BUDGET - AI_SUMMARY_MAX_TOKENS - sum(_message_tokens(m) for m in system)
+    keep, used = 0, 0
+    for m in reversed(turns):
+        t = _message_tokens(m)
+        if keep and used + t > budget:
+            break
+        keep += 1
+        used += t
+    if keep == len(turns):
+        return messages
+
+    older, recent = turns[:-keep], turns[-keep:]
+    digests = _prefix_digests(older)
+    summary, covered = None, 0
+    for i in range(len(older), 0, -1):
+        cached = conversation_summaries.get(digests[i - 1])
+        if cached is not None:
+            summary, covered = cached, i
+            break
+    if covered < len(older) and digests[-1] not in _summary_tasks:
+        _summary_tasks[digests[-1]] = asyncio.create_task(_summarize_turns(summary, older[covered:], digests[-1]))
+
+    metrics['ai_context_trimmed_total'] += 1
+    out = list(system)
+    if summary:
+        out.append({'role': 'system', 'content': f"Résumé de la conversation précédente : {summary}"})
+    return out + recent
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+class AdmissionSlot:
+    def __init__(self, queue: 'AdmissionQueue', user_key: str):
+        self._queue = queue
+        self.user_key = user_key
+        self._released = False
+
+    def release(self):
+        # idempotent: called from both the stream generator and the response background task
+        if not self._released:
+            self._released = True
+            self._queue._release(self.user_key)
+
+class AdmissionQueue:
+    """
+    Admission control for upstream LLM calls: at most `max_concurrency` calls in flight,
+    at most one per user, lower `priority` served first (FIFO within a priority), and
+    every queued request gives up after its deadline.
+    """
+
+    def __init__(self, max_concurrency: int, max_queued: int):
+        self.max_concurrency = max_concurrency
+        self.max_queued = max_queued
+        self.in_flight = 0
+        self._active_users: set = set()
+        self._heap: List[tuple] = []  # (priority, seq, user_key, future)
+        self._seq = itertools.count()
+
+    def _publish(self):
+        metrics['ai_in_flight'] = self.in_flight
+        metrics['ai_queued'] = len(self._heap)
+
+    async def acquire(self, user_key: str, priority: int, timeout: float) -> AdmissionSlot:
+        if len(self._heap) >= self.max_queued:
+            metrics['ai_queue_rejected_full'] += 1
+            raise AdmissionRejected('queue_full')
+        t0 = time.perf_counter()
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, next(self._seq), user_key, fut))
+        self._dispatch()
+        try:
+            await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            metrics['ai_queue_rejected_deadline'] += 1
+            self._drop_cancelled()
+            raise AdmissionRejected('deadline')
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self._release(user_key)
+            else:
+                self._drop_cancelled()
+            raise
+        metrics['ai_queue_admitted_total'] += 1
+        metrics['ai_queue_wait_ms_sum'] += (time.perf_counter() - t0) * 1000.0
+        return AdmissionSlot(self, user_key)
+
+    def _release(self, user_key: str):
+        self.in_flight -= 1
+        self._active_users.discard(user_key)
+        self._dispatch()
+
+    def _drop_cancelled(self):
+        self._heap = [item for item in self._heap if not item[3].done()]
+        heapq.heapify(self._heap)
+        self._publish()
+
+    def _dispatch(self):
+        skipped = []
+        while self._heap and self.in_flight < self.max_concurrency:
+            item = heapq.heappop(self._heap)
+            fut = item[3]
+            if fut.done():
+                continue
+            if item[2] in self._active_users:
+                skipped.append(item)
+                continue
+            self.in_flight += 1
+            self._active_users.add(item[2])
+            fut.set_result(None)
+        for item in skipped:
+            heapq.heappush(self._heap, item)
+        self._publish()
+
+ai_admission = AdmissionQueue(AI_MAX_CONCURRENCY, AI_QUEUE_MAX)
+
+def _sse(payload: Dict[str, Any]) -> str:
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+async def _chat_sse(messages: List[Dict[str, str]], temperature: float, max_tokens: int, cache_key: str, slot: AdmissionSlot) -> AsyncGenerator[str, None]:
+    t0 = time.perf_counter()
+    first = True
+    parts: List[str] = []
+    meta: Dict[str, Any] = {}
+    metrics['ai_streams_open'] += 1
+    try:
+        async with aclosing(llm_stream(messages, temperature, max_tokens, meta)) as deltas:
+            async for delta in deltas:
+                if first:
+                    metrics['ai_ttft_ms_sum'] += (time.perf_counter() - t0) * 1000.0
+                    metrics['ai_ttft_count'] += 1
+                    first = False
+                metrics['ai_stream_chunks_total'] += 1
+                parts.append(delta)
+                yield _sse({'content': delta})
+        yield "data: [DONE]\n\n"
+        # the client already has [DONE]: ai_cache_put only logs its own failures
+        await ai_cache_put(cache_key, messages, ''.join(parts), (time.perf_counter() - t0) * 1000.0, meta.get('finish_reason'))
+    except asyncio.CancelledError:
+        # client went away: leaving the `async with` above already closed the upstream stream
+        metrics['ai_cancelled_total'] += 1
+        raise
+    except Exception:
+        logger.exception("AI stream failed")
+        metrics['ai_upstream_errors_total'] += 1
+        yield _sse({'error': 'upstream_error'})
+    finally:
+        metrics['ai_streams_open'] -= 1
+        slot.release()
+
+def _chat_messages(payload: ChatRequest) -> List[Dict[str, str]]:
+    messages = [m.model_dump() for m in payload.messages]
+    if not any(m['role'] == 'system' for m in messages):
+        messages.insert(0, {'role': 'system', 'content': AI_SYSTEM_PROMPT})
+    return messages
+
+# ---------- AI: local retrieval (BM25 over facilities, pharmacies, categories) ----------
+_STOPWORDS = set(
+    "a au aux avec ce ces cet cette d dans de des du en est et il ils je l la le les leur ma me mes moi mon "
+    "ne nous on ou par pas plus pour qu que quel quelle quelles quels qui sa se ses son sont sur ta te tes "
+    "toi ton tu un une vos votre vous y svp stp".split()
+)
+# query word -> document kind it asks for
+_LOOKUP_KINDS = {
+    'pharmacie': 'pharmacy', 'pharmacy': 'pharmacy',
+    'hopital': 'facility', 'clinique': 'facility', 'polyclinique': 'facility', 'chu': 'facility',
+    'hospital': 'facility', 'maternite': 'facility', 'urgence': 'facility',
+}
+# words that ask the assistant to write or explain something rather than look it up
+_GENERATIVE_WORDS = set(
+    "redige rediger ecris ecrire explique expliquer lettre courrier resume resumer traduis traduire "
+    "reformule pourquoi comment conseil conseille cv modele".split()
+)
+
+def _terms(text: Optional[str]) -> List[str]:
+    out = []
+    for t in _normalize_text(text).split():
+        if len(t) < 2 or t in _STOPWORDS:
+            continue
+        if len(t) > 4 and t.endswith('s'):
+            t = t[:-1]
+        out.append(t)
+    return out
+
+class RetrievalIndex:
+    """
+    In-memory BM25 index of the local directory (health facilities, pharmacies, categories).
+    It is rebuilt from Mongo when marked dirty by a write or older than AI_RETRIEVAL_MAX_AGE_S;
+    the rebuild runs in the background while the previous snapshot keeps serving.
+    """
+
+    K1 = 1.5
+    B = 0.75
+
+    def __init__(self, max_age_s: float):
+        self.max_age_s = max_age_s
+        self.docs: List[Dict[str, Any]] = []
+        self.postings: Dict[str, List[tuple]] = {}
+        self.doc_len: List[int] = []
+        self.avgdl = 1.0
+        self.places: set = set()
+        self.built_at: Optional[float] = None
+        self.dirty = True
+        self._rebuilding: Optional[asyncio.Task] = None
+
+    def mark_dirty(self):
+        self.dirty = True
+
+    async def ensure_fresh(self):
+        stale = self.dirty or self.built_at is None or time.monotonic() - self.built_at > self.max_age_s
+        if not stale:
+            return
+        if self._rebuilding is None or self._rebuilding.done():
+            self.dirty = False
+            self._rebuilding = asyncio.create_task(self.rebuild())
+        if self.built_at is None:
+            await asyncio.shield(self._rebuilding)
+
+    async def rebuild(self):
+        docs: List[Dict[str, Any]] = []
+        async for h in db.health_facilities.find({}, {'name': 1, 'facility_type': 1, 'services': 1, 'address': 1, 'city': 1, 'commune': 1, 'phones': 1}):
+            docs.append({
+                'kind': 'facility', 'name': h.get('name'), 'commune': h.get('commune'), 'city': h.get('city'),
+                'address': h.get('address'), 'phones': h.get('phones') or [], 'details': h.get('services'),
+                'text': ' '.join(filter(None, [h.get('name'), h.get('name'), h.get('facility_type'), h.get('services'), h.get('address'), h.get('commune'), h.get('city')])),
+            })
+        async for p in db.pharmacies.find({}, {'location': 0}).limit(5000):
+            phones = p.get('phones') or ([p['phone']] if p.get('phone') else [])
+            docs.append({
+                'kind': 'pharmacy', 'name': p.get('name'), 'commune': p.get('commune'), 'city': p.get('city'),
+                'address': p.get('address'), 'phones': phones, 'raw': p,
+                'text': ' '.join(filter(None, ['pharmacie', p.get('name'), p.get('name'), p.get('address'), p.get('commune'), p.get('city')])),
+            })
+        async for c in db.categories.find({}):
+            body = c.get('content') or c.get('description') or ''
+            if not body and c.get('items'):
+                body = ' '.join(f"{i.get('title', '')} : {i.get('summary', '')}." for i in c['items'])
+            if not isinstance(body, str):
+                body = json.dumps(body, ensure_ascii=False)
+            docs.append({
+                'kind': 'category', 'name': c.get('title') or c.get('name') or c.get('slug'), 'details': body[:600],
+                'text': ' '.join(filter(None, [c.get('title'), c.get('name'), c.get('slug'), body])),
+            })
+
+        postings: Dict[str, List[tuple]] = {}
+        doc_len = []
+        places = set()
+        for i, d in enumerate(docs):
+            terms = _terms(d['text'])
+            d['terms'] = set(terms)
+            doc_len.append(len(terms))
+            tf: Dict[str, int] = {}
+            for t in terms:
+                tf[t] = tf.get(t, 0) + 1
+            for t, n in tf.items():
+                postings.setdefault(t, []).append((i, n))
+            for place in (d.get('commune'), d.get('city')):
+                if place:
+                    places.add(_normalize_text(place))
+        self.docs, self.postings, self.doc_len, self.places = docs, postings, doc_len, places
+        self.avgdl = (sum(doc_len) / len(doc_len)) if doc_len else 1.0
+        self.built_at = time.monotonic()
+        metrics['ai_retrieval_docs'] = len(docs)
+
+    def search(self, query: str, k: int, kinds: Optional[set] = None, place: Optional[str] = None) -> List[tuple]:
+        n = len(self.docs)
+        scores: Dict[int, float] = {}
+        for t in set(_terms(query)):
+            plist = self.postings.get(t)
+            if not plist:
+                continue
+            idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for i, tf in plist:
+                norm = tf + self.K1 * (1 - self.B + self.B * self.doc_len[i] / self.avgdl)
+                scores[i] = scores.get(i, 0.0) + idf * tf * (self.K1 + 1) / norm
+        hits = []
+        for i, score in sorted(scores.items(), key=lambda x: -x[1]):
+            d = self.docs[i]
+            if kinds and d['kind'] not in kinds:
+                continue
+            if place and place not in (_normalize_text(d.get('commune')), _normalize_text(d.get('city'))):
+                continue
+            hits.append((score, d))
+            if len(hits) >= k:
+                break
+        return hits
+
+    def _place_in(self, norm_query: str) -> Optional[str]:
+        padded = f" {norm_query} "
+        found = [p for p in self.places if p and f" {p} " in padded]
+        # the most specific place wins (e.g. a commune over the city)
+        return max(found, key=len) if found else None
+
+    def direct_answer(self, query: str) -> Optional[str]:
+        """Answer for a plain directory lookup ("pharmacie de garde à Cocody"), else None."""
+        norm = _normalize_text(query)
+        words = set(norm.split())
+        if words & _GENERATIVE_WORDS or len(words) > 15:
+            return None
+        kinds = {_LOOKUP_KINDS[w.rstrip('s')] for w in words if w.rstrip('s') in _LOOKUP_KINDS}
+        place = self._place_in(norm)
+        if not kinds or not place:
+            return None
+        hits = self.search(query, AI_RETRIEVAL_TOP_K * 4, kinds=kinds, place=place)
+        # beyond kind and place, the query's own terms ("dialyse") must be matched
+        specific = set(_terms(query)) - set(_terms(place)) - {w.rstrip('s') for w in _LOOKUP_KINDS} - {'garde'}
+        if specific:
+            hits = [h for h in hits if h[1]['terms'] & specific]
+        if 'pharmacy' in kinds and 'garde' in words:
+            hits = [h for h in hits if h[1]['kind'] != 'pharmacy' or compute_on_duty(h[1]['raw'])]
+        if not hits:
+            return None
+        lines = [_format_record(d) for _, d in hits[:AI_RETRIEVAL_TOP_K]]
+        return "Voici ce que j'ai trouvé dans l'annuaire Allô Services :\n\n" + '\n'.join(lines)
+
+def _format_record(d: Dict[str, Any]) -> str:
+    parts = [d.get('name') or '']
+    if d['kind'] == 'pharmacy' and compute_on_duty(d['raw']):
+        parts[0] += " (de garde aujourd'hui)"
+    for key in ('details', 'address', 'commune'):
+        if d.get(key):
+            parts.append(str(d[key]))
+    if d.get('phones'):
+        parts.append('Tél : ' + ', '.join(d['phones']))
+    return '• ' + ' — '.join(parts)
+
+retrieval_index = RetrievalIndex(AI_RETRIEVAL_MAX_AGE_S)
+
+@api.post('/ai/chat')
+async def ai_chat(payload: ChatRequest, claims: Optional[Dict[str, Any]] = Depends(session_claims)):
+    """
+    Allô IA chat. stream=true (default) relays tokens as Server-Sent Events
+    (`data: {"content": ...}` ... `data: [DONE]`); stream=false returns {"content": ...}.
+    """
+    if not payload.messages:
+        raise HTTPException(status_code=400, detail="messages must not be empty")
+    uid: Optional[ObjectId] = None
+    premium = False
+    if claims is not None:
+        uid, premium = ObjectId(claims['sub']), claims_premium(claims)
+        if not premium:
+            # the token may predate a payment: confirm against the entitlement cache / users
+            premium = await _is_user_premium(uid)
+    elif payload.user_id:
+        # a body user_id proves nothing: without a session the request is anonymous
+        metrics['ai_unverified_user_id_total'] += 1
+    if AI_PREMIUM_ONLY and not premium:
+        raise HTTPException(status_code=403, detail="Allô IA est réservé aux membres Premium")
+
+    temperature = TEMPERATURE_DEFAULT if payload.temperature is None else max(0.0, min(2.0, payload.temperature))
+    max_tokens = MAX_TOKENS_DEFAULT if not payload.max_tokens else max(1, min(payload.max_tokens, MAX_TOKENS_DEFAULT))
+    messages = _chat_messages(payload)
+    metrics['ai_requests_total'] += 1
+    sse_headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+    question = next((m.content for m in reversed(payload.messages) if m.role == 'user'), '')
+    await retrieval_index.ensure_fresh()
+    direct = retrieval_index.direct_answer(question)
+    if direct is not None:
+        metrics['ai_retrieval_direct_answers'] += 1
+        if payload.stream is False:
+            return JSONResponse({"content": direct}, headers={'X-Answer-Source': 'index'})
+        return StreamingResponse(_replay_sse(direct), media_type='text/event-stream', headers={**sse_headers, 'X-Answer-Source': 'index'})
+    hits = retrieval_index.search(question, AI_RETRIEVAL_TOP_K)
+    if hits:
+        metrics['ai_retrieval_injected'] += 1
+        context = '\n'.join(_format_record(d) for _, d in hits)
+        messages.insert(1, {'role': 'system', 'content': "Données locales Allô Services (à utiliser en priorité si pertinentes) :\n" + context})
+
+    cache_key = ai_cache_key(messages, temperature, max_tokens)
+    cached = await ai_cache_get(cache_key)
+    if cached is not None:
+        if payload.stream is False:
+            return JSONResponse({"content": cached['content']}, headers={'X-Cache': 'HIT'})
+        return StreamingResponse(_replay_sse(cached['content']), media_type='text/event-stream', headers={**sse_headers, 'X-Cache': 'HIT'})
+
+    # index and cache answers need no upstream: only a miss requires the key
+    if not EMERGENT_API_KEY:
+        raise HTTPException(status_code=500, detail="EMERGENT_API_KEY not configured")
+    messages = fit_context(messages)
+    metrics['ai_context_tokens_sum'] += sum(_message_tokens(m) for m in messages)
+
+    # premium first, then registered users; anonymous requests (often many users behind one
+    # carrier NAT address) are not tied to a shared key and go last
+    if uid:
+        user_key, priority = str(uid), (0 if premium else 1)
+    else:
+        user_key, priority = f"anon:{uuid.uuid4().hex}", 2
+    try:
+        slot = await ai_admission.acquire(user_key, priority, AI_QUEUE_TIMEOUT_S)
+    except AdmissionRejected:
+        raise HTTPException(status_code=503, detail="Service IA saturé, réessayez dans un instant", headers={'Retry-After': '5'})
+
+    if payload.stream is False:
+        t0 = time.perf_counter()
+        meta: Dict[str, Any] = {}
+        try:
+            content = await llm_complete(messages, temperature, max_tokens, meta)
+        except Exception:
+            logger.exception("AI completion failed")
+            metrics['ai_upstream_errors_total'] += 1
+            raise HTTPException(status_code=502, detail="Service IA indisponible")
+        finally:
+            slot.release()
+        await ai_cache_put(cache_key, messages, content, (time.perf_counter() - t0) * 1000.0, meta.get('finish_reason'))
+        return JSONResponse({"content": content}, headers={'X-Cache': 'MISS'})
+
+    return StreamingResponse(
+        _chat_sse(messages, temperature, max_tokens, cache_key, slot),
+        media_type='text/event-stream',
+        headers={**sse_headers, 'X-Cache': 'MISS'},
+        # also runs when the client disconnects before the stream started
+        background=BackgroundTask(slot.release),
+    )
 
 # Mount API
 app.include_router(api)
 
 # Startup tasks
+background_tasks: List[asyncio.Task] = []
+
+async def event_loop_monitor():
+    """Measures how late the loop wakes a fixed-interval sleeper; late wake-ups are loop stalls."""
+    while True:
+        t0 = time.perf_counter()
+        await asyncio.sleep(LOOP_MONITOR_INTERVAL_S)
+        lag_ms = (time.perf_counter() - t0 - LOOP_MONITOR_INTERVAL_S) * 1000.0
+        metrics['event_loop_lag_ms_max'] = max(metrics['event_loop_lag_ms_max'], lag_ms)
+        if lag_ms >= LOOP_STALL_THRESHOLD_MS:
+            metrics['event_loop_stalls_total'] += 1
+            metrics['event_loop_stall_ms_total'] += lag_ms
+
+async def migrate_users():
+    # sequential: a phone merge must not race a photo move for the same user
+    try:
+        await migrate_user_phones()
+        await migrate_user_photos()
+    except Exception:
+        # both migrations resume from db.migrations on the next startup
+        metrics['user_migration_errors_total'] += 1
+        logger.exception("User migration failed")
+
+async def migrate_jobs():
+    try:
+        await migrate_job_cities()
+    except Exception:
+        # resumes from the jobs still missing city_key on the next startup
+        metrics['job_migration_errors_total'] += 1
+        logger.exception("Job migration failed")
+
 @app.on_event('startup')
 async def on_startup():
+    background_tasks.append(asyncio.create_task(event_loop_monitor()))
+    await cinetpay.start()
+    if EMERGENT_API_KEY:
+        llm_client()
     await ensure_indexes()
+    await alert_dedup.warm()
+    await saved_searches.warm()
+    await price_detector.warm()
+    await price_watches.warm()
+    background_tasks.append(asyncio.create_task(migrate_users()))
+    background_tasks.append(asyncio.create_task(migrate_jobs()))
+    geocoder.load(GEO_BOUNDARIES_PATH)
     # Seed health facilities for Abidjan if none
-    await seed_health_facilities()
\ No newline at end of file
+    await seed_health_facilities()
+    await seed_categories()
+    await category_snapshot.reload()
+    await seed_locations()
+    await load_locations()
+    if cinetpay_live():
+        background_tasks.append(asyncio.create_task(reconcile_loop()))
+
+@app.on_event('shutdown')
+async def on_shutdown():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await cinetpay.close()
+    if _llm is not None:
+        await _llm.close()
+    if _push_http is not None:
+        await _push_http.aclose()
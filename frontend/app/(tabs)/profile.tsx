@@ -69,7 +69,7 @@ export default function Profile() {
     try {
       const res = await apiFetch('/api/payments/cinetpay/initiate', {
         method: 'POST', headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ user_id: user.id, amount_fcfa: 1200 })
+        body: JSON.stringify({ user_id: user.id })
       });
       const json = await res.json().catch(() => ({}));
       if (res.ok && (json as any).payment_url) {
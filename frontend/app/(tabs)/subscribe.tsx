@@ -49,7 +49,7 @@ export default function Subscribe() {
     try {
       const res = await apiFetch('/api/payments/cinetpay/initiate', {
         method: 'POST', headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ user_id: user.id, amount_fcfa: 1200 })
+        body: JSON.stringify({ user_id: user.id })
       });
       const json: any = await res.json().catch(() => ({}));
       if (res.ok && json.payment_url) {
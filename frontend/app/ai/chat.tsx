@@ -2,8 +2,8 @@ import React, { useRef, useState, useEffect } from 'react';
 import { View, Text, StyleSheet, KeyboardAvoidingView, Platform, TextInput, TouchableOpacity, FlatList, SafeAreaView, ActivityIndicator, Alert, ScrollView } from 'react-native';
 import { Ionicons } from '@expo/vector-icons';
 import AsyncStorage from '@react-native-async-storage/async-storage';
-import { useAuth } from '../../src/context/AuthContext';
 import { useRouter } from 'expo-router';
+import { apiFetch } from '../../src/utils/api';
 
 const QUICK_PROMPTS: string[] = [
   "Rédige une demande d’attestation de travail adressée à mon employeur.",
@@ -35,7 +35,6 @@ const STORAGE_RECENTS = 'ai_quick_prompts_recent';
 const MAX_RECENTS = 10;
 
 export default function ChatAIA() {
-  const { user } = useAuth();
   // Premium temporairement désactivé: accès pour tous
   const isPremium = true;
   const router = useRouter();
@@ -136,7 +135,7 @@ export default function ChatAIA() {
       const ctrl = new AbortController();
       abortRef.current = ctrl;
 
-      const resp = await fetch('/api/ai/chat', {
+      const resp = await apiFetch('/api/ai/chat', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         signal: ctrl.signal,
@@ -188,7 +187,7 @@ export default function ChatAIA() {
 
   const tryComplete = async (conv: Msg[]) => {
     try {
-      const resp = await fetch('/api/ai/chat', {
+      const resp = await apiFetch('/api/ai/chat', {
         method: 'POST', headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ messages: conv.map(m => ({ role: m.role, content: m.content })), stream: false, temperature: temperature, max_tokens: 1000 }),
       });
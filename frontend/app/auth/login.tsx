@@ -0,0 +1,90 @@
+import React, { useState } from 'react';
+import { View, Text, StyleSheet, TextInput, TouchableOpacity, KeyboardAvoidingView, Platform, Alert, ScrollView, Image } from 'react-native';
+import { useAuth } from '../../src/context/AuthContext';
+import { useRouter, useLocalSearchParams } from 'expo-router';
+import { useI18n } from '../../src/i18n/i18n';
+
+const APP_ICON = require('../../assets/icons/icons/icon.png');
+
+export default function Login() {
+  const { requestLoginCode, login } = useAuth();
+  const router = useRouter();
+  const { t } = useI18n();
+  const params = useLocalSearchParams<{ phone?: string }>();
+  const [phone, setPhone] = useState(params.phone || '');
+  const [code, setCode] = useState('');
+  const [codeSent, setCodeSent] = useState(false);
+  const [loading, setLoading] = useState(false);
+
+  const onSendCode = async () => {
+    if (!phone) { Alert.alert(t('requiredFields'), t('requiredMsg')); return; }
+    setLoading(true);
+    try {
+      const r = await requestLoginCode(phone);
+      setCodeSent(true);
+      if (r.debug_code) setCode(r.debug_code);
+      Alert.alert(t('codeSent'));
+    } catch (e: any) {
+      Alert.alert(t('error'), e.message || 'Envoi du code échoué');
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  const onLogin = async () => {
+    if (!code) { Alert.alert(t('requiredFields'), t('requiredMsg')); return; }
+    setLoading(true);
+    try {
+      await login(phone, code);
+      router.replace('/(tabs)/profile');
+    } catch (e: any) {
+      Alert.alert(t('error'), e.message || 'Connexion échouée');
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  return (
+    <KeyboardAvoidingView behavior={Platform.OS === 'ios' ? 'padding' : 'height'} style={{ flex: 1 }}>
+      <ScrollView contentContainerStyle={styles.container} keyboardShouldPersistTaps="handled">
+        <View style={{ alignItems: 'center', marginBottom: 8 }}>
+          <View style={styles.logoContainer}>
+            <Image source={APP_ICON} style={styles.logo} />
+          </View>
+          <Text style={styles.brand}>Allô Services CI</Text>
+          <Text style={styles.title}>{t('loginTitle')}</Text>
+        </View>
+
+        <TextInput placeholder={t('phonePh')} value={phone} onChangeText={setPhone} keyboardType="phone-pad" editable={!codeSent} style={styles.input} />
+        {codeSent && (
+          <TextInput placeholder={t('codePh')} value={code} onChangeText={setCode} keyboardType="number-pad" maxLength={6} style={styles.input} />
+        )}
+
+        <TouchableOpacity disabled={loading} onPress={codeSent ? onLogin : onSendCode} style={[styles.btn, loading && { opacity: 0.5 }]}>
+          <Text style={styles.btnText}>{loading ? '...' : (codeSent ? t('loginAction') : t('sendCode'))}</Text>
+        </TouchableOpacity>
+        {codeSent && (
+          <TouchableOpacity disabled={loading} onPress={onSendCode} style={styles.linkBtn}>
+            <Text style={styles.link}>{t('resendCode')}</Text>
+          </TouchableOpacity>
+        )}
+        <TouchableOpacity onPress={() => router.replace('/auth/register')} style={styles.linkBtn}>
+          <Text style={styles.link}>{t('noAccount')}</Text>
+        </TouchableOpacity>
+      </ScrollView>
+    </KeyboardAvoidingView>
+  );
+}
+
+const styles = StyleSheet.create({
+  container: { flexGrow: 1, padding: 16, backgroundColor: '#fff', justifyContent: 'center' },
+  logoContainer: { width: 110, height: 110, borderRadius: 55, borderWidth: 4, borderColor: '#0A7C3A', backgroundColor: '#ffffff', alignItems: 'center', justifyContent: 'center', marginBottom: 6 },
+  logo: { width: 88, height: 88, borderRadius: 44, borderWidth: 3, borderColor: '#ffffff' },
+  brand: { fontSize: 20, fontWeight: '800', color: '#0A7C3A', marginTop: 6, textAlign: 'center' },
+  title: { fontSize: 22, fontWeight: '800', color: '#0A7C3A', marginTop: 2, marginBottom: 16, textAlign: 'center' },
+  input: { borderWidth: 1, borderColor: '#E8F0E8', borderRadius: 10, padding: 12, marginBottom: 12, backgroundColor: '#FAFAF8' },
+  btn: { backgroundColor: '#0F5132', padding: 12, borderRadius: 10, alignItems: 'center', marginTop: 8 },
+  btnText: { color: '#fff', fontWeight: '700' },
+  linkBtn: { alignItems: 'center', marginTop: 14 },
+  link: { color: '#0A7C3A', textDecorationLine: 'underline', fontWeight: '600' },
+});
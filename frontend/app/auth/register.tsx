@@ -32,7 +32,14 @@ export default function Register() {
       setTimeout(() => Alert.alert(t('profileReady')), 50);
       router.replace('/(tabs)/profile');
     } catch (e: any) {
-      Alert.alert(t('error'), e.message || 'Inscription échouée');
+      if (e.message === 'Phone already registered') {
+        // known phone: the account is recovered by SMS code, never by registering again
+        Alert.alert(t('phoneTaken'), t('phoneTakenMsg'), [
+          { text: t('loginAction'), onPress: () => router.replace({ pathname: '/auth/login', params: { phone } }) },
+        ]);
+      } else {
+        Alert.alert(t('error'), e.message || 'Inscription échouée');
+      }
     } finally {
       setLoading(false);
     }
@@ -89,6 +96,9 @@ export default function Register() {
         <TouchableOpacity disabled={!acceptLegal || loading} onPress={onSubmit} style={[styles.btn, (!acceptLegal || loading) && { opacity: 0.5 }]}>
           <Text style={styles.btnText}>{loading ? '...' : t('submit')}</Text>
         </TouchableOpacity>
+        <TouchableOpacity onPress={() => router.replace('/auth/login')} style={styles.linkBtn}>
+          <Text style={styles.link}>{t('haveAccount')}</Text>
+        </TouchableOpacity>
       </ScrollView>
     </KeyboardAvoidingView>
   );
@@ -109,4 +119,5 @@ const styles = StyleSheet.create({
   legalLabel: { flex: 1, fontSize: 13, color: '#333', lineHeight: 18 },
   legalError: { marginTop: 4, color: '#EF4444', textAlign: 'center', fontSize: 12 },
   link: { color: '#0A7C3A', textDecorationLine: 'underline', fontWeight: '600' },
+  linkBtn: { alignItems: 'center', marginTop: 14 },
 });
\ No newline at end of file
@@ -5,7 +5,7 @@ import * as Clipboard from 'expo-clipboard';
 import { LinearGradient } from 'expo-linear-gradient';
 import { useLocalSearchParams, useRouter } from 'expo-router';
 import { useI18n } from '../../src/i18n/i18n';
-import { CONTENT_BY_CATEGORY } from '../../src/utils/categoryContent';
+import { CONTENT_BY_CATEGORY, CatItem } from '../../src/utils/categoryContent';
 import { CI_CITIES } from '../../src/utils/cities';
 import AsyncStorage from '@react-native-async-storage/async-storage';
 import { apiFetch } from '../../src/utils/api';
@@ -141,7 +141,23 @@ export default function CategoryPage() {
   }, [s]);
 
 
-  const data = CONTENT_BY_CATEGORY[s] || [];
+  // Contenu servi par l'API (ETag/304 côté serveur); le contenu embarqué reste le repli hors ligne
+  const [remoteItems, setRemoteItems] = React.useState<CatItem[] | null>(null);
+  React.useEffect(() => {
+    let cancelled = false;
+    setRemoteItems(null);
+    (async () => {
+      try {
+        const res = await apiFetch(`/api/categories/${s}`);
+        if (!res.ok) return;
+        const j = await res.json();
+        if (!cancelled && Array.isArray(j?.items)) setRemoteItems(j.items);
+      } catch (e) {}
+    })();
+    return () => { cancelled = true; };
+  }, [s]);
+
+  const data = remoteItems || CONTENT_BY_CATEGORY[s] || [];
   const isUrgence = s === 'urgence';
 
   const openSource = async (url?: string) => { if (!url) return; try { await Linking.openURL(url); } catch (e) {} };
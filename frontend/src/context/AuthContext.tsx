@@ -3,7 +3,7 @@ import AsyncStorage from '@react-native-async-storage/async-storage';
 import * as Notifications from 'expo-notifications';
 import Constants from 'expo-constants';
 import { Platform } from 'react-native';
-import { apiFetch } from '../utils/api';
+import { apiFetch, setApiSession, onApiSessionChange, ApiSession } from '../utils/api';
 
 export type User = {
   id: string;
@@ -22,6 +22,8 @@ type AuthContextType = {
   user: User | null;
   expoPushToken: string | null;
   register: (input: { first_name: string; last_name: string; email?: string; phone: string; preferred_lang?: string; pseudo?: string; show_pseudo?: boolean }) => Promise<void>;
+  requestLoginCode: (phone: string) => Promise<{ debug_code?: string }>;
+  login: (phone: string, code: string) => Promise<void>;
   updateProfile: (input: Partial<User>) => Promise<User>;
   logout: () => Promise<void>;
   refreshUserData?: () => Promise<void>;
@@ -31,6 +33,8 @@ const AuthContext = createContext<AuthContextType>({
   user: null,
   expoPushToken: null,
   register: async () => {},
+  requestLoginCode: async () => ({}),
+  login: async () => {},
   updateProfile: async () => ({ id: '' } as any),
   logout: async () => {},
 });
@@ -42,10 +46,35 @@ export const AuthProvider: React.FC<{ children: React.ReactNode }> = ({ children
   useEffect(() => {
     (async () => {
       const raw = await AsyncStorage.getItem('auth_user');
-      if (raw) setUser(JSON.parse(raw));
+      const rawSession = await AsyncStorage.getItem('auth_session');
+      if (raw && rawSession) {
+        setApiSession(JSON.parse(rawSession));
+        setUser(JSON.parse(raw));
+      } else if (raw) {
+        // profile saved before sessions existed: sign in again (SMS code) to get one
+        await AsyncStorage.removeItem('auth_user');
+      }
     })();
+    // persist every rotation; a revoked session (failed refresh) signs the user out
+    return onApiSessionChange(async (s) => {
+      if (s) {
+        await AsyncStorage.setItem('auth_session', JSON.stringify(s));
+      } else {
+        await AsyncStorage.multiRemove(['auth_session', 'auth_user']);
+        setUser(null);
+      }
+    });
   }, []);
 
+  // the API answers a user document plus its token pair; keep the tokens out of the profile
+  const startSession = async (data: any, extra?: Partial<User>) => {
+    const { access_token, refresh_token, token_type, expires_in, ...u } = data;
+    setApiSession({ access_token, refresh_token } as ApiSession);
+    const merged = { ...u, ...extra } as User;
+    setUser(merged);
+    await AsyncStorage.setItem('auth_user', JSON.stringify(merged));
+  };
+
   // Skip Expo Go Android remote notifications to avoid SDK 53 error
   const canInitRemotePush = !(Platform.OS === 'android' && Constants.appOwnership === 'expo');
 
@@ -70,9 +99,10 @@ export const AuthProvider: React.FC<{ children: React.ReactNode }> = ({ children
     (async () => {
       try {
         if (expoPushToken) {
+          // the owner comes from the session apiFetch attaches; signed out, the token is unlinked
           await apiFetch('/api/notifications/register', {
             method: 'POST', headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ token: expoPushToken, user_id: user?.id, platform: Platform.OS, city: user?.city })
+            body: JSON.stringify({ token: expoPushToken, platform: Platform.OS, city: user?.city })
           });
         }
       } catch (e) {
@@ -82,20 +112,37 @@ export const AuthProvider: React.FC<{ children: React.ReactNode }> = ({ children
   }, [expoPushToken, user?.id, user?.city]);
 
   const register = async (input: { first_name: string; last_name: string; email?: string; phone: string; preferred_lang?: string; pseudo?: string; show_pseudo?: boolean }) => {
-    const res = await apiFetch('/api/auth/register', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(input) });
+    // one key per registration attempt, kept until it succeeds: a retry after a lost answer
+    // (flaky network) gets the same account back instead of 409
+    const pending = JSON.parse((await AsyncStorage.getItem('pending_registration')) || 'null');
+    const key = pending?.phone === input.phone ? pending.key : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}-${Math.random().toString(36).slice(2)}`;
+    await AsyncStorage.setItem('pending_registration', JSON.stringify({ phone: input.phone, key }));
+    const res = await apiFetch('/api/auth/register', { method: 'POST', headers: { 'Content-Type': 'application/json', 'Idempotency-Key': key }, body: JSON.stringify(input) });
     if (!res.ok) {
       const j = await res.json().catch(() => ({} as any));
       throw new Error((j as any).detail || 'Inscription échouée');
     }
     const u = await res.json();
+    await AsyncStorage.removeItem('pending_registration');
     // Merge local pseudo preferences in case backend does not persist them yet
-    const merged = {
-      ...u,
+    await startSession(u, {
       pseudo: (input.pseudo ?? (u as any).pseudo),
       show_pseudo: (input.show_pseudo ?? (u as any).show_pseudo),
-    } as User;
-    setUser(merged);
-    await AsyncStorage.setItem('auth_user', JSON.stringify(merged));
+    });
+  };
+
+  const requestLoginCode = async (phone: string) => {
+    const res = await apiFetch('/api/auth/otp', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ phone }) });
+    const j = await res.json().catch(() => ({} as any));
+    if (!res.ok) throw new Error((j as any).detail || 'Envoi du code échoué');
+    return j as { debug_code?: string };
+  };
+
+  const login = async (phone: string, code: string) => {
+    const res = await apiFetch('/api/auth/login', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ phone, code }) });
+    const j = await res.json().catch(() => ({} as any));
+    if (!res.ok) throw new Error((j as any).detail || 'Connexion échouée');
+    await startSession(j);
   };
 
   const refreshUserData = async () => {
@@ -116,11 +163,12 @@ export const AuthProvider: React.FC<{ children: React.ReactNode }> = ({ children
   };
 
   const logout = async () => {
+    setApiSession(null);
     setUser(null);
-    await AsyncStorage.removeItem('auth_user');
+    await AsyncStorage.multiRemove(['auth_session', 'auth_user']);
   };
 
-  const value = useMemo(() => ({ user, expoPushToken, register, updateProfile, logout, refreshUserData }), [user, expoPushToken]);
+  const value = useMemo(() => ({ user, expoPushToken, register, requestLoginCode, login, updateProfile, logout, refreshUserData }), [user, expoPushToken]);
   return <AuthContext.Provider value={value}>{children}</AuthContext.Provider>;
 };
 
@@ -112,6 +112,16 @@ const translations: Record<LangKey, Dict> = {
     profileReady: 'Profil créé avec succès !',
     loginRequired: 'Connexion requise',
     needAccount: 'Veuillez créer un compte pour accéder à cette page',
+    loginTitle: 'Se connecter',
+    sendCode: 'Recevoir un code par SMS',
+    codePh: 'Code reçu par SMS',
+    codeSent: 'Code envoyé par SMS',
+    resendCode: 'Renvoyer le code',
+    loginAction: 'Se connecter',
+    haveAccount: 'Déjà un compte ? Se connecter',
+    noAccount: 'Pas encore de compte ? S\'inscrire',
+    phoneTaken: 'Numéro déjà inscrit',
+    phoneTakenMsg: 'Connectez-vous avec le code reçu par SMS',
 
     // Légal
     legalConsentPrefix: 'J\'accepte les',
@@ -213,6 +223,16 @@ const translations: Record<LangKey, Dict> = {
     profileReady: 'Profile created successfully!',
     loginRequired: 'Login required',
     needAccount: 'Please create an account to access this page',
+    loginTitle: 'Sign in',
+    sendCode: 'Get a code by SMS',
+    codePh: 'Code received by SMS',
+    codeSent: 'Code sent by SMS',
+    resendCode: 'Send the code again',
+    loginAction: 'Sign in',
+    haveAccount: 'Already have an account? Sign in',
+    noAccount: 'No account yet? Register',
+    phoneTaken: 'Phone already registered',
+    phoneTakenMsg: 'Sign in with the code sent by SMS',
 
     // Legal
     legalConsentPrefix: 'I agree to the',
@@ -19,10 +19,61 @@ export function makeApiUrl(path: string): string {
   return joinBaseAndPath(getBackendBase(), path);
 }
 
+export type ApiSession = { access_token: string; refresh_token: string };
+
+// Bearer session shared by every apiFetch call; AuthContext loads, persists and clears it.
+let session: ApiSession | null = null;
+let refreshing: Promise<boolean> | null = null;
+const sessionListeners = new Set<(s: ApiSession | null) => void>();
+
+export function setApiSession(next: ApiSession | null) {
+  session = next;
+  sessionListeners.forEach((cb) => cb(next));
+}
+
+export function onApiSessionChange(cb: (s: ApiSession | null) => void) {
+  sessionListeners.add(cb);
+  return () => { sessionListeners.delete(cb); };
+}
+
+// One refresh at a time: a refresh token is single-use, so concurrent 401s share the rotation.
+function refreshSession(): Promise<boolean> {
+  if (!refreshing) {
+    refreshing = (async () => {
+      const current = session;
+      if (!current?.refresh_token) return false;
+      try {
+        const res = await fetch(makeApiUrl('/api/auth/refresh'), {
+          method: 'POST', headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({ refresh_token: current.refresh_token }),
+        });
+        if (!res.ok) { setApiSession(null); return false; }
+        const j = await res.json();
+        setApiSession({ access_token: j.access_token, refresh_token: j.refresh_token });
+        return true;
+      } catch {
+        return false;
+      }
+    })().finally(() => { refreshing = null; });
+  }
+  return refreshing;
+}
+
+function withAuth(init?: RequestInit): RequestInit {
+  if (!session?.access_token) return init || {};
+  const headers = new Headers(init?.headers || {});
+  if (!headers.has('Authorization')) headers.set('Authorization', `Bearer ${session.access_token}`);
+  return { ...init, headers };
+}
+
 export async function apiFetch(path: string, init?: RequestInit) {
   try {
     const url = makeApiUrl(path);
-    const res = await fetch(url, init);
+    let res = await fetch(url, withAuth(init));
+    // expired access token: rotate once and replay (never for the auth routes themselves)
+    if (res.status === 401 && session?.refresh_token && !/\/auth\//.test(path) && await refreshSession()) {
+      res = await fetch(url, withAuth(init));
+    }
     return res;
   } catch (e: any) {
     if (e?.message === 'BACKEND_URL_MISSING') {
@@ -33,4 +84,4 @@ export async function apiFetch(path: string, init?: RequestInit) {
     }
     throw e;
   }
-}
\ No newline at end of file
+}
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Notifications test suite for Allô Services CI
+Checks that matched content reaches the user's inbox and that device tokens stay bound to
+their owner:
+1) Push tokens: linked to the signed-in user only (403 for another user_id)
+2) Saved searches: a new job matching a saved search lands in the inbox, once; inbox and
+   searches answer only the owner's session
+3) Price watches: a batch crossing a threshold notifies; replaying the batch does not
+4) Admin send: the fan-out report counts failed chunks instead of erroring
+
+Needs the admin key for POST /api/jobs, /api/commodities/prices and /api/notifications/send.
+
+Usage: BACKEND_URL=http://localhost:8001/api ADMIN_API_KEY=... python notifications_flow_test.py
+"""
+
+import os
+import sys
+import time
+import uuid
+import random
+import requests
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+
+BACKEND_URL = os.environ.get("BACKEND_URL", "http://localhost:8001/api")
+ADMIN_API_KEY = os.environ.get("ADMIN_API_KEY", "")
+DELIVERY_TIMEOUT_S = 10.0
+
+
+class NotificationsFlowTester:
+    def __init__(self):
+        self.base_url = BACKEND_URL
+        self.session = requests.Session()
+        self.test_results = []
+        self.user: Optional[Dict[str, Any]] = None
+        self.run = uuid.uuid4().hex[:8]
+
+    def log_test(self, test_name: str, success: bool, details: str = ""):
+        """Log test result"""
+        status = "✅ PASS" if success else "❌ FAIL"
+        print(f"{status} {test_name}")
+        if details:
+            print(f"   Details: {details}")
+        self.test_results.append({'test': test_name, 'success': success, 'details': details})
+
+    def make_request(self, method: str, endpoint: str, token: Optional[str] = None, admin: bool = False, **kwargs) -> requests.Response:
+        headers = kwargs.pop('headers', {})
+        if token:
+            headers['Authorization'] = f"Bearer {token}"
+        if admin:
+            headers['X-Admin-Key'] = ADMIN_API_KEY
+        return self.session.request(method, f"{self.base_url}{endpoint}", headers=headers, timeout=30, **kwargs)
+
+    def inbox(self, kind: str) -> List[Dict[str, Any]]:
+        response = self.make_request('GET', '/notifications', token=self.user['access_token'])
+        return [n for n in response.json() if n.get('kind') == kind] if response.status_code == 200 else []
+
+    def wait_for(self, kind: str, count: int) -> List[Dict[str, Any]]:
+        """Delivery runs off the request path: poll the inbox until `count` items arrive"""
+        deadline = time.monotonic() + DELIVERY_TIMEOUT_S
+        items = self.inbox(kind)
+        while len(items) < count and time.monotonic() < deadline:
+            time.sleep(0.2)
+            items = self.inbox(kind)
+        return items
+
+    def test_register_user(self):
+        try:
+            phone = "+225 05 " + " ".join(f"{random.randint(0, 99):02d}" for _ in range(4))
+            response = self.make_request('POST', '/auth/register', json={
+                "first_name": "Mariam", "last_name": "Coulibaly", "phone": phone, "preferred_lang": "fr", "city": "Abidjan",
+            })
+            self.user = response.json() if response.status_code == 200 else None
+            self.log_test("Register user", bool(self.user), f"Status {response.status_code}")
+        except Exception as e:
+            self.log_test("Register user", False, f"Exception: {str(e)}")
+
+    def test_push_token_ownership(self):
+        """A session may only link a device token to its own user"""
+        if not self.user:
+            self.log_test("Push token linked to own user", False, "No user")
+            return
+        try:
+            token = f"ExpoPushToken[test-{self.run}]"
+            response = self.make_request('POST', '/notifications/register', token=self.user['access_token'],
+                                         json={"token": token, "platform": "android"})
+            self.log_test("Push token linked to own user", response.status_code == 200, f"Status {response.status_code}: {response.text}")
+
+            response = self.make_request('POST', '/notifications/register', token=self.user['access_token'],
+                                         json={"token": token, "user_id": "0" * 24})
+            self.log_test("Push token for another user → 403", response.status_code == 403, f"Status {response.status_code}")
+        except Exception as e:
+            self.log_test("Push token linked to own user", False, f"Exception: {str(e)}")
+
+    def test_saved_search_delivery(self):
+        """A job matching a saved search is delivered to the inbox exactly once"""
+        if not self.user:
+            self.log_test("Saved search match delivered", False, "No user")
+            return
+        try:
+            sector = f"test-{self.run}"
+            response = self.make_request('POST', '/saved-searches', token=self.user['access_token'], json={
+                "kind": "job", "city": "Abidjan", "type": sector,
+            })
+            if response.status_code != 200:
+                self.log_test("Saved search match delivered", False, f"Create search: {response.status_code} {response.text}")
+                return
+            job = self.make_request('POST', '/jobs', admin=True, json={
+                "title": "Comptable", "company": "Test SARL", "city": "Abidjan", "sector": sector,
+                "description": "Poste de comptable à Abidjan",
+            })
+            if job.status_code != 200:
+                self.log_test("Saved search match delivered", False, f"Create job: {job.status_code} {job.text}")
+                return
+            items = [n for n in self.wait_for('job', 1) if n.get('ref_id') == job.json()['id']]
+            self.log_test("Saved search match delivered", len(items) == 1, f"{len(items)} notification(s) for the job")
+        except Exception as e:
+            self.log_test("Saved search match delivered", False, f"Exception: {str(e)}")
+
+    def test_inbox_requires_owner(self):
+        """Inbox and saved searches are only reachable with the owner's session"""
+        if not self.user:
+            self.log_test("Inbox requires the owner's session", False, "No user")
+            return
+        try:
+            anonymous = self.make_request('GET', '/notifications', params={"user_id": self.user['id']})
+            foreign = self.make_request('GET', '/saved-searches', token=self.user['access_token'], params={"user_id": "0" * 24})
+            self.log_test("Inbox requires the owner's session", anonymous.status_code == 401 and foreign.status_code == 403,
+                          f"Without session: {anonymous.status_code}, other user_id: {foreign.status_code}")
+        except Exception as e:
+            self.log_test("Inbox requires the owner's session", False, f"Exception: {str(e)}")
+
+    def ingest(self, commodity: str, prices: List[float], start: datetime) -> requests.Response:
+        return self.make_request('POST', '/commodities/prices', admin=True, json=[
+            {"commodity": commodity, "market": "Adjamé", "price": p, "unit": "kg",
+             "observed_at": (start + timedelta(minutes=i)).isoformat()}
+            for i, p in enumerate(prices)
+        ])
+
+    def test_price_watch_trigger_and_replay(self):
+        """Crossing a threshold notifies once; replaying the same batch is ignored"""
+        if not self.user:
+            self.log_test("Price watch triggers", False, "No user")
+            return
+        try:
+            commodity = f"riz-{self.run}"
+            response = self.make_request('POST', '/price-watches', token=self.user['access_token'], json={
+                "commodity": commodity, "market": "Adjamé", "above": 500, "anomalies": False,
+            })
+            if response.status_code != 200:
+                self.log_test("Price watch triggers", False, f"Create watch: {response.status_code} {response.text}")
+                return
+            start = datetime.utcnow() - timedelta(hours=1)
+            first = self.ingest(commodity, [400, 410], start)
+            second = self.ingest(commodity, [450, 620], start + timedelta(minutes=10))
+            if first.status_code != 200 or second.status_code != 200:
+                self.log_test("Price watch triggers", False, f"Ingest: {first.status_code} / {second.status_code}")
+                return
+            items = self.wait_for('price', 1)
+            self.log_test("Price watch triggers", len(items) == 1, f"{len(items)} price notification(s)")
+
+            replay = self.ingest(commodity, [450, 620], start + timedelta(minutes=10))
+            self.log_test("Replayed batch is recognised", replay.status_code == 200 and replay.json().get('replayed') is True,
+                          f"Status {replay.status_code}: {replay.text}")
+            time.sleep(1.0)
+            self.log_test("Replayed batch does not notify again", len(self.inbox('price')) == 1)
+
+            watch_id = response.json()['id']
+            anonymous = self.make_request('GET', '/price-watches', params={"user_id": self.user['id']})
+            foreign = self.make_request('DELETE', f'/price-watches/{watch_id}', token=self.user['access_token'], params={"user_id": "0" * 24})
+            self.log_test("Price watches require the owner's session", anonymous.status_code == 401 and foreign.status_code == 403,
+                          f"Without session: {anonymous.status_code}, other user_id: {foreign.status_code}")
+        except Exception as e:
+            self.log_test("Price watch triggers", False, f"Exception: {str(e)}")
+
+    def test_admin_send_report(self):
+        """The fan-out report always answers, with per-chunk errors counted"""
+        try:
+            response = self.make_request('POST', '/notifications/send', admin=True, json={
+                "title": "Test", "body": f"run {self.run}", "city": f"nowhere-{self.run}",
+            })
+            data = response.json() if response.status_code == 200 else {}
+            self.log_test("Admin send report", {'matched', 'sent', 'failed', 'errors'} <= set(data),
+                          f"Status {response.status_code}: {data or response.text}")
+        except Exception as e:
+            self.log_test("Admin send report", False, f"Exception: {str(e)}")
+
+    def run_all_tests(self):
+        print("🔔 NOTIFICATIONS FLOW TESTS")
+        print(f"Base URL: {self.base_url}")
+        print("=" * 60)
+        if not ADMIN_API_KEY:
+            print("ADMIN_API_KEY is required")
+            return False
+        self.test_register_user()
+        self.test_push_token_ownership()
+        self.test_saved_search_delivery()
+        self.test_inbox_requires_owner()
+        self.test_price_watch_trigger_and_replay()
+        self.test_admin_send_report()
+
+        passed = sum(1 for result in self.test_results if result['success'])
+        total = len(self.test_results)
+        print("\n" + "=" * 60)
+        print(f"Passed: {passed}/{total}")
+        for result in self.test_results:
+            if not result['success']:
+                print(f"  - {result['test']}: {result['details']}")
+        return passed == total
+
+
+if __name__ == "__main__":
+    tester = NotificationsFlowTester()
+    success = tester.run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Payment path benchmark for Allô Services CI
+Drives the full money path against a backend wired to the local CinetPay simulator
+(backend/cinetpay_simulator.py):
+  POST /api/payments/cinetpay/initiate → simulator webhook → subscription activation
+at rising concurrency, and reports per level:
+- throughput of completed flows (initiate until GET /api/subscriptions/check says premium)
+- p50/p99 initiate latency and p50/p99 time to activation
+- event-loop stall time on the backend (from GET /api/metrics)
+
+Setup:
+  cd backend && SIM_ACCEPT_RATE=1 uvicorn cinetpay_simulator:app --port 8010
+  cd backend && CINETPAY_MODE=live CINETPAY_BASE_URL=http://localhost:8010 CINETPAY_API_KEY=sim \\
+      CINETPAY_SITE_ID=sim CINETPAY_SECRET_KEY=sim-secret BACKEND_PUBLIC_BASE_URL=http://localhost:8001 \\
+      uvicorn server:app --port 8001
+
+Usage: BACKEND_URL=http://localhost:8001/api python payment_benchmark.py [flows_per_level]
+"""
+
+import os
+import sys
+import time
+import uuid
+import statistics
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_URL = os.environ.get("BACKEND_URL", "http://localhost:8001/api")
+FLOWS_PER_LEVEL = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+CONCURRENCY_LEVELS = [1, 10, 50, 100, 200]
+ACTIVATION_TIMEOUT_S = 30.0
+POLL_INTERVAL_S = 0.05
+
+
+def pct(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def metrics():
+    return requests.get(f"{BACKEND_URL}/metrics", timeout=10).json()
+
+
+def register(session: requests.Session) -> str:
+    body = {"first_name": "Bench", "last_name": "Pay", "phone": f"+225 05 {uuid.uuid4().int % 10**8:08d}", "city": "Abidjan"}
+    r = session.post(f"{BACKEND_URL}/auth/register", json=body, timeout=30)
+    r.raise_for_status()
+    return r.json()["id"]
+
+
+def flow(session: requests.Session, user_id: str):
+    """Returns (initiate_ms, activation_ms or None, ok)."""
+    t0 = time.perf_counter()
+    r = session.post(f"{BACKEND_URL}/payments/cinetpay/initiate", json={"user_id": user_id, "amount_fcfa": 1200}, timeout=60)
+    initiate_ms = (time.perf_counter() - t0) * 1000.0
+    if r.status_code != 200:
+        return initiate_ms, None, False
+    deadline = time.perf_counter() + ACTIVATION_TIMEOUT_S
+    while time.perf_counter() < deadline:
+        c = session.get(f"{BACKEND_URL}/subscriptions/check", params={"user_id": user_id}, timeout=30)
+        if c.status_code == 200 and c.json().get("is_premium"):
+            return initiate_ms, (time.perf_counter() - t0) * 1000.0, True
+        time.sleep(POLL_INTERVAL_S)
+    return initiate_ms, None, False
+
+
+def run_level(concurrency: int):
+    sessions = [requests.Session() for _ in range(concurrency)]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        users = list(pool.map(lambda i: register(sessions[i % concurrency]), range(FLOWS_PER_LEVEL)))
+        before = metrics()
+        t0 = time.perf_counter()
+        results = list(pool.map(lambda i: flow(sessions[i % concurrency], users[i]), range(FLOWS_PER_LEVEL)))
+        wall = time.perf_counter() - t0
+    after = metrics()
+
+    initiate = [r[0] for r in results]
+    activation = [r[1] for r in results if r[1] is not None]
+    ok = sum(1 for r in results if r[2])
+    stall_ms = after.get("event_loop_stall_ms_total", 0) - before.get("event_loop_stall_ms_total", 0)
+    print(f"c={concurrency:<4} ok={ok}/{len(results)}  {ok / wall:7.1f} flows/s  "
+          f"initiate p50={statistics.median(initiate):7.1f}ms p99={pct(initiate, 0.99):7.1f}ms  "
+          f"activation p50={pct(activation, 0.5):7.1f}ms p99={pct(activation, 0.99):7.1f}ms  "
+          f"loop stall={stall_ms:7.1f}ms (max lag {after.get('event_loop_lag_ms_max', 0):.1f}ms)")
+
+
+def main():
+    print("💳 PAYMENT END-TO-END BENCHMARK")
+    print(f"Target: {BACKEND_URL}  flows/level: {FLOWS_PER_LEVEL}")
+    print("=" * 70)
+    for c in CONCURRENCY_LEVELS:
+        run_level(c)
+    final = metrics()
+    print({k: v for k, v in final.items() if k.startswith(("cinetpay_", "transactions_"))})
+
+
+if __name__ == "__main__":
+    main()
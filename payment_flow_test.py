@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Payment flow test suite for Allô Services CI
+Runs against a backend wired to the local CinetPay simulator (backend/cinetpay_simulator.py)
+that accepts every payment and sends each notification several times:
+1) Webhook: a notification with a bad x-token is rejected (401)
+2) Initiate → simulator webhooks → the user becomes premium
+3) Idempotency: repeated and replayed notifications count the payment once
+4) History: the transaction is listed as ACCEPTED, to the payer's session only
+
+Setup:
+  cd backend && SIM_ACCEPT_RATE=1 SIM_WEBHOOK_REPEAT=3 uvicorn cinetpay_simulator:app --port 8010
+  cd backend && CINETPAY_MODE=live CINETPAY_BASE_URL=http://localhost:8010 CINETPAY_API_KEY=sim \\
+      CINETPAY_SITE_ID=sim CINETPAY_SECRET_KEY=sim-secret BACKEND_PUBLIC_BASE_URL=http://localhost:8001 \\
+      uvicorn server:app --port 8001
+
+Usage: BACKEND_URL=http://localhost:8001/api [CINETPAY_SECRET_KEY=sim-secret] python payment_flow_test.py
+"""
+
+import os
+import sys
+import time
+import hmac
+import random
+import hashlib
+import requests
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+BACKEND_URL = os.environ.get("BACKEND_URL", "http://localhost:8001/api")
+CINETPAY_SECRET_KEY = os.environ.get("CINETPAY_SECRET_KEY", "sim-secret")
+CINETPAY_SITE_ID = os.environ.get("CINETPAY_SITE_ID", "sim")
+ACTIVATION_TIMEOUT_S = 30.0
+
+# same order as CINETPAY_TOKEN_FIELDS in backend/server.py
+TOKEN_FIELDS = (
+    'cpm_site_id', 'cpm_trans_id', 'cpm_trans_date', 'cpm_amount', 'cpm_currency', 'signature',
+    'payment_method', 'cel_phone_num', 'cpm_phone_prefixe', 'cpm_language', 'cpm_version',
+    'cpm_payment_config', 'cpm_page_action', 'cpm_custom', 'cpm_designation', 'cpm_error_message',
+)
+
+
+def notification(transaction_id: str, amount: int) -> Dict[str, str]:
+    return {
+        'cpm_site_id': CINETPAY_SITE_ID, 'cpm_trans_id': transaction_id,
+        'cpm_trans_date': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'), 'cpm_amount': str(amount),
+        'cpm_currency': 'XOF', 'signature': 'test', 'payment_method': 'OMCIV2', 'cel_phone_num': '0700000000',
+        'cpm_phone_prefixe': '225', 'cpm_language': 'fr', 'cpm_version': 'V4', 'cpm_payment_config': 'SINGLE',
+        'cpm_page_action': 'PAYMENT', 'cpm_custom': '', 'cpm_designation': '', 'cpm_error_message': '',
+    }
+
+
+def sign(fields: Dict[str, str]) -> str:
+    data = ''.join(str(fields.get(k, '')) for k in TOKEN_FIELDS)
+    return hmac.new(CINETPAY_SECRET_KEY.encode(), data.encode(), hashlib.sha256).hexdigest()
+
+
+class PaymentFlowTester:
+    def __init__(self):
+        self.base_url = BACKEND_URL
+        self.session = requests.Session()
+        self.test_results = []
+        self.user_id: Optional[str] = None
+        self.access_token: Optional[str] = None
+        self.transaction_id: Optional[str] = None
+
+    def log_test(self, test_name: str, success: bool, details: str = ""):
+        """Log test result"""
+        status = "✅ PASS" if success else "❌ FAIL"
+        print(f"{status} {test_name}")
+        if details:
+            print(f"   Details: {details}")
+        self.test_results.append({'test': test_name, 'success': success, 'details': details})
+
+    def make_request(self, method: str, endpoint: str, auth: bool = False, **kwargs) -> requests.Response:
+        """Make HTTP request, with the payer's bearer token when `auth`"""
+        headers = kwargs.pop('headers', {})
+        if auth and self.access_token:
+            headers['Authorization'] = f"Bearer {self.access_token}"
+        return self.session.request(method, f"{self.base_url}{endpoint}", headers=headers, timeout=30, **kwargs)
+
+    def summary(self) -> Dict[str, Any]:
+        return self.make_request('GET', '/payments/summary', auth=True).json()
+
+    def test_register_user(self):
+        try:
+            phone = "+225 01 " + " ".join(f"{random.randint(0, 99):02d}" for _ in range(4))
+            response = self.make_request('POST', '/auth/register', json={
+                "first_name": "Koffi", "last_name": "Yao", "phone": phone, "preferred_lang": "fr", "city": "Abidjan",
+            })
+            data = response.json() if response.status_code == 200 else {}
+            self.user_id, self.access_token = data.get('id'), data.get('access_token')
+            self.log_test("Register payer", bool(self.user_id), f"Status {response.status_code}")
+        except Exception as e:
+            self.log_test("Register payer", False, f"Exception: {str(e)}")
+
+    def test_webhook_bad_signature(self):
+        """A notification that is not signed with the merchant secret is refused"""
+        try:
+            fields = notification("SUB_doesnotexist", 1200)
+            response = self.make_request('POST', '/payments/cinetpay/webhook', data=fields, headers={'x-token': 'forged'})
+            self.log_test("Webhook with bad x-token → 401", response.status_code == 401, f"Status {response.status_code}")
+        except Exception as e:
+            self.log_test("Webhook with bad x-token → 401", False, f"Exception: {str(e)}")
+
+    def test_initiate_and_activate(self):
+        """Initiate; the simulator's webhooks must make the user premium"""
+        if not self.user_id:
+            self.log_test("Payment activates premium", False, "No user")
+            return
+        try:
+            response = self.make_request('POST', '/payments/cinetpay/initiate', json={"user_id": self.user_id, "amount_fcfa": 1200})
+            if response.status_code != 200:
+                self.log_test("Initiate payment", False, f"Status {response.status_code}: {response.text}")
+                return
+            self.transaction_id = response.json()['transaction_id']
+            self.log_test("Initiate payment", True, f"Transaction {self.transaction_id}")
+            deadline = time.monotonic() + ACTIVATION_TIMEOUT_S
+            premium = False
+            while time.monotonic() < deadline and not premium:
+                check = self.make_request('GET', '/subscriptions/check', params={"user_id": self.user_id})
+                premium = check.status_code == 200 and check.json().get('is_premium') is True
+                if not premium:
+                    time.sleep(0.2)
+            self.log_test("Payment activates premium", premium, "" if premium else f"Not premium after {ACTIVATION_TIMEOUT_S:.0f}s")
+        except Exception as e:
+            self.log_test("Payment activates premium", False, f"Exception: {str(e)}")
+
+    def test_idempotent_notifications(self):
+        """Repeated simulator notifications and a replayed signed one count the payment once"""
+        if not self.transaction_id:
+            self.log_test("Payment counted once", False, "No transaction")
+            return
+        try:
+            time.sleep(2.0)  # let the simulator's repeated notifications land
+            fields = notification(self.transaction_id, 1200)
+            replay = self.make_request('POST', '/payments/cinetpay/webhook', data=fields, headers={'x-token': sign(fields)})
+            self.log_test("Replayed notification is a duplicate", replay.status_code == 200 and replay.json().get('duplicate') is True,
+                          f"Status {replay.status_code}: {replay.text}")
+            summary = self.summary()
+            self.log_test("Payment counted once", summary.get('payments_count') == 1 and summary.get('total_paid') == 1200,
+                          f"Summary: {summary}")
+        except Exception as e:
+            self.log_test("Payment counted once", False, f"Exception: {str(e)}")
+
+    def test_history_requires_owner(self):
+        """Payment history is only readable by its owner's session"""
+        try:
+            anonymous = self.make_request('GET', '/payments/history', params={"user_id": self.user_id})
+            foreign = self.make_request('GET', '/payments/summary', auth=True, params={"user_id": "0" * 24})
+            self.log_test("Payment history requires the owner's session", anonymous.status_code == 401 and foreign.status_code == 403,
+                          f"Without session: {anonymous.status_code}, other user_id: {foreign.status_code}")
+        except Exception as e:
+            self.log_test("Payment history requires the owner's session", False, f"Exception: {str(e)}")
+
+    def test_history(self):
+        if not self.transaction_id:
+            self.log_test("History lists the accepted payment", False, "No transaction")
+            return
+        try:
+            response = self.make_request('GET', '/payments/history', auth=True)
+            rows = response.json() if response.status_code == 200 else []
+            row = next((r for r in rows if r.get('transaction_id') == self.transaction_id), None)
+            self.log_test("History lists the accepted payment", bool(row) and row.get('status') == 'ACCEPTED', f"Row: {row}")
+        except Exception as e:
+            self.log_test("History lists the accepted payment", False, f"Exception: {str(e)}")
+
+    def run_all_tests(self):
+        print("💳 PAYMENT FLOW TESTS")
+        print(f"Base URL: {self.base_url}")
+        print("=" * 60)
+        self.test_register_user()
+        self.test_webhook_bad_signature()
+        self.test_initiate_and_activate()
+        self.test_idempotent_notifications()
+        self.test_history()
+        self.test_history_requires_owner()
+
+        passed = sum(1 for result in self.test_results if result['success'])
+        total = len(self.test_results)
+        print("\n" + "=" * 60)
+        print(f"Passed: {passed}/{total}")
+        for result in self.test_results:
+            if not result['success']:
+                print(f"  - {result['test']}: {result['details']}")
+        return passed == total
+
+
+if __name__ == "__main__":
+    tester = PaymentFlowTester()
+    success = tester.run_all_tests()
+    sys.exit(0 if success else 1)
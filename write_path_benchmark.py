@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Write-path benchmark for Allô Services CI
+Measures latency and MongoDB round trips per call for the mutation routes:
+1) POST /api/auth/register
+2) PATCH /api/users/<id>
+3) POST /api/alerts
+4) PATCH /api/alerts/<id>/read
+
+Mongo op counts come from the server-side command listener exposed on GET /api/metrics.
+Each route has a budget in OP_BUDGETS and the run fails when a route goes over it:
+- register: the user upsert, plus the refresh-token insert of the session it returns
+- PATCH /users: the user update, plus one push_tokens update when city or language
+  changes (push audiences are selected on the token documents)
+- the two alert routes: one command each
+A new mutation route gets a budget here along with its benchmark loop.
+
+Usage: BACKEND_URL=http://localhost:8001/api python write_path_benchmark.py [iterations]
+"""
+
+import os
+import sys
+import time
+import uuid
+import statistics
+import requests
+
+BACKEND_URL = os.environ.get("BACKEND_URL", "http://localhost:8001/api")
+ITERATIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+# most Mongo commands one call may cost
+OP_BUDGETS = {
+    "POST /auth/register": 2,
+    "PATCH /users/<id>": 2,
+    "POST /alerts": 1,
+    "PATCH /alerts/<id>/read": 1,
+}
+
+session = requests.Session()
+
+
+def mongo_ops() -> float:
+    return session.get(f"{BACKEND_URL}/metrics", timeout=10).json().get("mongo_ops_total", 0)
+
+
+def timed(method: str, path: str, **kwargs):
+    t0 = time.perf_counter()
+    r = session.request(method, f"{BACKEND_URL}{path}", timeout=10, **kwargs)
+    elapsed = (time.perf_counter() - t0) * 1000.0
+    r.raise_for_status()
+    return r.json(), elapsed
+
+
+def report(name: str, latencies, ops: float) -> bool:
+    """Prints the route's line; False when it costs more Mongo commands than its budget"""
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    per_call = ops / len(latencies)
+    within = per_call <= OP_BUDGETS[name]
+    print(f"{name:<28} p50={p50:7.2f}ms  p99={p99:7.2f}ms  mongo_ops/call={per_call:.2f}"
+          f" (budget {OP_BUDGETS[name]}){'' if within else '  ❌ OVER BUDGET'}")
+    return within
+
+
+def main():
+    print("⏱️  WRITE-PATH BENCHMARK")
+    print(f"Target: {BACKEND_URL}  iterations: {ITERATIONS}")
+    print("=" * 70)
+
+    user_ids, alert_ids = [], []
+    results = []
+
+    before, lat = mongo_ops(), []
+    for i in range(ITERATIONS):
+        body = {
+            "first_name": "Bench",
+            "last_name": f"User{i}",
+            "phone": f"+225 07 {uuid.uuid4().int % 10**8:08d}",
+            "preferred_lang": "fr",
+            "city": "Abidjan",
+        }
+        data, ms = timed("POST", "/auth/register", json=body)
+        user_ids.append(data["id"])
+        lat.append(ms)
+    results.append(report("POST /auth/register", lat, mongo_ops() - before))
+
+    before, lat = mongo_ops(), []
+    for uid in user_ids:
+        _, ms = timed("PATCH", f"/users/{uid}", json={"city": "Yamoussoukro"})
+        lat.append(ms)
+    results.append(report("PATCH /users/<id>", lat, mongo_ops() - before))
+
+    before, lat = mongo_ops(), []
+    for i in range(ITERATIONS):
+        body = {
+            "title": f"Bench alert {uuid.uuid4().hex}",
+            "type": "other",
+            "description": uuid.uuid4().hex * 3,
+            "city": "Abidjan",
+        }
+        data, ms = timed("POST", "/alerts", json=body)
+        alert_ids.append(data["id"])
+        lat.append(ms)
+    results.append(report("POST /alerts", lat, mongo_ops() - before))
+
+    before, lat = mongo_ops(), []
+    for aid, uid in zip(alert_ids, user_ids):
+        _, ms = timed("PATCH", f"/alerts/{aid}/read", json={"user_id": uid})
+        lat.append(ms)
+    results.append(report("PATCH /alerts/<id>/read", lat, mongo_ops() - before))
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)